@@ -0,0 +1,180 @@
+"""
+End-to-end throughput of gpt-gemini-llama.py and gpt-gemini-llama-COT.py
+against llm_fake_server.py, with no API spend. Each case copies the first
+--rows questions of a datasets/ CSV into a scratch directory (fresh response
+cache and journal), starts the runner as a subprocess through `nsp.py run` /
+`nsp.py run-cot` with every provider pointed at the fake server, and records:
+
+  - wall time and rows/s (process start to exit, imports included);
+  - call-span rows/s (first call sent to last reply, from the runner's metrics file);
+  - per-call latency p50/p95 and retries;
+  - the runner's peak RSS;
+  - the server's request and 429/503 counts.
+
+Models whose SDK is not installed are skipped.
+
+    python benchmarks/end_to_end.py --rows 200 --latency lognormal:0.3,0.5 --error-rate 429=0.05
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import importlib.util
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from llm_fake_server import serve, parse_latency, parse_route_options
+from llm_metrics import quantile
+from results import write_results
+
+SDKS = {"gpt": "openai", "gemini": "google.genai", "llama": "together"}
+ANSWER_COLS = {"run": "{}_answer", "run-cot": "{}_answer_COT"}
+QUESTION_COLS = ['story_id', 'story_length', 'context', 'context_length', 'distractor_distance',
+                 'distractor_length', 'option_A', 'option_B', 'label']
+DATASET = os.path.join(ROOT, 'datasets', 'NSP_QUESTIONS_WITH_ANSWERS_EN_1000_COT.csv')
+
+
+def installed_models(models):
+    """The models whose provider SDK can be imported."""
+    found = []
+    for model in models:
+        try:
+            available = importlib.util.find_spec(SDKS[model]) is not None
+        except ModuleNotFoundError:
+            available = False
+        if available:
+            found.append(model)
+        else:
+            print(f"⚠️ {SDKS[model]} is not installed: skipping {model}")
+    return found
+
+
+def question_csv(source, rows, path):
+    """Write the first `rows` questions of `source` (no answer columns) to `path`."""
+    import pandas as pd
+    pd.read_csv(source, usecols=QUESTION_COLS, nrows=rows).to_csv(path, index=False)
+
+
+def run_runner(command, csv_path, models, env, log_path):
+    """Run `nsp.py <command>` on `csv_path`; returns (exit code, wall seconds, peak RSS in MiB)."""
+    with open(log_path, 'w', encoding='utf-8') as log:
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'nsp.py'), command, csv_path,
+                                 '--models', *models],
+                                cwd=os.path.dirname(csv_path), env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - started
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    rss = usage.ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+    return proc.returncode, wall, rss
+
+
+def call_stats(directory):
+    """Latency quantiles, retries and call span from the runner's metrics file(s)."""
+    calls = []
+    for name in os.listdir(directory):
+        if '.metrics.' in name and name.endswith('.jsonl'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                calls.extend(json.loads(line) for line in f if line.strip())
+    done = [c for c in calls if c.get('latency') is not None]
+    if not done:
+        return {'calls': len(calls)}
+    span = max(c['started'] + c['queue_wait'] + c['latency'] for c in done) - min(c['started'] for c in done)
+    latencies = [c['latency'] for c in done]
+    return {'calls': len(calls), 'retries': sum(c['retries'] for c in calls),
+            'latency_p50': quantile(latencies, 0.5), 'latency_p95': quantile(latencies, 0.95),
+            'call_span_seconds': span}
+
+
+def answered(csv_path, command, models):
+    """Rows with an A/B answer, per model."""
+    import pandas as pd
+    df = pd.read_csv(csv_path)
+    counts = {}
+    for model in models:
+        col = ANSWER_COLS[command].format(model)
+        counts[model] = int(df[col].isin(['A', 'B']).sum()) if col in df.columns else 0
+    return counts
+
+
+def run_case(server, command, models, rows, keep=False):
+    scratch = tempfile.mkdtemp(prefix='nsp-e2e-')
+    csv_path = os.path.join(scratch, 'questions.csv')
+    question_csv(DATASET, rows, csv_path)
+    base = f"http://127.0.0.1:{server.server_port}"
+    env = dict(os.environ, OPENAI_API_KEY='offline', GEMINI_API_KEY='offline', TOGETHER_API_KEY='offline',
+               OPENAI_BASE_URL=f"{base}/v1", TOGETHER_BASE_URL=f"{base}/together/v1",
+               NSP_GEMINI_BASE_URL=base)
+    env.pop('NSP_BATCH_BASE_URL', None)
+
+    with server.state.lock:
+        before = {route: dict(counts) for route, counts in server.state.stats.items()}
+    code, wall, rss = run_runner(command, csv_path, models, env, os.path.join(scratch, 'runner.log'))
+    with server.state.lock:
+        served = {route: {k: v - before[route].get(k, 0) for k, v in counts.items()}
+                  for route, counts in server.state.stats.items() if counts != before[route]}
+
+    stats = call_stats(scratch)
+    counts = answered(csv_path, command, models)
+    span = stats.get('call_span_seconds')
+    record = {
+        'name': f"{command}[{'+'.join(models)}]", 'command': command, 'models': models,
+        'exit_code': code, 'items': rows, 'unit': 'rows', 'answered': counts,
+        'seconds': wall, 'per_second': rows / wall,
+        'call_span_per_second': rows / span if span else None,
+        'peak_mib': rss, 'server': served, **stats,
+    }
+    if code != 0 or min(counts.values(), default=0) < rows:
+        print(f"⚠️ {record['name']}: exit code {code}, answered {counts} of {rows}; "
+              f"see {os.path.join(scratch, 'runner.log')}")
+        keep = True
+    if not keep:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return record
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="End-to-end runner throughput against the fake LLM server.")
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--commands", nargs="+", choices=list(ANSWER_COLS), default=list(ANSWER_COLS))
+    parser.add_argument("--models", nargs="+", choices=list(SDKS), default=list(SDKS))
+    parser.add_argument("--latency", action="append", metavar="[ROUTE=]SPEC",
+                        help="Fake server latency, e.g. lognormal:0.3,0.5 (default: fixed:0.05)")
+    parser.add_argument("--error-rate", action="append", metavar="STATUS=RATE", help="e.g. 429=0.05")
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep each case's scratch directory")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/end_to_end-<time>.json)")
+    args = parser.parse_args()
+
+    models = installed_models(args.models)
+    if not models:
+        print("❌ No provider SDK is installed.")
+        sys.exit(1)
+    latency_specs = args.latency or ["fixed:0.05"]
+    error_rates = {int(status): float(rate) for status, _, rate in
+                   (item.partition("=") for item in args.error_rate or [])}
+    server = serve(port=0, latency=parse_route_options(latency_specs, parse_latency),
+                   error_rates=error_rates, chunk_delay=args.chunk_delay, seed=args.seed)
+
+    records = []
+    for command in args.commands:
+        record = run_case(server, command, models, args.rows, args.keep)
+        records.append(record)
+        span_rate = record['call_span_per_second']
+        print(f"🚀 {record['name']:<28}{record['seconds']:>8.2f} s{record['per_second']:>9.1f} rows/s"
+              f"{span_rate or float('nan'):>9.1f} rows/s in calls"
+              f"  p50 {record.get('latency_p50') or float('nan'):.3f}s"
+              f"  {record.get('retries', 0)} retries{record['peak_mib']:>8.1f} MiB RSS")
+    server.shutdown()
+    config = {'rows': args.rows, 'models': models, 'latency': latency_specs,
+              'error_rates': error_rates, 'chunk_delay': args.chunk_delay, 'seed': args.seed}
+    path = write_results('end_to_end', records, config, args.output)
+    print(f"💾 Results saved to {path}")
@@ -0,0 +1,140 @@
+"""
+Micro-benchmarks of the pipeline's hot functions on the datasets/ corpora:
+split_sentences and generate_nsp_items (generate-nsp.py) over the txt-*
+stories, extract_answer_and_reasoning (gpt-gemini-llama-COT.py) over the
+stored CoT reasoning, and validate_and_score (evaluation-metrics.py) over
+the answered question sets. Each case reports the best of REPEATS timings
+and, from a separate traced run, the peak Python allocation (tracemalloc).
+
+    python benchmarks/micro.py
+    python benchmarks/micro.py --langs HA --only generate_nsp_items --repeats 3
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from nsp import load_script
+from nsp_segment import segment_story
+from results import write_results
+
+LANGS = ('EN', 'SW', 'HA')
+REPEATS = 5
+
+
+def corpus_path(lang):
+    return os.path.join(ROOT, 'datasets', f'txt-{lang.lower()}', 'all_books.txt')
+
+
+def dataset_path(lang):
+    return os.path.join(ROOT, 'datasets', f'NSP_QUESTIONS_WITH_ANSWERS_{lang}_1000_COT.csv')
+
+
+def best_of(fn, repeats):
+    """Fastest of `repeats` runs of fn(), in seconds, and fn's last return value."""
+    best, result = float('inf'), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def peak_mib(fn):
+    """Peak traced allocation of one run of fn(), in MiB."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def bench_split_sentences(lang):
+    gen = load_script('generate-nsp.py')
+    stories = gen.load_stories(corpus_path(lang))
+    return lambda: sum(len(gen.split_sentences(story)) for story in stories), 'sentences'
+
+
+def bench_generate_nsp_items(lang):
+    gen = load_script('generate-nsp.py')
+    stories = [segment_story(story) for story in gen.load_stories(corpus_path(lang))]
+
+    def run():
+        count = 0
+        for story_id, seg in enumerate(stories):
+            for _ in gen.generate_nsp_items(seg, story_id, len(seg), rng=gen.story_rng(gen.SEED, story_id)):
+                count += 1
+        return count
+    return run, 'questions'
+
+
+def bench_extract_answer_and_reasoning(lang):
+    import pandas as pd
+    cot = load_script('gpt-gemini-llama-COT.py')
+    from llm_reasoning import REASONING_COLS
+    # Replies as the models sent them: the stored reasoning, then the answer line
+    df = pd.read_csv(dataset_path(lang), usecols=[text_col for text_col, _ in REASONING_COLS.values()])
+    texts = [text for col in df.columns for text in df[col].dropna()]
+    replies = [f"{text}\n{'AB'[n % 2]}" for n, text in enumerate(texts)]
+    return lambda: sum(1 for reply in replies if cot.extract_answer_and_reasoning(reply)), 'replies'
+
+
+def bench_validate_and_score(lang):
+    metrics = load_script('evaluation-metrics.py')
+    csv_path = dataset_path(lang)
+    scratch = tempfile.mkdtemp(prefix='nsp-bench-')
+
+    def run():
+        # Quietly, and with wrong_answers.csv written to a scratch directory
+        with contextlib.chdir(scratch), contextlib.redirect_stdout(io.StringIO()):
+            results = metrics.validate_and_score(csv_path)
+        return int(results['summary']['n'].sum())
+    return run, 'answers'
+
+
+BENCHMARKS = {
+    'split_sentences': bench_split_sentences,
+    'generate_nsp_items': bench_generate_nsp_items,
+    'extract_answer_and_reasoning': bench_extract_answer_and_reasoning,
+    'validate_and_score': bench_validate_and_score,
+}
+
+
+def run_benchmarks(names=tuple(BENCHMARKS), langs=LANGS, repeats=REPEATS):
+    records = []
+    for name in names:
+        for lang in langs:
+            fn, unit = BENCHMARKS[name](lang)
+            fn()  # warm-up: imports, caches, page cache
+            seconds, items = best_of(fn, repeats)
+            record = {
+                'name': f"{name}[{lang}]", 'benchmark': name, 'lang': lang,
+                'items': items, 'unit': unit, 'seconds': seconds,
+                'per_second': items / seconds if seconds else float('inf'),
+                'peak_mib': peak_mib(fn),
+            }
+            records.append(record)
+            print(f"⏱️ {record['name']:<36}{seconds * 1000:>10.1f} ms{record['per_second']:>14,.0f} {unit}/s"
+                  f"{record['peak_mib']:>10.2f} MiB")
+    return records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the NSP pipeline functions.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--langs", nargs="+", choices=LANGS, default=list(LANGS))
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/micro-<time>.json)")
+    args = parser.parse_args()
+    records = run_benchmarks(args.only, args.langs, args.repeats)
+    path = write_results('micro', records, {'repeats': args.repeats, 'langs': args.langs}, args.output)
+    print(f"💾 Results saved to {path}")
@@ -0,0 +1,81 @@
+"""
+Benchmark results as JSON, so runs can be compared across commits and machines.
+
+Each suite writes benchmarks/results/<suite>-<timestamp>.json holding the
+environment (commit, Python, platform, CPUs) and one record per case, keyed
+by its `name`. Compare two files (throughput and peak memory per case):
+
+    python benchmarks/results.py benchmarks/results/micro-A.json benchmarks/results/micro-B.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def environment():
+    """Where and on what the benchmark ran."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        'commit': commit, 'dirty': dirty,
+        'python': platform.python_version(), 'platform': platform.platform(),
+        'machine': platform.machine(), 'cpus': os.cpu_count(),
+    }
+
+
+def write_results(suite, records, config=None, path=None):
+    """Write one run of `suite` and return the file path."""
+    created = time.strftime('%Y%m%d-%H%M%S')
+    path = path or os.path.join(RESULTS_DIR, f"{suite}-{created}.json")
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'suite': suite, 'created': created, 'environment': environment(),
+                   'config': config or {}, 'results': records}, f, indent=2)
+    return path
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(old, new):
+    """Print per_second and peak_mib of every case in both runs, with the new/old ratio."""
+    before = {r['name']: r for r in old['results']}
+    print(f"📏 {old['environment'].get('commit')} ({old['created']}) → "
+          f"{new['environment'].get('commit')} ({new['created']})")
+    print(f"{'case':<44}{'old /s':>12}{'new /s':>12}{'ratio':>8}{'old MiB':>10}{'new MiB':>10}")
+    for record in new['results']:
+        previous = before.get(record['name'])
+        if previous is None:
+            print(f"{record['name']:<44}{'—':>12}{record['per_second']:>12.1f}")
+            continue
+        ratio = record['per_second'] / previous['per_second'] if previous['per_second'] else float('nan')
+        flag = "🟢" if ratio >= 1.05 else "🔴" if ratio <= 0.95 else "  "
+        print(f"{record['name']:<44}{previous['per_second']:>12.1f}{record['per_second']:>12.1f}"
+              f"{ratio:>7.2f}×{previous.get('peak_mib', float('nan')):>10.2f}"
+              f"{record.get('peak_mib', float('nan')):>10.2f} {flag}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    args = parser.parse_args()
+    for path in (args.old, args.new):
+        if not os.path.exists(path):
+            print(f"❌ Error: File '{path}' not found.")
+            sys.exit(1)
+    compare(load_results(args.old), load_results(args.new))
@@ -0,0 +1,102 @@
+"""
+Compare split_sentences + clean_text from generate-nsp.py against the
+single-pass segmenter in nsp_segment.py on the datasets/txt-* corpora.
+
+Segmenting alone is not faster: segment_story also records offsets and word
+counts, so "segment + clean" runs at roughly 0.5-0.9x the old functions. The
+gain (several times faster) is in "all windows", where every NSP window
+slices the segmented story instead of re-cleaning its sentences.
+
+    python benchmarks/segmentation.py
+"""
+import os
+import sys
+import time
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from nsp_segment import segment_story
+
+CORPORA = {
+    'EN': os.path.join(ROOT, 'datasets', 'txt-en', 'all_books.txt'),
+    'SW': os.path.join(ROOT, 'datasets', 'txt-sw', 'all_books.txt'),
+    'HA': os.path.join(ROOT, 'datasets', 'txt-ha', 'all_books.txt'),
+}
+REPEATS = 5
+
+
+def load_script(filename):
+    """Import one of the repo's hyphenated scripts as a module."""
+    spec = importlib.util.spec_from_file_location(filename.replace('-', '_')[:-3],
+                                                  os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+gen = load_script('generate-nsp.py')
+CONTEXTS = range(gen.MIN_CONTEXT, gen.MAX_CONTEXT + 1)
+
+
+def windows(n):
+    for ctx in CONTEXTS:
+        for i in range(0, n - ctx - gen.MIN_DIST):
+            yield i, ctx
+
+
+def old_pipeline(stories):
+    # What generate_nsp_items used to do: split, then clean every window
+    for story in stories:
+        sents = gen.split_sentences(story)
+        for i, ctx in windows(len(sents)):
+            gen.clean_text(' '.join(sents[i:i + ctx]))
+            gen.clean_text(sents[i + ctx])
+
+
+def new_pipeline(stories, lang=None):
+    for story in stories:
+        seg = segment_story(story, lang)
+        for i, ctx in windows(len(seg)):
+            seg.span(i, i + ctx)
+            seg.sentences[i + ctx]
+
+
+def old_segment(stories):
+    for story in stories:
+        [gen.clean_text(s) for s in gen.split_sentences(story)]
+
+
+def new_segment(stories, lang=None):
+    for story in stories:
+        segment_story(story, lang)
+
+
+def best_of(fn, *args):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == '__main__':
+    print(f"{'lang':<5}{'case':<28}{'old ms':>10}{'new ms':>10}{'speedup':>9}")
+    for lang, path in CORPORA.items():
+        stories = gen.load_stories(path)
+        cases = [
+            ('segment + clean', old_segment, new_segment, ()),
+            ('segment + clean (abbrev)', old_segment, new_segment, (lang,)),
+            ('all windows', old_pipeline, new_pipeline, ()),
+            ('all windows (abbrev)', old_pipeline, new_pipeline, (lang,)),
+        ]
+        for name, old_fn, new_fn, extra in cases:
+            old_ms = best_of(old_fn, stories)
+            new_ms = best_of(new_fn, stories, *extra)
+            print(f"{lang:<5}{name:<28}{old_ms:>10.1f}{new_ms:>10.1f}{old_ms / new_ms:>8.1f}×")
+
+        plain = sum(len(segment_story(s)) for s in stories)
+        aware = sum(len(segment_story(s, lang)) for s in stories)
+        print(f"{lang:<5}sentences: {plain} plain, {aware} abbreviation-aware\n")
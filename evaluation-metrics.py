@@ -1,138 +1,357 @@
-import pandas as pd
+import os
+import re
 import sys
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from nsp_columns import FEATURES, ANSWER_COL, load_columns, read_header
+
+# Scoring engine for the NSP runs. Every answer column of every CSV is scored
+# in one pass over a long (row × answer column) table: invalid answers are
+# their own category instead of an error, accuracy is broken down by the
+# question features with grouped pandas ops, confidence intervals come from a
+# vectorized bootstrap, and CoT is compared to the plain prompt per model with
+# a paired (McNemar) test.
+
+LANG_IN_NAME = re.compile(r"_(EN|SW|HA)(?:_|\.|$)", re.IGNORECASE)
+# Features sample_csv stratifies on; story_length is bucketed at about its quartiles
+SAMPLE_STRATA = ('context_length', 'distractor_distance', 'story_length')
+SAMPLE_BINS = {'story_length': [25, 40, 55]}
+
+
+def stratum_keys(chunk, strata, bins):
+    """One integer key per row combining the (binned) values of the `strata` columns."""
+    key = np.zeros(len(chunk), dtype=np.int64)
+    for col in strata:
+        values = chunk[col].to_numpy()
+        if col in bins:
+            values = np.digitize(values, bins[col])
+        # Feature values are small non-negative integers; 1024 slots per column
+        key = key * 1024 + np.clip(values.astype(np.int64), 0, 1023)
+    return key
+
 
+def stratum_quotas(sizes, n, min_per_stratum=1):
+    """
+    Rows to draw from each stratum: `min_per_stratum` from every stratum
+    first (so rare cells are never left out), the rest proportionally to
+    stratum size by largest remainder.
+    """
+    sizes = pd.Series(sizes, dtype=np.int64)
+    n = min(n, int(sizes.sum()))
+    quotas = np.minimum(sizes, min_per_stratum)
+    if quotas.sum() > n:
+        quotas[:] = 0  # more strata than rows to draw: proportional only
+    spare = sizes - quotas
+    remaining = n - int(quotas.sum())
+    if remaining and spare.sum():
+        share = spare * (remaining / spare.sum())
+        extra = np.floor(share).astype(np.int64)
+        order = (share - extra).sort_values(ascending=False, kind='stable').index
+        extra[order[:remaining - int(extra.sum())]] += 1
+        quotas += np.minimum(extra, spare)
+    return quotas
 
-def sample_csv(input_file, output_file, n=1000):
+
+def sample_csv(input_file, output_file, n=1000, strata=SAMPLE_STRATA, bins=SAMPLE_BINS,
+               weight_col=None, seed=42, chunksize=100_000, min_per_stratum=1):
+    """
+    Draw a stratified sample of `n` rows from a CSV of any size, in two
+    chunked passes: the first counts rows per stratum reading only the
+    `strata` columns, the second keeps a weighted reservoir per stratum
+    (Efraimidis–Spirakis keys, weights from `weight_col` or uniform).
+    Memory depends on `n` and `chunksize`, not on the file size; the
+    sample is reproducible for a given `seed` and written in a seeded
+    random order, so any prefix of it is a random subsample too.
+    """
     try:
-        df = pd.read_csv(input_file)
+        header = pd.read_csv(input_file, nrows=0).columns
     except FileNotFoundError:
         print(f"❌ Error: File '{input_file}' not found.")
         sys.exit(1)
+    strata = [c for c in strata if c in header]
+
+    # Pass 1: stratum sizes
+    sizes = {}
+    for chunk in pd.read_csv(input_file, usecols=strata, chunksize=chunksize):
+        keys, counts = np.unique(stratum_keys(chunk, strata, bins), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            sizes[key] = sizes.get(key, 0) + count
+    quotas = stratum_quotas(sizes, n, min_per_stratum)
+
+    # Pass 2: per-stratum reservoirs of the rows with the largest keys
+    rng = np.random.default_rng(seed)
+    reservoir = None
+    position = 0
+    for chunk in pd.read_csv(input_file, chunksize=chunksize):
+        weights = chunk[weight_col].to_numpy(dtype=float) if weight_col else 1.0
+        chunk = chunk.assign(
+            _stratum=stratum_keys(chunk, strata, bins),
+            # log(u) / w ranks like u ** (1 / w) without underflow
+            _key=np.log(rng.random(len(chunk))) / weights,
+            _position=np.arange(position, position + len(chunk)),
+        )
+        position += len(chunk)
+        pool = chunk if reservoir is None else pd.concat([reservoir, chunk], ignore_index=True)
+        pool = pool.sort_values('_key', ascending=False, kind='stable')
+        rank = pool.groupby('_stratum').cumcount().to_numpy()
+        reservoir = pool[rank < quotas.reindex(pool['_stratum']).to_numpy()]
 
-    sample_size = min(n, len(df))
-    sample_df = df.sample(n=sample_size, random_state=42)
+    # Shuffled rather than in file order (story order), so a run stopped early
+    # by llm_live.py has answered a random part of the sample
+    sample_df = reservoir.iloc[rng.permutation(len(reservoir))].drop(columns=['_stratum', '_key', '_position'])
     sample_df.to_csv(output_file, index=False)
-    print(f"✅ Sampled {sample_size} rows and saved to '{output_file}'")
+    print(f"✅ Sampled {len(sample_df)} of {position} rows from {len(sizes)} strata "
+          f"({', '.join(strata)}) and saved to '{output_file}'")
 
-def validate_and_score(csv_path):
-    global df  # make it accessible to the new function
-    # Load CSV
-    df = pd.read_csv(csv_path)
 
-    # Required columns
-    required_cols = ['label', 'gpt_answer', 'gemini_answer', 'llama_answer']
+def language_of(csv_path):
+    """EN / SW / HA from the file name, or the file name itself."""
+    match = LANG_IN_NAME.search(os.path.basename(csv_path))
+    return match.group(1).upper() if match else os.path.splitext(os.path.basename(csv_path))[0]
 
-    # Strip whitespace and normalize answers
-    for col in required_cols:
-        if df[col].isnull().any():
-            bad_rows = df[df[col].isnull()].index.tolist()
-            print(f"❌ Error: Column '{col}' has missing values at rows: {bad_rows}")
-            sys.exit(1)
 
-        df[col] = df[col].astype(str).str.strip().str.upper()
+def load_answers(csv_path, answer_cols=None):
+    """
+    Load only the label, feature and answer columns of a results CSV from
+    its column cache (reasoning and text columns are never read). `answer_cols` defaults
+    to every `*_answer` / `*_answer_COT` column in the file.
+    """
+    header = read_header(csv_path)
+    if answer_cols is None:
+        answer_cols = [c for c in header if ANSWER_COL.match(c)]
+    answer_cols = [c for c in answer_cols if c in header]
+    features = [c for c in FEATURES if c in header]
+    df = load_columns(csv_path, ['label'] + features + answer_cols)
+    for col in ['label'] + answer_cols:
+        df[col] = df[col].astype(object)  # all-empty answer columns are parsed as float
+    return df, answer_cols, features
 
-        # Check for invalid entries
-        invalid_mask = ~df[col].isin(['A', 'B'])
-        if invalid_mask.any():
-            bad_rows = df[invalid_mask][[col]].reset_index()
-            for _, row in bad_rows.iterrows():
-                print(f"❌ Error: Invalid value '{row[col]}' in column '{col}' at row {row['index']}")
-            sys.exit(1)
 
-    print("✅ All answers are valid.\n")
+def normalize_answers(values):
+    """Upper-cased, stripped answers; anything but A/B becomes 'INVALID'."""
+    cleaned = values.fillna('').astype(str).str.strip().str.upper()
+    return cleaned.where(cleaned.isin(['A', 'B']), 'INVALID')
 
-    # Calculate accuracy and track wrong answers
-    global wrong_rows_by_model
-    wrong_rows_by_model = {}
 
-    print("\n📊 Accuracy:")
-    for model in ['gpt_answer', 'gemini_answer', 'llama_answer']:
-        correct = (df[model] == df['label'])
-        total = len(df)
-        accuracy = correct.sum() / total * 100
-        print(f"{model}: {accuracy:.2f}% ({correct.sum()}/{total})")
-
-        wrong = df[~correct].copy()
-        wrong["wrong_model"] = model
-        wrong_rows_by_model[model] = wrong
-
-    # Combine all wrong rows and save to CSV
-    if wrong_rows_by_model:
-        all_wrong = pd.concat(wrong_rows_by_model.values(), ignore_index=True)
-        all_wrong.to_csv("wrong_answers.csv", index=False)
-        print(f"\n📁 Saved all incorrect answers to 'wrong_answers.csv' ({len(all_wrong)} rows).")
-def validate_and_score_COT(csv_path):
-    global df  # make it accessible to the new function
-    # Load CSV
-    df = pd.read_csv(csv_path)
+def bootstrap_means(correct, n_boot=2000, seed=0, chunk=100):
+    """
+    Bootstrap replicate means of every column of the n×k 0/1 matrix
+    `correct`, returned as an n_boot×k array. All columns share the same
+    resampled rows, so differences between columns are paired.
+    """
+    rng = np.random.default_rng(seed)
+    n = correct.shape[0]
+    means = np.empty((n_boot, correct.shape[1]))
+    for start in range(0, n_boot, chunk):
+        size = min(chunk, n_boot - start)
+        idx = rng.integers(0, n, size=(size, n))
+        means[start:start + size] = correct[idx].mean(axis=1)
+    return means
+
+
+def mcnemar_exact(b, c):
+    """Two-sided exact McNemar p-value from the discordant counts b and c."""
+    n = b + c
+    if n == 0:
+        return 1.0
+    k = min(b, c)
+    # log P(X = i) for X ~ Binomial(n, 1/2), summed in log space
+    log_pmf = [math.lgamma(n + 1) - math.lgamma(i + 1) - math.lgamma(n - i + 1) - n * math.log(2)
+               for i in range(k + 1)]
+    top = max(log_pmf)
+    tail = math.exp(top) * sum(math.exp(v - top) for v in log_pmf)
+    return min(1.0, 2 * tail)
+
 
-    # Required columns
-    required_cols = ['label', 'gpt_answer_COT', 'gemini_answer_COT', 'llama_answer_COT']
+def score_files(csv_paths, answer_cols=None, n_boot=2000, seed=0, confidence=0.95):
+    """
+    Score every answer column of every CSV in one pass.
 
-    # Strip whitespace and normalize answers
-    for col in required_cols:
-        if df[col].isnull().any():
-            bad_rows = df[df[col].isnull()].index.tolist()
-            print(f"❌ Error: Column '{col}' has missing values at rows: {bad_rows}")
-            sys.exit(1)
+    Returns a dict of DataFrames:
+      - 'summary': accuracy, invalid count and bootstrap CI per
+        (language, model, prompting);
+      - 'by_feature': accuracy and invalid rate per feature value;
+      - 'paired': CoT minus plain accuracy per (language, model), with a
+        paired bootstrap CI and an exact McNemar p-value;
+      - 'long': the row-level table (file, language, row, model, prompting,
+        answer, correct, features) for further analysis; `file` is the
+        position of the row's CSV in `csv_paths`.
+    """
+    alpha = (1 - confidence) / 2
+    long_parts, summary, paired = [], [], []
 
-        df[col] = df[col].astype(str).str.strip().str.upper()
+    for file_index, path in enumerate(csv_paths):
+        df, cols, features = load_answers(path, answer_cols)
+        if not cols:
+            continue
+        lang = language_of(path)
+        label = df['label'].fillna('').str.strip().str.upper()
+        answers = pd.DataFrame({c: normalize_answers(df[c]) for c in cols})
+        correct = answers.eq(label, axis=0).to_numpy(dtype=np.uint8)
+        invalid = answers.eq('INVALID').to_numpy()
 
-        # Check for invalid entries
-        invalid_mask = ~df[col].isin(['A', 'B'])
-        if invalid_mask.any():
-            bad_rows = df[invalid_mask][[col]].reset_index()
-            for _, row in bad_rows.iterrows():
-                print(f"❌ Error: Invalid value '{row[col]}' in column '{col}' at row {row['index']}")
-            sys.exit(1)
+        boot = bootstrap_means(correct, n_boot, seed)
+        low, high = np.quantile(boot, [alpha, 1 - alpha], axis=0)
+        specs = [ANSWER_COL.match(c) for c in cols]
+        for j, (col, spec) in enumerate(zip(cols, specs)):
+            summary.append({
+                'language': lang, 'model': spec['model'], 'prompting': 'cot' if spec['cot'] else 'plain',
+                'column': col, 'n': len(df), 'correct': int(correct[:, j].sum()),
+                'invalid': int(invalid[:, j].sum()), 'accuracy': correct[:, j].mean(),
+                'ci_low': low[j], 'ci_high': high[j],
+            })
 
-    print("✅ All answers are valid.\n")
+        # Paired CoT vs plain comparison on the same questions
+        position = {c: j for j, c in enumerate(cols)}
+        for col, spec in zip(cols, specs):
+            cot_col = f"{spec['model']}_answer_COT"
+            if spec['cot'] or cot_col not in position:
+                continue
+            plain, cot = correct[:, position[col]], correct[:, position[cot_col]]
+            diff = boot[:, position[cot_col]] - boot[:, position[col]]
+            b = int(((plain == 1) & (cot == 0)).sum())
+            c = int(((plain == 0) & (cot == 1)).sum())
+            paired.append({
+                'language': lang, 'model': spec['model'], 'plain': plain.mean(), 'cot': cot.mean(),
+                'diff': cot.mean() - plain.mean(),
+                'ci_low': np.quantile(diff, alpha), 'ci_high': np.quantile(diff, 1 - alpha),
+                'plain_only': b, 'cot_only': c, 'p_value': mcnemar_exact(b, c),
+            })
 
-    # Calculate accuracy and track wrong answers
-    global wrong_rows_by_model
-    wrong_rows_by_model = {}
+        # Long format: one row per (question, answer column)
+        k = len(cols)
+        long = pd.DataFrame({
+            'file': file_index,
+            'language': lang,
+            'row': np.repeat(np.arange(len(df)), k),
+            'model': np.tile([s['model'] for s in specs], len(df)),
+            'prompting': np.tile(['cot' if s['cot'] else 'plain' for s in specs], len(df)),
+            'answer': answers.to_numpy().ravel(),
+            'correct': correct.ravel(),
+            'invalid': invalid.ravel(),
+        })
+        for feature in features:
+            long[feature] = np.repeat(df[feature].to_numpy(), k)
+        long_parts.append(long)
 
+    long = pd.concat(long_parts, ignore_index=True) if long_parts else pd.DataFrame()
+    keys = ['language', 'model', 'prompting']
+    by_feature = []
+    for feature in FEATURES:
+        if feature not in long.columns:
+            continue
+        grouped = long.groupby(keys + [feature], sort=True).agg(
+            n=('correct', 'size'), accuracy=('correct', 'mean'), invalid_rate=('invalid', 'mean'),
+        ).reset_index().rename(columns={feature: 'value'})
+        grouped['wrong'] = (grouped['n'] * (1 - grouped['accuracy'])).round().astype(int)
+        grouped.insert(len(keys), 'feature', feature)
+        by_feature.append(grouped)
+
+    return {
+        'summary': pd.DataFrame(summary),
+        'by_feature': pd.concat(by_feature, ignore_index=True) if by_feature else pd.DataFrame(),
+        'paired': pd.DataFrame(paired),
+        'long': long,
+    }
+
+
+def print_report(results, features=('distractor_distance',)):
+    """Print accuracy with CIs, CoT vs plain comparisons, and breakdowns for `features`."""
+    summary = results['summary']
+    if summary.empty:
+        print("❌ No answer columns found.")
+        return
     print("\n📊 Accuracy:")
-    for model in ['gpt_answer_COT', 'gemini_answer_COT', 'llama_answer_COT']:
-        correct = (df[model] == df['label'])
-        total = len(df)
-        accuracy = correct.sum() / total * 100
-        print(f"{model}: {accuracy:.2f}% ({correct.sum()}/{total})")
-
-        wrong = df[~correct].copy()
-        wrong["wrong_model"] = model
-        wrong_rows_by_model[model] = wrong
-
-    # Combine all wrong rows and save to CSV
-    if wrong_rows_by_model:
-        all_wrong = pd.concat(wrong_rows_by_model.values(), ignore_index=True)
-        all_wrong.to_csv("wrong_answers.csv", index=False)
-        print(f"\n📁 Saved all incorrect answers to 'wrong_answers.csv' ({len(all_wrong)} rows).")
-
-def print_distractor_length_distribution_by_model():
+    for _, r in summary.iterrows():
+        invalid = f", {r['invalid']} invalid" if r['invalid'] else ""
+        print(f"  {r['language']:<3} {r['column']:<20} {r['accuracy']:.2%} "
+              f"[{r['ci_low']:.2%}, {r['ci_high']:.2%}] ({r['correct']}/{r['n']}{invalid})")
+
+    if not results['paired'].empty:
+        print("\n🔬 CoT vs plain (paired):")
+        for _, r in results['paired'].iterrows():
+            flag = "✅" if r['p_value'] < 0.05 else "➖"
+            print(f"  {flag} {r['language']:<3} {r['model']:<7} {r['plain']:.2%} → {r['cot']:.2%} "
+                  f"({r['diff']:+.2%} [{r['ci_low']:+.2%}, {r['ci_high']:+.2%}], "
+                  f"McNemar p={r['p_value']:.3g}, {r['plain_only']}/{r['cot_only']} discordant)")
+
+    by_feature = results['by_feature']
+    for feature in features:
+        table = by_feature[by_feature['feature'] == feature] if not by_feature.empty else by_feature
+        if table.empty:
+            continue
+        print(f"\n📐 Accuracy by {feature}:")
+        pivot = table.pivot_table(index='value', columns=['language', 'model', 'prompting'],
+                                  values='accuracy')
+        print((pivot * 100).round(1).to_string())
+
+
+def save_wrong_answers(results, csv_paths, output_csv="wrong_answers.csv", prompting=None):
+    """
+    Write every wrong (or invalid) answer with its full question row to
+    `output_csv`. `csv_paths` is the list the results were scored from.
+    """
+    long = results['long']
+    wrong = long[long['correct'] == 0]
+    if prompting is not None:
+        wrong = wrong[wrong['prompting'] == prompting]
+    parts = []
+    for file_index, path in enumerate(csv_paths):
+        lang = language_of(path)
+        rows = wrong[wrong['file'] == file_index]
+        if rows.empty:
+            continue
+        df = load_columns(path)
+        part = df.iloc[rows['row'].to_numpy()].reset_index(drop=True)
+        part['language'] = lang
+        part['wrong_model'] = [f"{m}_answer{'_COT' if p == 'cot' else ''}"
+                               for m, p in zip(rows['model'], rows['prompting'])]
+        parts.append(part)
+    if parts:
+        all_wrong = pd.concat(parts, ignore_index=True)
+        all_wrong.to_csv(output_csv, index=False)
+        print(f"\n📁 Saved all incorrect answers to '{output_csv}' ({len(all_wrong)} rows).")
+
+
+def validate_and_score(csv_path):
+    """Score the plain-prompt answer columns of one CSV (see score_files)."""
+    cols = ['gpt_answer', 'gemini_answer', 'llama_answer']
+    results = score_files([csv_path], cols)
+    print_report(results, features=())
+    save_wrong_answers(results, [csv_path])
+    return results
+
+
+def validate_and_score_COT(csv_path):
+    """Score the CoT answer columns of one CSV (see score_files)."""
+    cols = ['gpt_answer_COT', 'gemini_answer_COT', 'llama_answer_COT']
+    results = score_files([csv_path], cols)
+    print_report(results, features=())
+    save_wrong_answers(results, [csv_path])
+    return results
+
+
+def print_distractor_length_distribution_by_model(results):
     print("\n📊 Distractor Length Distribution (for wrong answers only):")
-    for model, df_wrong in wrong_rows_by_model.items():
-        print(f"\n🔍 {model} — wrong predictions by distractor_length:")
-        counts = df_wrong['distractor_distance'].value_counts().sort_index()
-        for length, count in counts.items():
-            print(f"  Length {length}: {count}")
+    table = results['by_feature']
+    table = table[table['feature'] == 'distractor_distance']
+    for (lang, model, prompting), rows in table.groupby(['language', 'model', 'prompting']):
+        print(f"\n🔍 {lang} {model} ({prompting}) — wrong predictions by distractor_distance:")
+        for _, r in rows.iterrows():
+            print(f"  Length {r['value']}: {r['wrong']}")
 
-if __name__ == "__main__":
-    print('ENGLISH TEST')
-    print(' - WITHOUT COT')
-    validate_and_score('NSP_QUESTIONS_WITH_ANSWERS_EN.csv')
-    # print(' - WITH COT')
-    # validate_and_score_COT('NSP_QUESTIONS_WITH_ANSWERS_1000_EN - FINAL.csv')
-
-    # print('SWAHILI TEST')
-    # print(' - WITHOUT COT')
-    # validate_and_score('NSP_QUESTIONS_WITH_ANSWERS_1000_SW - FINAL.csv')
-    # print(' - WITH COT')
-    # validate_and_score_COT('NSP_QUESTIONS_WITH_ANSWERS_1000_SW - FINAL.csv')
-    #
-    # print('HAUSA TEST')
-    # print(' - WITHOUT COT')
-    # validate_and_score('NSP_QUESTIONS_WITH_ANSWERS_1000_HA - FINAL.csv')
-    # print(' - WITH COT')
-    # validate_and_score_COT('NSP_QUESTIONS_WITH_ANSWERS_1000_HA - FINAL.csv')
 
+if __name__ == "__main__":
+    files = sys.argv[1:] or [
+        'datasets/NSP_QUESTIONS_WITH_ANSWERS_EN_1000_COT.csv',
+        'datasets/NSP_QUESTIONS_WITH_ANSWERS_SW_1000_COT.csv',
+        'datasets/NSP_QUESTIONS_WITH_ANSWERS_HA_1000_COT.csv',
+    ]
+    started = time.perf_counter()
+    results = score_files(files)
+    print_report(results, features=FEATURES)
+    print(f"\n⏱️ Scored {len(results['summary'])} answer columns in {time.perf_counter() - started:.2f}s")
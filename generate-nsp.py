@@ -1,15 +1,32 @@
 import os
+import sys
 import random
 import csv
 import re
+import mmap
+from multiprocessing import Pool
+
+from nsp_segment import Segmented, segment_story
+from nsp_distractors import SCORE_COLUMNS, story_scores, choose_distractors
 
 # ==== CONFIGURATION ====
 INPUT_TXT        = "txt-ha/all_books.txt"   # Path to input text file
 OUTPUT_CSV       = "nsp_questions_ha.csv"    # Output CSV file path
+OUTPUT_FORMAT    = "csv"                     # "csv", or "compact" (sentence-interned bank)
+OUTPUT_COMPACT   = "nsp_questions_ha.nspc"   # Output directory for the compact format
 MIN_CONTEXT      = 3
 MAX_CONTEXT      = 10
 MIN_DIST         = 2
 MAX_DIST         = 10
+LANG             = None                      # "EN", "SW" or "HA" for abbreviation-aware splitting
+SEED             = 42                        # Global seed; each story derives its own RNG
+WORKERS          = os.cpu_count() or 1       # Processes used to generate questions
+CHUNKSIZE        = 8                         # Stories handed to a worker at a time
+SAMPLE_SIZE      = None                      # Draw this many questions instead of the full bank
+SAMPLE_STRATIFY  = None                      # None, "context_length" or "distractor_distance"
+DISTRACTOR_MODE  = "random"                  # "random", or pick distractors in a "similarity"/"length" band
+DISTRACTOR_BAND  = (0.5, 1.0)                # Target cosine similarity (or word-count ratio) to the true sentence
+EMBEDDING_MODEL  = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"  # For "similarity" mode
 # ========================
 
 def clean_text(s: str) -> str:
@@ -19,17 +36,44 @@ def clean_text(s: str) -> str:
     """
     return ' '.join(s.replace('\n', ' ').replace('\r', ' ').split())
 
+# Any line with 3 or more dashes separates two stories
+STORY_SEPARATOR = re.compile(rb'(?m)^[ \t\-]{3,}\s*$')
+
+def _decode_story(raw):
+    # Match text-mode reading: universal newlines, then strip
+    text = raw.decode('utf-8')
+    return text.replace('\r\n', '\n').replace('\r', '\n').strip()
+
+def _iter_story_slices(mm):
+    # Yield (start, end, story) for every non-empty story in a mapped corpus
+    start = 0
+    for match in STORY_SEPARATOR.finditer(mm):
+        story = _decode_story(mm[start:match.start()])
+        if story:
+            yield start, match.start(), story
+        start = match.end()
+    story = _decode_story(mm[start:])
+    if story:
+        yield start, len(mm), story
+
+def iter_stories(filepath):
+    """
+    Lazily yield individual stories from a memory-mapped text file.
+    Only one story is decoded at a time, so memory stays flat
+    no matter how big the corpus is.
+    """
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for _, _, story in _iter_story_slices(mm):
+                yield story
+
 def load_stories(filepath):
     """
     Load raw text and split into individual stories by lines of dashes.
     """
-    with open(filepath, 'r', encoding='utf-8') as f:
-        text = f.read()
-    # Split on any line with 3 or more dashes
-    raw_stories = re.split(r'(?m)^[ \t\-]{3,}\s*$', text)
-    # Strip and filter out empty
-    stories = [s.strip() for s in raw_stories if s.strip()]
-    return stories
+    return list(iter_stories(filepath))
 
 def split_sentences(text):
     """
@@ -38,91 +82,356 @@ def split_sentences(text):
     raw = re.split(r'(?<=[.!?])\s+', text)
     return [s.strip() for s in raw if s.strip()]
 
+def iter_nsp_indices(n, context_range=(MIN_CONTEXT, MAX_CONTEXT),
+                     distractor_distances=(MIN_DIST, MAX_DIST), rng=random):
+    """
+    Enumerate NSP questions for a story of `n` sentences as indices only.
+    Yields (start, context_len, distractor_idx, label) per question.
+    """
+    min_d, max_d = distractor_distances
+
+    for context_len in range(context_range[0], context_range[1] + 1):
+        # slide window over sentences
+        for i in range(0, n - context_len - min_d):
+            # valid distractor indices
+            valid_idxs = range(i + context_len + min_d,
+                               min(i + context_len + max_d + 1, n))
+            if not valid_idxs:
+                continue
+            d_idx = rng.choice(valid_idxs)
+
+            # randomize A/B order
+            label = 'A' if rng.choice([True, False]) else 'B'
+            yield i, context_len, d_idx, label
+
+def iter_banded_indices(scores, band, context_range=(MIN_CONTEXT, MAX_CONTEXT),
+                        distractor_distances=(MIN_DIST, MAX_DIST), rng=random):
+    """
+    Counterpart of iter_nsp_indices that picks each distractor by its
+    score with the true sentence (see nsp_distractors.py): all of the
+    story's questions are drawn in one batched step from a NumPy RNG
+    seeded by `rng`. Yields (start, context_len, distractor_idx, label, score).
+    """
+    import numpy as np
+
+    n = len(scores)
+    min_d = distractor_distances[0]
+    windows = [(i, context_len)
+               for context_len in range(context_range[0], context_range[1] + 1)
+               for i in range(0, n - context_len - min_d)]
+    if not windows:
+        return
+    start, context_len = np.array(windows, dtype=np.int64).T
+    np_rng = np.random.default_rng(rng.getrandbits(64))
+    d_idx, score = choose_distractors(start + context_len, scores, band, distractor_distances, np_rng)
+    labels = np.where(np_rng.integers(0, 2, size=len(start)) == 0, 'A', 'B')
+    yield from zip(start.tolist(), context_len.tolist(), d_idx.tolist(), labels.tolist(),
+                   score.round(4).tolist())
+
 def generate_nsp_items(sentences, story_id, story_length,
                        context_range=(MIN_CONTEXT, MAX_CONTEXT),
-                       distractor_distances=(MIN_DIST, MAX_DIST)):
+                       distractor_distances=(MIN_DIST, MAX_DIST),
+                       rng=random, scores=None, band=DISTRACTOR_BAND,
+                       score_column=None):
     """
     Generate NSP questions for one story, including four features:
       - story_length, context_length,
       - distractor_distance, distractor_length
 
-    Returns a list of dicts per question.
+    `sentences` is a list of raw sentences or a Segmented story.
+    Distractors and A/B order are drawn from `rng` (the global
+    `random` module unless a per-story generator is passed). With a
+    `scores` matrix (see nsp_distractors.story_scores), distractors are
+    picked inside `band` instead, and their score is added as `score_column`.
+    Yields one dict per question.
     """
-    questions = []
-    n = len(sentences)
+    # Clean every sentence once; windows are slices of the joined story
+    seg = sentences if isinstance(sentences, Segmented) else Segmented.from_sentences(sentences)
 
-    for context_len in range(context_range[0], context_range[1] + 1):
-        # slide window over sentences
-        for i in range(0, n - context_len - distractor_distances[0]):
-            raw_context = sentences[i:i + context_len]
-            raw_true    = sentences[i + context_len]
+    if scores is None:
+        indices = ((*item, None) for item in iter_nsp_indices(
+            len(seg), context_range, distractor_distances, rng))
+    else:
+        indices = iter_banded_indices(scores, band, context_range, distractor_distances, rng)
 
-            # valid distractor indices
-            min_d, max_d = distractor_distances
-            valid_idxs = list(range(i + context_len + min_d,
-                                     min(i + context_len + max_d + 1, n)))
-            if not valid_idxs:
-                continue
-            d_idx = random.choice(valid_idxs)
-            raw_distractor = sentences[d_idx]
+    for i, context_len, d_idx, label, score in indices:
+        context_str  = seg.span(i, i + context_len)
+        true_str     = seg.sentences[i + context_len]
+        distract_str = seg.sentences[d_idx]
 
-            # compute features
-            dist_distance = d_idx - (i + context_len)
-            dist_length   = len(raw_distractor.split())
+        # compute features
+        dist_distance = d_idx - (i + context_len)
+        dist_length   = seg.word_counts[d_idx]
 
-            # clean all text fields
-            context_str  = clean_text(' '.join(raw_context))
-            true_str     = clean_text(raw_true)
-            distract_str = clean_text(raw_distractor)
+        if label == 'A':
+            A, B = true_str, distract_str
+        else:
+            A, B = distract_str, true_str
 
-            # randomize A/B order
-            if random.choice([True, False]):
-                A, B, label = true_str, distract_str, 'A'
-            else:
-                A, B, label = distract_str, true_str, 'B'
-
-            questions.append({
-                'story_id': story_id,
-                'story_length': story_length,
-                'context': context_str,
-                'context_length': context_len,
-                'distractor_distance': dist_distance,
-                'distractor_length': dist_length,
-                'option_A': A,
-                'option_B': B,
-                'label': label
-            })
-
-    return questions
+        item = {
+            'story_id': story_id,
+            'story_length': story_length,
+            'context': context_str,
+            'context_length': context_len,
+            'distractor_distance': dist_distance,
+            'distractor_length': dist_length,
+            'option_A': A,
+            'option_B': B,
+            'label': label
+        }
+        if score_column:
+            item[score_column] = score
+        yield item
 
-if __name__ == '__main__':
-    # Load and split into stories
-    stories = load_stories(INPUT_TXT)
-    print(f"Total Stories = {len(stories)}")
-    all_questions = []
-
-    for story_id, story_text in enumerate(stories):
-        sents = split_sentences(story_text)
-        story_len = len(sents)
-        # Skip too-short stories
-        if story_len < MIN_CONTEXT + MIN_DIST + 1:
+def story_rng(seed, story_id):
+    """
+    Build the RNG for one story from (global seed, story_id), so a
+    story's questions do not depend on processing order.
+    """
+    return random.Random(f"{seed}:{story_id}")
+
+# Per-process embedding store, opened on first use ("similarity" mode)
+_store = None
+
+def _embedding_store():
+    global _store
+    if _store is None:
+        from nsp_features import EmbeddingStore, store_path
+        _store = EmbeddingStore(store_path(EMBEDDING_MODEL), EMBEDDING_MODEL)
+    return _store
+
+def distractor_scores(seg):
+    """
+    Score matrix of one segmented story for band-controlled distractors,
+    or None in "random" mode. Embeddings are read from the store that
+    embed_corpus filled, so no model runs here.
+    """
+    if DISTRACTOR_MODE == 'random':
+        return None
+    if DISTRACTOR_MODE == 'similarity':
+        from nsp_features import text_key
+        vectors = _embedding_store().get([text_key(s) for s in seg.sentences])
+        return story_scores(DISTRACTOR_MODE, vectors=vectors)
+    return story_scores(DISTRACTOR_MODE, word_counts=seg.word_counts)
+
+def embed_corpus(filepath, block_size=50_000):
+    """
+    Encode every sentence of the corpus the embedding store does not
+    hold yet, in large batches in this process, before the workers start.
+    Returns the number of sentences seen.
+    """
+    from nsp_features import load_encoder, store_missing
+
+    store, loaded = _embedding_store(), []
+
+    def encode(texts):
+        # Load the model only if some sentence is not stored yet
+        if not loaded:
+            loaded.append(load_encoder(EMBEDDING_MODEL))
+        return loaded[0](texts)
+
+    block, seen = [], 0
+    for story_text in iter_stories(filepath):
+        block.extend(segment_story(story_text, LANG).sentences)
+        if len(block) >= block_size:
+            store_missing(block, store, encode)
+            seen, block = seen + len(block), []
+    if block:
+        store_missing(block, store, encode)
+        seen += len(block)
+    return seen
+
+def story_questions(story_text, story_id, seed=SEED):
+    """
+    Split one story into sentences and return its NSP questions,
+    or an empty list if the story is too short.
+    """
+    seg = segment_story(story_text, LANG)
+    story_len = len(seg)
+    # Skip too-short stories
+    if story_len < MIN_CONTEXT + MIN_DIST + 1:
+        return []
+    return list(generate_nsp_items(
+        sentences=seg,
+        story_id=story_id,
+        story_length=story_len,
+        rng=story_rng(seed, story_id),
+        scores=distractor_scores(seg),
+        band=DISTRACTOR_BAND,
+        score_column=SCORE_COLUMNS.get(DISTRACTOR_MODE)
+    ))
+
+def story_items(story_text, story_id, seed=SEED):
+    """
+    Compact counterpart of story_questions: return the story's cleaned
+    sentences and its questions as (start, context_len, distractor_idx, label)
+    index tuples, drawn from the same per-story RNG.
+    """
+    seg = segment_story(story_text, LANG)
+    # Skip too-short stories
+    if len(seg) < MIN_CONTEXT + MIN_DIST + 1:
+        return [], []
+    scores = distractor_scores(seg)
+    if scores is None:
+        items = list(iter_nsp_indices(len(seg), rng=story_rng(seed, story_id)))
+    else:
+        items = [item[:4] for item in iter_banded_indices(scores, DISTRACTOR_BAND, rng=story_rng(seed, story_id))]
+    return seg.sentences, items
+
+# Per-worker view of the corpus, opened once by the pool initializer
+_corpus = None
+
+def _init_worker(filepath):
+    global _corpus
+    with open(filepath, 'rb') as f:
+        _corpus = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _story_job(job):
+    story_id, start, end, seed, build = job
+    return build(_decode_story(_corpus[start:end]), story_id, seed)
+
+def iter_story_questions(filepath, workers=WORKERS, seed=SEED, build=story_questions):
+    """
+    Yield build(story_text, story_id, seed) for every story in story order
+    (the story's question list by default). With more than one worker,
+    stories are sharded across a process pool by byte offset; output is
+    identical for any worker count.
+    """
+    if workers <= 1:
+        for story_id, story_text in enumerate(iter_stories(filepath)):
+            yield build(story_text, story_id, seed)
+        return
+
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            jobs = ((story_id, start, end, seed, build) for story_id, (start, end, _)
+                    in enumerate(_iter_story_slices(mm)))
+            with Pool(workers, initializer=_init_worker, initargs=(filepath,)) as pool:
+                # imap keeps results in story order
+                yield from pool.imap(_story_job, jobs, chunksize=CHUNKSIZE)
+
+FIELDNAMES = ['story_id', 'story_length', 'context', 'context_length',
+              'distractor_distance', 'distractor_length',
+              'option_A', 'option_B', 'label']
+
+def fieldnames():
+    """CSV columns, plus the achieved distractor score outside "random" mode."""
+    return FIELDNAMES + ([SCORE_COLUMNS[DISTRACTOR_MODE]] if DISTRACTOR_MODE in SCORE_COLUMNS else [])
+
+def write_csv(filepath, output_csv):
+    """
+    Stream stories → questions → CSV rows without holding them in memory.
+    Returns (total_stories, total_questions).
+    """
+    os.makedirs(os.path.dirname(output_csv) or '.', exist_ok=True)
+    total_stories = 0
+    total_questions = 0
+    with open(output_csv, 'w', encoding='utf-8', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames())
+        writer.writeheader()
+        for qlist in iter_story_questions(filepath):
+            total_stories += 1
+            writer.writerows(qlist)
+            total_questions += len(qlist)
+    return total_stories, total_questions
+
+def write_compact(filepath, output_dir):
+    """
+    Stream stories into a sentence-interned compact bank (see nsp_compact.py).
+    Returns (total_stories, total_questions).
+    """
+    from nsp_compact import CompactWriter
+
+    config = {
+        'source': os.path.basename(filepath), 'seed': SEED,
+        'context_range': [MIN_CONTEXT, MAX_CONTEXT],
+        'distractor_distances': [MIN_DIST, MAX_DIST],
+        'distractor_mode': DISTRACTOR_MODE,
+    }
+    if DISTRACTOR_MODE != 'random':
+        config['distractor_band'] = list(DISTRACTOR_BAND)
+    with CompactWriter(output_dir, config) as writer:
+        for story_id, (sents, items) in enumerate(
+                iter_story_questions(filepath, build=story_items)):
+            writer.add_story(story_id, sents, items)
+    return writer.n_stories, writer.n_items
+
+def write_sample(filepath, output_csv, n, stratify=None, seed=SEED):
+    """
+    Draw `n` questions straight from the item space (see nsp_index.py)
+    and write only those to CSV. Only sentence counts are computed for
+    the whole corpus; text is built for the drawn items alone. Outside
+    "random" mode the drawn items' distractors are re-picked in the band,
+    which would undo a 'distractor_distance' stratification, so that
+    combination is rejected. Rows are written in a seeded random order,
+    so any prefix of the file is a random subsample of it. Returns
+    (total_stories, total_questions).
+    """
+    if stratify == 'distractor_distance' and DISTRACTOR_MODE != 'random':
+        raise ValueError(f"stratify='distractor_distance' needs DISTRACTOR_MODE = 'random', "
+                         f"got {DISTRACTOR_MODE!r}")
+    import numpy as np
+    from nsp_index import ItemSpace
+    from nsp_compact import record_to_row
+
+    lengths = np.fromiter((len(segment_story(s, LANG)) for s in iter_stories(filepath)), dtype=np.int64)
+    space = ItemSpace(lengths, (MIN_CONTEXT, MAX_CONTEXT), (MIN_DIST, MAX_DIST))
+    records = space.sample(n, seed=seed, stratify=stratify)
+    # Records are sorted by story, so one more pass over the corpus suffices
+    bounds = np.searchsorted(records['story_id'], np.arange(len(lengths) + 1))
+
+    rows = [None] * len(records)
+    score_column = SCORE_COLUMNS.get(DISTRACTOR_MODE)
+    rng = np.random.default_rng([seed, 1])
+    for story_id, story_text in enumerate(iter_stories(filepath)):
+        lo, hi = bounds[story_id], bounds[story_id + 1]
+        if lo == hi:
             continue
-        qlist = generate_nsp_items(
-            sentences=sents,
-            story_id=story_id,
-            story_length=story_len
-        )
-        all_questions.extend(qlist)
-
-    # Write all questions to CSV
-    os.makedirs(os.path.dirname(OUTPUT_CSV) or '.', exist_ok=True)
-    fieldnames = ['story_id', 'story_length', 'context', 'context_length',
-                  'distractor_distance', 'distractor_length',
-                  'option_A', 'option_B', 'label']
-    with open(OUTPUT_CSV, 'w', encoding='utf-8', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        seg = segment_story(story_text, LANG)
+        sents = seg.sentences
+        story_records = records[lo:hi]
+        scores = distractor_scores(seg)
+        if scores is not None:
+            story_records['distractor_idx'], achieved = choose_distractors(
+                story_records['true_idx'], scores, DISTRACTOR_BAND, (MIN_DIST, MAX_DIST), rng)
+        for j, rec in enumerate(story_records):
+            row = record_to_row(rec, sents.__getitem__, len(sents))
+            if score_column:
+                row[score_column] = round(float(achieved[j]), 4)
+            rows[lo + j] = row
+
+    # Shuffled out of story order, so a run stopped early by llm_live.py has
+    # answered a random part of the sample
+    os.makedirs(os.path.dirname(output_csv) or '.', exist_ok=True)
+    with open(output_csv, 'w', encoding='utf-8', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames())
         writer.writeheader()
-        for q in all_questions:
-            writer.writerow(q)
+        writer.writerows(rows[i] for i in np.random.default_rng([seed, 2]).permutation(len(rows)))
+    return len(lengths), len(records)
+
+def main():
+    """Generate the bank described by the configuration above and print a summary."""
+    if SAMPLE_SIZE and SAMPLE_STRATIFY == 'distractor_distance' and DISTRACTOR_MODE != 'random':
+        # Band modes re-pick the drawn distractors, undoing the distance strata
+        print(f"❌ SAMPLE_STRATIFY = 'distractor_distance' needs DISTRACTOR_MODE = 'random' "
+              f"(got {DISTRACTOR_MODE!r})")
+        sys.exit(1)
+    if DISTRACTOR_MODE == 'similarity':
+        print(f"🧮 Embedded {embed_corpus(INPUT_TXT)} sentences with {EMBEDDING_MODEL}")
+    if SAMPLE_SIZE:
+        output = OUTPUT_CSV
+        total_stories, total_questions = write_sample(INPUT_TXT, output, SAMPLE_SIZE, SAMPLE_STRATIFY)
+    elif OUTPUT_FORMAT == 'compact':
+        output = OUTPUT_COMPACT
+        total_stories, total_questions = write_compact(INPUT_TXT, output)
+    else:
+        output = OUTPUT_CSV
+        total_stories, total_questions = write_csv(INPUT_TXT, output)
 
-    print(f"Generated {len(all_questions)} NSP questions across {len(stories)} stories → {OUTPUT_CSV}")
\ No newline at end of file
+    print(f"Total Stories = {total_stories}")
+    print(f"Generated {total_questions} NSP questions across {total_stories} stories → {output} ({WORKERS} workers)")
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,23 @@
 import os
-import time
 import pandas as pd
 import sys
 import re
-from openai import OpenAI
-from google import genai
-from together import Together
+import time
 from dotenv import load_dotenv
+
+from llm_engine import Provider, evaluate
+from llm_cache import ResponseCache
+from llm_journal import ResultJournal
+from llm_metrics import RunMetrics
+from llm_batch import OpenAIBatchBackend, TogetherBatchBackend, GeminiBatchBackend, evaluate_batch
+from llm_stream import StreamedText, collect_stream
+from llm_reasoning import REASONING_COLS, ReasoningStore, reasoning_path
+from llm_live import stop_path
+
+MODELS = ("gpt", "gemini", "llama")
+BATCH_POLL_SECONDS = 30  # How often MODE = "batch" polls submitted batches
+
+
 def extract_answer_and_reasoning(response_text):
     """
     Extracts the reasoning and the final single-letter answer from a model's response.
@@ -38,17 +49,33 @@ def extract_answer_and_reasoning(response_text):
 
 
 
-def main(input_file):
+def main(input_file, models=MODELS, mode="sync", reasoning_lang="EN"):
     # ——— CONFIG ———
     # IMPORTANT: Replace with your actual API keys
     openai_api_key = os.environ.get("OPENAI_API_KEY", "YOUR_OPENAI_API_KEY")
     gemini_api_key = os.environ.get("GEMINI_API_KEY", "YOUR_GEMINI_API_KEY")
     llama3_api_key = os.environ.get("TOGETHER_API_KEY", "YOUR_TOGETHER_API_KEY")
 
+    # Provider SDKs are imported only for the models this run asks. Their own
+    # retries are off: llm_engine.Provider backs off, adapts its in-flight
+    # limit and counts retries itself
+    openai_client = genai_client = together_client = None
     try:
-        openai_client = OpenAI(api_key=openai_api_key)
-        genai_client = genai.Client(api_key=gemini_api_key)
-        together_client = Together(api_key=llama3_api_key)
+        if "gpt" in models:
+            from openai import AsyncOpenAI
+            openai_client = AsyncOpenAI(api_key=openai_api_key, max_retries=0)
+        if "gemini" in models:
+            from google import genai
+            # NSP_GEMINI_BASE_URL points Gemini at a stand-in such as llm_fake_server.py
+            # (OpenAI and Together read OPENAI_BASE_URL / TOGETHER_BASE_URL themselves)
+            gemini_base_url = os.environ.get("NSP_GEMINI_BASE_URL")
+            http_options = {"retry_options": {"attempts": 1}}
+            if gemini_base_url:
+                http_options["base_url"] = gemini_base_url
+            genai_client = genai.Client(api_key=gemini_api_key, http_options=http_options)
+        if "llama" in models:
+            from together import AsyncTogether
+            together_client = AsyncTogether(api_key=llama3_api_key, max_retries=0)
     except Exception as e:
         print(f"❌ Error initializing API clients. Make sure your API keys are set correctly. Error: {e}")
         sys.exit(1)
@@ -60,8 +87,43 @@ def main(input_file):
 
     INPUT_CSV = input_file
     OUTPUT_CSV = input_file # Save back to the same file
-    CHECKPOINT = 5  # Save every 5 rows
-    REASONING_LANG_CODE = 'EN'
+    JOURNAL_PATH = f"{OUTPUT_CSV}.journal.jsonl"  # Answers are appended here as they arrive
+    # Created by `python llm_live.py --stop` once the accuracy CIs are narrow enough;
+    # no new rows are queued after it appears (in-flight rows still finish)
+    STOP_PATH = stop_path(OUTPUT_CSV)
+    # Rows are asked in this seeded random order, so the rows answered when
+    # the run is stopped early are a random subsample
+    ROW_ORDER_SEED = 0
+    # Per-call latency, queue wait, retries, tokens and cost, one file per run
+    METRICS_PATH = f"{OUTPUT_CSV}.metrics.{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+    # USD per million (prompt, completion) tokens, for the cost projection
+    PRICES = {"gpt": (10.00, 30.00), "gemini": (0.075, 0.30), "llama": (0.88, 0.88)}
+    REASONING_PATH = reasoning_path(OUTPUT_CSV)  # Compressed reasoning; the CSV keeps offsets
+
+    MODE = mode  # "sync", or "batch": submit through provider batch endpoints (batch pricing, no per-minute limits)
+    BATCH_STATE = f"{OUTPUT_CSV}.batches.json"  # In-flight batch handles, for resuming
+    # Send every provider's batch to an OpenAI-compatible stand-in (see llm_fake_server.py)
+    BATCH_BASE_URL = os.environ.get("NSP_BATCH_BASE_URL")
+    REASONING_LANG_CODE = reasoning_lang  # 'EN', 'HA' or 'SW'
+
+    CACHE_PATH = "llm_cache.sqlite"  # Shared by both runners; None disables caching
+    CACHE_MAX_BYTES = 1 << 30
+
+    # Starting in-flight requests (adapted on 429/503), per-minute quotas and
+    # the latency quantile past which a slow call is hedged, per provider
+    PROVIDER_LIMITS = {
+        "gpt":    dict(max_in_flight=8, rpm=500, tpm=300_000, hedge_quantile=0.95),
+        "gemini": dict(max_in_flight=8, rpm=1_000, tpm=1_000_000, hedge_quantile=0.95),
+        "llama":  dict(max_in_flight=8, rpm=600, tpm=180_000, hedge_quantile=0.95),
+    }
+    COT_TOKENS = 400  # Expected reasoning length, budgeted against tokens/min
+    # Answer, reasoning offset and time-to-answer (seconds) columns per model
+    COT_COLS = {
+        "gpt": ("gpt_answer_COT", "gpt_reasoning_offset_COT", "gpt_COT_answer_seconds", "GPT-4"),
+        "gemini": ("gemini_answer_COT", "gemini_reasoning_offset_COT", "gemini_COT_answer_seconds", "Gemini"),
+        "llama": ("llama_answer_COT", "llama_reasoning_offset_COT", "llama_COT_answer_seconds", "Llama 3"),
+    }
+    MODELS = [name for name in COT_COLS if name in models]  # The ones asked in this run
 
     # ——— LOAD DATA ———
     try:
@@ -70,20 +132,42 @@ def main(input_file):
         print(f"❌ Error: The file '{INPUT_CSV}' was not found.")
         sys.exit(1)
 
-    # Add new columns for COT answers and reasoning if they don't exist
-    new_cols = [
-        "gpt_answer_COT", "gpt_reasoning_COT",
-        "gemini_answer_COT", "gemini_reasoning_COT",
-        "llama_answer_COT", "llama_reasoning_COT"
-    ]
-    for col in new_cols:
-        if col not in df.columns:
-            df[col] = ""
+    # Add new columns for COT answers, reasoning offsets and timings if they don't exist
+    for name, (answer_col, offset_col, tta_col, _) in COT_COLS.items():
+        if answer_col not in df.columns:
+            df[answer_col] = ""
+        df[answer_col] = df[answer_col].astype(object)
+        if offset_col not in df.columns and REASONING_COLS[name][0] not in df.columns:
+            df[offset_col] = pd.NA
+        if tta_col not in df.columns:
+            df[tta_col] = float("nan")
     # Also ensure original columns exist
     for col in ("gpt_answer", "gemini_answer", "llama_answer"):
          if col not in df.columns:
             df[col] = ""
 
+    # ——— RESUME FROM JOURNAL ———
+    journal = ResultJournal(JOURNAL_PATH)
+    replayed = journal.replay(df)
+    if replayed:
+        print(f"🔁 Resumed {replayed} answers from {JOURNAL_PATH}")
+    # Timings used to be written as *_time_to_answer_COT, a name that reads as an answer column
+    for name, (_, _, tta_col, _) in COT_COLS.items():
+        old_col = f"{name}_time_to_answer_COT"
+        if old_col in df.columns:
+            df[tta_col] = df[tta_col].fillna(df.pop(old_col))
+    if os.path.exists(STOP_PATH):
+        os.remove(STOP_PATH)  # left over from an earlier early stop
+
+    # CSVs that already hold inline *_reasoning_COT text (such as the committed
+    # datasets, which the notebook reads) keep that layout; `python
+    # llm_reasoning.py` migrates them. Everything else gets sidecar offsets.
+    store = ReasoningStore(REASONING_PATH)
+    INLINE = {name: REASONING_COLS[name][0] in df.columns for name in COT_COLS}
+    for name, inline in INLINE.items():
+        if inline:
+            df[REASONING_COLS[name][0]] = df[REASONING_COLS[name][0]].astype(object)
+
 
     # ——— PROMPT BUILDER (CHAIN OF THOUGHT) ———
     def build_cot_prompt(context, opt_a, opt_b):
@@ -103,109 +187,185 @@ def main(input_file):
         )
 
     # ——— MODEL QUERY FUNCTIONS ———
-    def ask_gpt(prompt):
-        try:
-            response = openai_client.chat.completions.create(
-                model=GPT_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"❌ GPT Error: {e}")
-            return f"ERROR: {e}"
-
-    def ask_gemini(prompt, retries=5, delay=60):
-        for attempt in range(retries):
-            try:
-                response = genai_client.models.generate_content(
-                    model=GEMINI_MODEL,
-                    contents=prompt
-                )
-                ans = response.text.strip().upper()
-                return ans
-            except Exception as e:
-                if '503' in str(e) or 'UNAVAILABLE' in str(e).upper():
-                    print(f"❌ Gemini 503 error (attempt {attempt + 1}/{retries}): {e}")
-                    print(f"⏳ Retrying in {delay} seconds...")
-                    time.sleep(delay)
-                else:
-                    print(f"❌ Non-retryable error: {e}")
-                    break
-        return "ERROR: Retry failed"
-
-    def ask_llama(prompt):
-        try:
-            response = together_client.chat.completions.create(
-                model=LLAMA_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"❌ Llama Error: {e}")
-            return f"ERROR: {e}"
+    # Completions are streamed so the answer line is timed as it arrives
+    def chat_delta(chunk):
+        return chunk.choices[0].delta.content if chunk.choices else None
 
-    # ——— MAIN LOOP ———
-    try:
-        # You can set a start_index if you need to resume a partial run
-        start_index = 244
-        print(f"🚀 Starting processing for {INPUT_CSV}. Reasoning language: {REASONING_LANG_CODE}")
+    async def ask_gpt(prompt):
+        started = time.monotonic()
+        stream = await openai_client.chat.completions.create(
+            model=GPT_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        return await collect_stream(stream, chat_delta, started)
+
+    async def ask_gemini(prompt):
+        # 429/503s are retried with backoff by the engine (llm_engine.Provider)
+        started = time.monotonic()
+        stream = await genai_client.aio.models.generate_content_stream(
+            model=GEMINI_MODEL,
+            contents=prompt
+        )
+        response = await collect_stream(stream, lambda chunk: chunk.text, started)
+        return StreamedText(response.strip().upper(), response.time_to_answer)
 
-        for idx, row in df.iloc[start_index:].iterrows():
-            print(f"➡️ Row {idx}: Processing...")
+    async def ask_llama(prompt):
+        started = time.monotonic()
+        stream = await together_client.chat.completions.create(
+            model=LLAMA_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            stream=True
+        )
+        return await collect_stream(stream, chat_delta, started)
 
+    cache = ResponseCache(CACHE_PATH, CACHE_MAX_BYTES) if CACHE_PATH else None
+    metrics = RunMetrics(METRICS_PATH, PRICES)
+    providers = [provider for provider in [
+        Provider("gpt", ask_gpt, completion_tokens=COT_TOKENS, model=GPT_MODEL,
+                 temperature=0, cache=cache, metrics=metrics, **PROVIDER_LIMITS["gpt"]),
+        Provider("gemini", ask_gemini, completion_tokens=COT_TOKENS, model=GEMINI_MODEL,
+                 cache=cache, metrics=metrics, **PROVIDER_LIMITS["gemini"]),
+        Provider("llama", ask_llama, completion_tokens=COT_TOKENS, model=LLAMA_MODEL,
+                 temperature=0, cache=cache, metrics=metrics, **PROVIDER_LIMITS["llama"]),
+    ] if provider.name in MODELS]
+
+    # ——— BATCH BACKENDS ———
+    def batch_backends():
+        # Built (and their SDKs imported) only for the models this run asks
+        upper = lambda text: text.strip().upper()  # matches ask_gemini
+        if BATCH_BASE_URL:
+            from openai import OpenAI
+            stand_in = OpenAI(api_key="offline", base_url=BATCH_BASE_URL)
+            backends = {
+                "gpt": lambda: OpenAIBatchBackend(stand_in, GPT_MODEL, temperature=0),
+                "gemini": lambda: OpenAIBatchBackend(stand_in, GEMINI_MODEL, postprocess=upper),
+                "llama": lambda: OpenAIBatchBackend(stand_in, LLAMA_MODEL, temperature=0),
+            }
+            return {name: backends[name]() for name in MODELS}
+
+        def gpt_backend():
+            from openai import OpenAI
+            return OpenAIBatchBackend(OpenAI(api_key=openai_api_key), GPT_MODEL, temperature=0)
+
+        def llama_backend():
+            from together import Together
+            return TogetherBatchBackend(Together(api_key=llama3_api_key), LLAMA_MODEL, temperature=0)
+
+        backends = {
+            "gpt": gpt_backend,
+            "gemini": lambda: GeminiBatchBackend(genai_client, GEMINI_MODEL, postprocess=upper),
+            "llama": llama_backend,
+        }
+        return {name: backends[name]() for name in MODELS}
+
+    # ——— WORK QUEUE ———
+    def stopped():
+        if os.path.exists(STOP_PATH):
+            print(f"🛑 {STOP_PATH} found: no new rows are queued")
+            return True
+        return False
+
+    def pending_rows():
+        # Only ask the models whose COT answer for the row is still missing
+        for idx, row in df.sample(frac=1, random_state=ROW_ORDER_SEED).iterrows():
+            if stopped():
+                return
+            missing = [name for name in MODELS if row.get(COT_COLS[name][0], "") not in ("A", "B")]
+            if not missing:
+                continue
             prompt = build_cot_prompt(row["context"], row["option_A"], row["option_B"])
+            yield idx, {name: prompt for name in missing}
+
+    parsed = {}  # (row, model) → (answer, reasoning column, value, time to answer) until written back
+
+    def store_reasoning(idx, name, reasoning):
+        # A rerun that gets the same reply back (a cache hit on a PARSE_ERROR
+        # row, say) reuses the row's record instead of appending a duplicate
+        offset = df.at[idx, COT_COLS[name][1]]
+        if not pd.isna(offset) and store.read(offset) == (idx, name, reasoning):
+            return int(offset)
+        return store.append(idx, name, reasoning)
 
-            # --- GPT ---
-            if row.get("gpt_answer_COT", "") not in ("A", "B"):
-                print("  - Querying GPT-4...")
-                gpt_response = ask_gpt(prompt)
-                if gpt_response.startswith("ERROR:"):
-                    print("❌ GPT-4 failed. Exiting.")
-                    sys.exit(1)
-                answer, reasoning = extract_answer_and_reasoning(gpt_response)
-                df.at[idx, "gpt_answer_COT"] = answer
-                df.at[idx, "gpt_reasoning_COT"] = reasoning
-                print(f"  - GPT-4 Answer: {answer}")
-
-            # --- Gemini ---
-            if row.get("gemini_answer_COT", "") not in ("A", "B"):
-                print("  - Querying Gemini 1.5 Flash...")
-                gemini_response = ask_gemini(prompt)
-                if gemini_response.startswith("ERROR:"):
-                    print("❌ Gemini failed. Exiting.")
-                    sys.exit(1)
-                answer, reasoning = extract_answer_and_reasoning(gemini_response)
-                df.at[idx, "gemini_answer_COT"] = answer
-                df.at[idx, "gemini_reasoning_COT"] = reasoning
-                print(f"  - Gemini Answer: {answer}")
-
-            # --- Llama ---
-            if row.get("llama_answer_COT", "") not in ("A", "B"):
-                print("  - Querying Llama 3...")
-                llama_response = ask_llama(prompt)
-                if llama_response.startswith("ERROR:"):
-                    print("❌ Llama failed. Exiting.")
-                    sys.exit(1)
-                answer, reasoning = extract_answer_and_reasoning(llama_response)
-                df.at[idx, "llama_answer_COT"] = answer
-                df.at[idx, "llama_reasoning_COT"] = reasoning
-                print(f"  - Llama 3 Answer: {answer}")
-
-            if (idx + 1) % CHECKPOINT == 0:
-                df.to_csv(OUTPUT_CSV, index=False)
-                print(f"💾 Checkpoint saved at row {idx}")
+    def journal_result(idx, name, response):
+        # Parse and journal every answer the moment it arrives; reasoning goes to the store
+        answer_col, offset_col, tta_col, _ = COT_COLS[name]
+        answer, reasoning = extract_answer_and_reasoning(response)
+        if INLINE[name]:
+            reasoning_col, value = REASONING_COLS[name][0], reasoning
+        else:
+            reasoning_col, value = offset_col, store_reasoning(idx, name, reasoning)
+        # Cached and batch responses carry no timing
+        tta = getattr(response, "time_to_answer", None)
+        journal.append(idx, name, {answer_col: answer, reasoning_col: value, tta_col: tta})
+        return answer, reasoning_col, value, tta
 
+    def on_result(idx, name, response):
+        parsed[idx, name] = journal_result(idx, name, response)
+
+    def on_error(idx, name, exc):
+        # The cell stays empty, so the next run asks it again
+        journal.append(idx, name, {}, error=f"{type(exc).__name__}: {exc}")
+
+    def on_row(idx, responses):
+        # Called in row order as soon as every model has answered the row
+        print(f"➡️ Row {idx}: Processing...")
+        for name in responses:
+            answer_col, _, tta_col, label = COT_COLS[name]
+            answer, reasoning_col, value, tta = parsed.pop((idx, name))
+            df.at[idx, answer_col] = answer
+            df.at[idx, reasoning_col] = value
+            df.at[idx, tta_col] = tta
+            timing = f" (answered after {tta:.1f}s)" if tta is not None else ""
+            print(f"  - {label} Answer: {answer}{timing}")
+        metrics.row_done()
+
+    # Batch mode has no per-row callback: a row is done once every model
+    # it was sent to has answered
+    batch_waiting = {}
+
+    def batch_rows(rows):
+        for idx, prompts in rows:
+            batch_waiting[idx] = len(prompts)
+            yield idx, prompts
+
+    def on_batch_result(idx, name, response):
+        journal_result(idx, name, response)
+        if idx in batch_waiting:
+            batch_waiting[idx] -= 1
+            if batch_waiting[idx] == 0:
+                del batch_waiting[idx]
+                metrics.row_done()
+
+    # ——— MAIN LOOP ———
+    metrics.total_rows = sum(1 for _ in pending_rows())
+    try:
+        print(f"🚀 Starting processing for {INPUT_CSV}. Reasoning language: {REASONING_LANG_CODE}")
+        if MODE == "batch":
+            # Answers reach the dataframe when the journal is compacted
+            evaluate_batch(batch_rows(pending_rows()), batch_backends(), on_batch_result,
+                           BATCH_STATE, cache, BATCH_POLL_SECONDS)
+        else:
+            evaluate(pending_rows(), providers, on_row, on_result=on_result, on_error=on_error)
 
     except Exception as e:
         print(f"❌ An unexpected error occurred: {e}")
     finally:
         # ——— FINAL SAVE ———
         print("\n💾 Saving final results...")
-        df.to_csv(OUTPUT_CSV, index=False)
+        journal.compact(df, OUTPUT_CSV)
+        store.close()
         print(f"✅ Done! Results saved to {OUTPUT_CSV}")
+        print(metrics.summary())
+        metrics.close()
+        for provider in providers:
+            print(provider.summary())
+        if cache:
+            print(cache.summary())
 
 if __name__ == "__main__":
     load_dotenv()
-    main('FILENAME')
\ No newline at end of file
+    main(sys.argv[1] if len(sys.argv) > 1 else 'FILENAME')
\ No newline at end of file
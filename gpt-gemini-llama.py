@@ -1,21 +1,48 @@
 import os
 import time
+import random
 import pandas as pd
 import sys
-from openai import OpenAI
-from google import genai
-from together import Together
 from dotenv import load_dotenv
 
-def main(input_file):
+from llm_engine import Provider, evaluate
+from llm_cache import ResponseCache
+from llm_journal import ResultJournal
+from llm_metrics import RunMetrics, record_usage
+from llm_batch import OpenAIBatchBackend, TogetherBatchBackend, GeminiBatchBackend, evaluate_batch, PACK as PACK_KIND
+from llm_packing import plan_packs, merge_contexts, leaked_options, build_packed_prompt, parse_packed_answers
+from llm_constrained import (AB_LOGIT_BIAS, TOP_LOGPROBS, GEMINI_AB_CONFIG,
+                             letter_probabilities, encode_scored, decode_scored)
+from llm_live import stop_path
+
+MODELS = ("gpt", "gemini", "llama")
+BATCH_POLL_SECONDS = 30  # How often MODE = "batch" polls submitted batches
+
+def main(input_file, models=MODELS, mode="sync", pack=False, answer_mode="text"):
     # ——— CONFIG ———
     openai_api_key = os.environ.get("OPENAI_API_KEY", "YOUR_OPENAI_API_KEY")
     gemini_api_key = os.environ.get("GEMINI_API_KEY", "YOUR_GEMINI_API_KEY")
     llama3_api_key = os.environ.get("TOGETHER_API_KEY", "YOUR_TOGETHER_API_KEY")
 
-    openai_client = OpenAI(api_key=openai_api_key)
-    genai_client = genai.Client(api_key=gemini_api_key)
-    together_client = Together(api_key=llama3_api_key)  # Optional: load from env
+    # Provider SDKs are imported only for the models this run asks. Their own
+    # retries are off: llm_engine.Provider backs off, adapts its in-flight
+    # limit and counts retries itself
+    openai_client = genai_client = together_client = None
+    if "gpt" in models:
+        from openai import AsyncOpenAI
+        openai_client = AsyncOpenAI(api_key=openai_api_key, max_retries=0)
+    if "gemini" in models:
+        from google import genai
+        # NSP_GEMINI_BASE_URL points Gemini at a stand-in such as llm_fake_server.py
+        # (OpenAI and Together read OPENAI_BASE_URL / TOGETHER_BASE_URL themselves)
+        gemini_base_url = os.environ.get("NSP_GEMINI_BASE_URL")
+        http_options = {"retry_options": {"attempts": 1}}
+        if gemini_base_url:
+            http_options["base_url"] = gemini_base_url
+        genai_client = genai.Client(api_key=gemini_api_key, http_options=http_options)
+    if "llama" in models:
+        from together import AsyncTogether
+        together_client = AsyncTogether(api_key=llama3_api_key, max_retries=0)  # Optional: load from env
 
     GPT_MODEL = "gpt-4-turbo"
     GEMINI_MODEL = "gemini-1.5-flash"
@@ -23,13 +50,72 @@ def main(input_file):
 
     INPUT_CSV = input_file
     OUTPUT_CSV = input_file
-    CHECKPOINT = 5  # Save every 5 rows
+    JOURNAL_PATH = f"{OUTPUT_CSV}.journal.jsonl"  # Answers are appended here as they arrive
+    # Created by `python llm_live.py --stop` once the accuracy CIs are narrow enough;
+    # no new rows are queued after it appears (in-flight rows still finish)
+    STOP_PATH = stop_path(OUTPUT_CSV)
+    # Rows (and packs) are asked in this seeded random order, so the rows
+    # answered when the run is stopped early are a random subsample
+    ROW_ORDER_SEED = 0
+    # Per-call latency, queue wait, retries, tokens and cost, one file per run
+    METRICS_PATH = f"{OUTPUT_CSV}.metrics.{time.strftime('%Y%m%d-%H%M%S')}.jsonl"
+    # USD per million (prompt, completion) tokens, for the cost projection
+    PRICES = {"gpt": (10.00, 30.00), "gemini": (0.075, 0.30), "llama": (0.88, 0.88)}
+
+    MODE = mode  # "sync", or "batch": submit through provider batch endpoints (batch pricing, no per-minute limits)
+    BATCH_STATE = f"{OUTPUT_CSV}.batches.json"  # In-flight batch handles, for resuming
+    PACK_BATCH_STATE = f"{OUTPUT_CSV}.pack.batches.json"  # Same, for the packed pass
+    # Send every provider's batch to an OpenAI-compatible stand-in (see llm_fake_server.py)
+    BATCH_BASE_URL = os.environ.get("NSP_BATCH_BASE_URL")
+
+    # Ask up to PACK_SIZE questions from the same story in one request (story
+    # text sent once); unparsed answers are retried one question at a time
+    PACK = pack
+    PACK_SIZE = 8
+
+    # "logprobs": one-token answers constrained to A/B (logit bias, or an enum
+    # schema for Gemini) with P(A)/P(B) kept for GPT and Llama. Sync mode only.
+    ANSWER_MODE = answer_mode
+
+    CACHE_PATH = "llm_cache.sqlite"  # Shared by both runners; None disables caching
+    CACHE_MAX_BYTES = 1 << 30
+
+    # Starting in-flight requests (adapted on 429/503), per-minute quotas and
+    # the latency quantile past which a slow call is hedged, per provider
+    PROVIDER_LIMITS = {
+        "gpt":    dict(max_in_flight=8, rpm=500, tpm=300_000, hedge_quantile=0.95),
+        "gemini": dict(max_in_flight=8, rpm=1_000, tpm=1_000_000, hedge_quantile=0.95),
+        "llama":  dict(max_in_flight=8, rpm=600, tpm=180_000, hedge_quantile=0.95),
+    }
+    ANSWER_COLS = {"gpt": "gpt_answer", "gemini": "gemini_answer", "llama": "llama_answer"}
+    PROB_COLS = {"gpt": ("gpt_prob_A", "gpt_prob_B"), "llama": ("llama_prob_A", "llama_prob_B")}
+    MODELS = [name for name in ANSWER_COLS if name in models]  # The ones asked in this run
+
+    SCORED = ANSWER_MODE == "logprobs"
+    if SCORED and (MODE == "batch" or PACK):
+        print("❌ ANSWER_MODE = 'logprobs' needs MODE = 'sync' and PACK = False")
+        sys.exit(1)
 
     # ——— LOAD DATA ———
     df = pd.read_csv(INPUT_CSV)
     for col in ("gpt_answer", "gemini_answer", "llama_answer"):
         if col not in df.columns:
             df[col] = ""
+        df[col] = df[col].astype(object)
+    if SCORED:
+        # Probability columns sit right after their model's answer column
+        for name, cols in PROB_COLS.items():
+            for offset, col in enumerate(cols, 1):
+                if col not in df.columns:
+                    df.insert(df.columns.get_loc(ANSWER_COLS[name]) + offset, col, float("nan"))
+
+    # ——— RESUME FROM JOURNAL ———
+    journal = ResultJournal(JOURNAL_PATH)
+    replayed = journal.replay(df)
+    if replayed:
+        print(f"🔁 Resumed {replayed} answers from {JOURNAL_PATH}")
+    if os.path.exists(STOP_PATH):
+        os.remove(STOP_PATH)  # left over from an earlier early stop
 
     # ——— PROMPT BUILDER ———
     def build_prompt(context, opt_a, opt_b):
@@ -42,77 +128,269 @@ def main(input_file):
         )
 
     # ——— GPT QUERY ———
-    def ask_gpt(prompt):
-        response = openai_client.chat.completions.create(
+    async def ask_gpt(prompt):
+        if SCORED:
+            response = await openai_client.chat.completions.create(
+                model=GPT_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0,
+                max_tokens=1,
+                logit_bias=AB_LOGIT_BIAS,
+                logprobs=True,
+                top_logprobs=TOP_LOGPROBS
+            )
+            record_usage(response)
+            choice = response.choices[0]
+            return encode_scored(choice.message.content.strip().upper(),
+                                 *letter_probabilities(choice.logprobs))
+        response = await openai_client.chat.completions.create(
             model=GPT_MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0
         )
+        record_usage(response)
         ans = response.choices[0].message.content.strip().upper()
         # print(ans)
         return ans
 
     # ——— GEMINI QUERY ———
-    def ask_gemini(prompt, retries=5, delay=60):
-        for attempt in range(retries):
-            try:
-                response = genai_client.models.generate_content(
-                    model=GEMINI_MODEL,
-                    contents=prompt
-                )
-                ans = response.text.strip().upper()
-                return ans
-            except Exception as e:
-                if '503' in str(e) or 'UNAVAILABLE' in str(e).upper():
-                    print(f"❌ Gemini 503 error (attempt {attempt + 1}/{retries}): {e}")
-                    print(f"⏳ Retrying in {delay} seconds...")
-                    time.sleep(delay)
-                else:
-                    print(f"❌ Non-retryable error: {e}")
-                    break
-        return "ERROR: Retry failed"
+    async def ask_gemini(prompt):
+        # 429/503s are retried with backoff by the engine (llm_engine.Provider)
+        response = await genai_client.aio.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=prompt,
+            config=GEMINI_AB_CONFIG if SCORED else None
+        )
+        record_usage(response)
+        ans = response.text.strip().upper()
+        return encode_scored(ans) if SCORED else ans
 
     # ——— LLAMA QUERY (Together API) ———
-    def ask_llama(prompt):
-        response = together_client.chat.completions.create(
+    async def ask_llama(prompt):
+        if SCORED:
+            response = await together_client.chat.completions.create(
+                model=LLAMA_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=1,
+                logit_bias=AB_LOGIT_BIAS,
+                logprobs=TOP_LOGPROBS
+            )
+            record_usage(response)
+            choice = response.choices[0]
+            return encode_scored(choice.message.content.strip().upper(),
+                                 *letter_probabilities(choice.logprobs))
+        response = await together_client.chat.completions.create(
             model=LLAMA_MODEL,
             messages=[{"role": "user", "content": prompt}]
         )
+        record_usage(response)
         ans = response.choices[0].message.content.strip().upper()
         # print(ans)
         return ans
 
-    # ——— MAIN LOOP ———
-    try:
-        start_index = 9170  # for example
-        for idx, row in df.iloc[start_index:].iterrows():
-            if (
-                row["gpt_answer"] in ("A", "B") and
-                row["gemini_answer"] in ("A", "B") and
-                row["llama_answer"] in ("A", "B")
-            ):
-                continue
+    cache = ResponseCache(CACHE_PATH, CACHE_MAX_BYTES) if CACHE_PATH else None
+    metrics = RunMetrics(METRICS_PATH, PRICES)
+    # Constrained answers are cached apart from free-text ones for the same prompt
+    variant = " [A/B logprobs]" if SCORED else ""
+    reply_tokens = 1 if SCORED else 16
+    providers = [provider for provider in [
+        Provider("gpt", ask_gpt, model=GPT_MODEL + variant, temperature=0, cache=cache,
+                 completion_tokens=reply_tokens, metrics=metrics, **PROVIDER_LIMITS["gpt"]),
+        Provider("gemini", ask_gemini, model=GEMINI_MODEL + variant, cache=cache,
+                 completion_tokens=reply_tokens, metrics=metrics, **PROVIDER_LIMITS["gemini"]),
+        Provider("llama", ask_llama, model=LLAMA_MODEL + variant, cache=cache,
+                 completion_tokens=reply_tokens, metrics=metrics, **PROVIDER_LIMITS["llama"]),
+    ] if provider.name in MODELS]
+
+    # ——— BATCH BACKENDS ———
+    def batch_backends():
+        # Built (and their SDKs imported) only for the models this run asks
+        upper = lambda text: text.strip().upper()  # matches the ask_* functions
+        if BATCH_BASE_URL:
+            from openai import OpenAI
+            stand_in = OpenAI(api_key="offline", base_url=BATCH_BASE_URL)
+            backends = {
+                "gpt": lambda: OpenAIBatchBackend(stand_in, GPT_MODEL, temperature=0, postprocess=upper),
+                "gemini": lambda: OpenAIBatchBackend(stand_in, GEMINI_MODEL, postprocess=upper),
+                "llama": lambda: OpenAIBatchBackend(stand_in, LLAMA_MODEL, postprocess=upper),
+            }
+            return {name: backends[name]() for name in MODELS}
+
+        def gpt_backend():
+            from openai import OpenAI
+            return OpenAIBatchBackend(OpenAI(api_key=openai_api_key), GPT_MODEL,
+                                      temperature=0, postprocess=upper)
+
+        def llama_backend():
+            from together import Together
+            return TogetherBatchBackend(Together(api_key=llama3_api_key), LLAMA_MODEL,
+                                        postprocess=upper)
+
+        backends = {
+            "gpt": gpt_backend,
+            "gemini": lambda: GeminiBatchBackend(genai_client, GEMINI_MODEL, postprocess=upper),
+            "llama": llama_backend,
+        }
+        return {name: backends[name]() for name in MODELS}
 
-            print(f"➡️ Row {idx}: querying models...")
+    # ——— WORK QUEUE ———
+    def stopped():
+        if os.path.exists(STOP_PATH):
+            print(f"🛑 {STOP_PATH} found: no new rows are queued")
+            return True
+        return False
 
+    def is_missing(row, name):
+        if row[ANSWER_COLS[name]] not in ("A", "B"):
+            return True
+        # In logprobs mode, answers without probabilities are asked again
+        return SCORED and name in PROB_COLS and pd.isna(row[PROB_COLS[name][0]])
+
+    def pending_rows():
+        # Only ask the models whose answer for the row is still missing
+        for idx, row in df.sample(frac=1, random_state=ROW_ORDER_SEED).iterrows():
+            if stopped():
+                return
+            missing = [name for name in MODELS if is_missing(row, name)]
+            if not missing:
+                continue
             prompt = build_prompt(row["context"], row["option_A"], row["option_B"])
-            df.at[idx, "gpt_answer"] = ask_gpt(prompt)
-            df.at[idx, "gemini_answer"] = ask_gemini(prompt)
-            df.at[idx, "llama_answer"] = ask_llama(prompt)
+            yield idx, {name: prompt for name in missing}
+
+    def pending_packs():
+        # Group still-missing questions by story, up to PACK_SIZE per request,
+        # never packing a question with text that shows one of its options;
+        # the packs are then asked in a seeded random order
+        by_story = {}
+        for idx, row in df.iterrows():
+            missing = tuple(name for name in MODELS if row[ANSWER_COLS[name]] not in ("A", "B"))
+            if missing:
+                by_story.setdefault((row["story_id"], missing), []).append(
+                    (idx, row["context"], (row["option_A"], row["option_B"])))
+        packs = [(pack, missing) for (_, missing), questions in by_story.items()
+                 for pack in plan_packs(questions, PACK_SIZE)]
+        random.Random(ROW_ORDER_SEED).shuffle(packs)
+        for pack, missing in packs:
+            if stopped():
+                return
+            excerpts, spans = merge_contexts([df.at[idx, "context"] for idx in pack])
+            options = [df.at[idx, col] for idx in pack for col in ("option_A", "option_B")]
+            assert not leaked_options(excerpts, options), f"pack {pack} shows an option in its text"
+            prompt = build_packed_prompt(excerpts, [
+                (span, df.at[idx, "option_A"], df.at[idx, "option_B"])
+                for idx, span in zip(pack, spans)
+            ])
+            yield pack, {name: prompt for name in missing}
+
+    pack_stats = {"packs": 0, "questions": 0, "unparsed": 0}
+
+    def on_pack_result(pack, name, reply):
+        # Journal every answer the reply gives; the rest stay missing for the solo pass
+        answers = parse_packed_answers(reply, len(pack))
+        for n, idx in enumerate(pack, 1):
+            if n in answers:
+                journal.append(idx, name, {ANSWER_COLS[name]: answers[n]})
+                df.at[idx, ANSWER_COLS[name]] = answers[n]
+        pack_stats["packs"] += 1
+        pack_stats["questions"] += len(pack)
+        pack_stats["unparsed"] += len(pack) - len(answers)
+
+    def on_pack(pack, replies):
+        metrics.row_done(len(pack))
+        print(f"📦 Rows {', '.join(map(str, pack))}: " + ", ".join(
+            f"{name}={''.join(str(df.at[idx, ANSWER_COLS[name]]) for idx in pack)}" for name in replies))
+
+    def answer_values(name, response):
+        # Column values for one response: the letter, plus P(A)/P(B) in logprobs mode
+        if not SCORED:
+            return {ANSWER_COLS[name]: response}
+        ans, p_a, p_b = decode_scored(response)
+        values = {ANSWER_COLS[name]: ans}
+        if name in PROB_COLS:
+            values.update(zip(PROB_COLS[name], (p_a, p_b)))
+        return values
+
+    def on_result(idx, name, ans):
+        # Journal every answer the moment it arrives
+        journal.append(idx, name, answer_values(name, ans))
+
+    def on_error(row_id, name, exc):
+        # The cells stay empty, so the next run asks them again
+        for idx in row_id if isinstance(row_id, tuple) else (row_id,):
+            journal.append(idx, name, {}, error=f"{type(exc).__name__}: {exc}")
+
+    def on_row(idx, answers):
+        # Called in row order as soon as every model has answered the row
+        for name, ans in answers.items():
+            for col, value in answer_values(name, ans).items():
+                df.at[idx, col] = value
+        print(f"➡️ Row {idx}: " + ", ".join(f"{name}={df.at[idx, ANSWER_COLS[name]]}" for name in answers))
+        metrics.row_done()
+
+    # Batch mode has no per-row callback: a row (or pack) is done once
+    # every model it was sent to has answered
+    batch_waiting = {}
+
+    def batch_rows(rows):
+        for row_id, prompts in rows:
+            batch_waiting[row_id] = len(prompts)
+            yield row_id, prompts
+
+    def batch_answered(row_id, rows=1):
+        if row_id in batch_waiting:
+            batch_waiting[row_id] -= 1
+            if batch_waiting[row_id] == 0:
+                del batch_waiting[row_id]
+                metrics.row_done(rows)
+
+    def on_batch_result(idx, name, ans):
+        on_result(idx, name, ans)
+        batch_answered(idx)
+
+    def on_batch_pack_result(pack, name, reply):
+        on_pack_result(pack, name, reply)
+        batch_answered(pack, len(pack))
+
+    # ——— MAIN LOOP ———
+    metrics.total_rows = sum(1 for _ in pending_rows())
+    try:
+        if PACK:
+            if MODE == "batch":
+                evaluate_batch(batch_rows(pending_packs()), batch_backends(), on_batch_pack_result,
+                               PACK_BATCH_STATE, cache, BATCH_POLL_SECONDS, kind=PACK_KIND)
+            else:
+                evaluate(pending_packs(), providers, on_pack, on_result=on_pack_result, on_error=on_error)
+            print(f"📦 {pack_stats['questions']} answers requested in {pack_stats['packs']} packed "
+                  f"requests; {pack_stats['unparsed']} retried alone")
 
-            if idx % CHECKPOINT == 0:
-                df.to_csv(OUTPUT_CSV, index=False)
-                print(f"💾 Checkpoint saved at row {idx}")
+        if MODE == "batch":
+            # Answers reach the dataframe when the journal is compacted
+            evaluate_batch(batch_rows(pending_rows()), batch_backends(), on_batch_result,
+                           BATCH_STATE, cache, BATCH_POLL_SECONDS)
+        else:
+            evaluate(pending_rows(), providers, on_row, on_result=on_result, on_error=on_error)
 
     except Exception as e:
         print("❌ Error occurred, saving and exiting:", e)
-        df.to_csv(OUTPUT_CSV, index=False)
+        journal.compact(df, OUTPUT_CSV)
+        print(metrics.summary())
+        metrics.close()
+        for provider in providers:
+            print(provider.summary())
+        if cache:
+            print(cache.summary())
         sys.exit(1)
 
     # ——— FINAL SAVE ———
-    df.to_csv(OUTPUT_CSV, index=False)
+    journal.compact(df, OUTPUT_CSV)
     print("✅ Done! Results saved to", OUTPUT_CSV)
+    print(metrics.summary())
+    metrics.close()
+    for provider in providers:
+        print(provider.summary())
+    if cache:
+        print(cache.summary())
 
 if __name__ == '__main__':
     load_dotenv()
-    main('FILENAME')
\ No newline at end of file
+    main(sys.argv[1] if len(sys.argv) > 1 else 'FILENAME')
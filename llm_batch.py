@@ -0,0 +1,297 @@
+import io
+import os
+import json
+import time
+
+# Batch-submission mode for the evaluation runners. Prompts are serialized into
+# provider batch files, submitted once, polled until the provider finishes,
+# and the answers are joined back onto their rows by custom id. At temperature
+# 0 with no latency requirement this gets batch pricing and sidesteps
+# per-minute rate limits. Handles of submitted batches are kept in a small
+# state file so a restarted runner resumes polling instead of resubmitting.
+# Every pass has a kind ("row" for one question per request, "pack" for
+# packed questions) that prefixes its custom ids and is recorded with its
+# handles, so a resumed pass never reads answers meant for another.
+
+DONE, PENDING, FAILED = "completed", "pending", "failed"
+ROW, PACK = "row", "pack"
+
+
+def make_custom_id(kind, row_id):
+    """Custom id of a request: "row:12", or "pack:3-5-9" for a pack of rows."""
+    key = "-".join(map(str, row_id)) if kind == PACK else str(row_id)
+    return f"{kind}:{key}"
+
+
+def parse_custom_id(kind, custom_id):
+    """Row id (a tuple for packs) of a custom id made for `kind`, or None for any other id."""
+    prefix, _, key = str(custom_id).partition(":")
+    if prefix != kind:
+        return None
+    try:
+        parts = tuple(int(part) for part in key.split("-"))
+    except ValueError:
+        return None
+    if kind == PACK:
+        return parts
+    return parts[0] if len(parts) == 1 else None
+
+
+def batch_lines(requests, model, temperature=None, max_tokens=None,
+                endpoint="/v1/chat/completions"):
+    """
+    Serialize (custom_id, prompt) pairs into OpenAI-style batch JSONL lines
+    (also accepted by Together).
+    """
+    for custom_id, prompt in requests:
+        body = {"model": model, "messages": [{"role": "user", "content": prompt}]}
+        if temperature is not None:
+            body["temperature"] = temperature
+        if max_tokens is not None:
+            body["max_tokens"] = max_tokens
+        yield json.dumps({"custom_id": custom_id, "method": "POST",
+                          "url": endpoint, "body": body}, ensure_ascii=False)
+
+
+def parse_output_lines(text):
+    """
+    Parse an OpenAI-style batch output file into ({custom_id: content},
+    {custom_id: error message}).
+    """
+    results, errors = {}, {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        custom_id = record.get("custom_id")
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        if record.get("error") or response.get("status_code", 200) >= 400 or "choices" not in body:
+            errors[custom_id] = str(record.get("error") or body.get("error") or body)
+            continue
+        results[custom_id] = body["choices"][0]["message"]["content"]
+    return results, errors
+
+
+class OpenAIBatchBackend:
+    """
+    OpenAI Batch API through the `openai` SDK. Pointing the client's
+    base_url at llm_fake_server.py runs the same flow offline.
+    """
+
+    def __init__(self, client, model, temperature=None, max_tokens=None,
+                 postprocess=None, endpoint="/v1/chat/completions"):
+        self.client = client
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.postprocess = postprocess
+        self.endpoint = endpoint
+
+    def submit(self, requests):
+        payload = "\n".join(batch_lines(requests, self.model, self.temperature,
+                                        self.max_tokens, self.endpoint)) + "\n"
+        upload = self.client.files.create(
+            file=("batch.jsonl", io.BytesIO(payload.encode("utf-8"))), purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=upload.id, endpoint=self.endpoint, completion_window="24h"
+        )
+        return {"id": batch.id}
+
+    def status(self, handle):
+        status = self.client.batches.retrieve(handle["id"]).status
+        if status == "completed":
+            return DONE
+        if status in ("failed", "expired", "cancelled"):
+            return FAILED
+        return PENDING
+
+    def results(self, handle):
+        batch = self.client.batches.retrieve(handle["id"])
+        results, errors = {}, {}
+        if batch.output_file_id:
+            results, errors = parse_output_lines(self.client.files.content(batch.output_file_id).text)
+        if batch.error_file_id:
+            errors.update(parse_output_lines(self.client.files.content(batch.error_file_id).text)[1])
+        return results, errors
+
+
+class TogetherBatchBackend(OpenAIBatchBackend):
+    """Together Batch API through the `together` SDK (same JSONL format)."""
+
+    def submit(self, requests):
+        path = f"together_batch_{int(time.time() * 1000)}.jsonl"
+        with open(path, "w", encoding="utf-8") as f:
+            for line in batch_lines(requests, self.model, self.temperature,
+                                    self.max_tokens, self.endpoint):
+                f.write(line + "\n")
+        try:
+            upload = self.client.files.upload(file=path, purpose="batch-api")
+        finally:
+            os.remove(path)
+        batch = self.client.batches.create_batch(upload.id, endpoint=self.endpoint)
+        return {"id": batch.id}
+
+    def _status(self, handle):
+        batch = self.client.batches.get_batch(handle["id"])
+        return batch, str(getattr(batch.status, "value", batch.status)).lower()
+
+    def status(self, handle):
+        _, status = self._status(handle)
+        if status == "completed":
+            return DONE
+        if status in ("failed", "expired", "cancelled"):
+            return FAILED
+        return PENDING
+
+    def results(self, handle):
+        batch, _ = self._status(handle)
+        results, errors = {}, {}
+        for file_id, is_error in ((batch.output_file_id, False), (getattr(batch, "error_file_id", None), True)):
+            if not file_id:
+                continue
+            path = f"together_{file_id}.jsonl"
+            self.client.files.retrieve_content(file_id, output=path)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    ok, failed = parse_output_lines(f.read())
+            finally:
+                os.remove(path)
+            errors.update(failed)
+            if not is_error:
+                results.update(ok)
+        return results, errors
+
+
+class GeminiBatchBackend:
+    """Gemini batch mode through `google.genai` with inlined requests."""
+
+    def __init__(self, client, model, postprocess=None):
+        self.client = client
+        self.model = model
+        self.temperature = None
+        self.postprocess = postprocess
+
+    def submit(self, requests):
+        ids = [custom_id for custom_id, _ in requests]
+        src = [{"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+               for _, prompt in requests]
+        job = self.client.batches.create(model=self.model, src=src)
+        # Inlined responses come back in request order
+        return {"id": job.name, "custom_ids": ids}
+
+    def status(self, handle):
+        state = self.client.batches.get(name=handle["id"]).state.name
+        if state == "JOB_STATE_SUCCEEDED":
+            return DONE
+        if state in ("JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"):
+            return FAILED
+        return PENDING
+
+    def results(self, handle):
+        job = self.client.batches.get(name=handle["id"])
+        results, errors = {}, {}
+        for custom_id, item in zip(handle["custom_ids"], job.dest.inlined_responses):
+            if item.error or item.response is None:
+                errors[custom_id] = str(item.error)
+            else:
+                results[custom_id] = item.response.text
+        return results, errors
+
+
+def _load_state(path):
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def _save_state(path, state):
+    if not path:
+        return
+    if not state:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def evaluate_batch(rows, backends, on_result, state_path=None, cache=None, poll_seconds=30, kind=ROW):
+    """
+    Batch counterpart of llm_engine.evaluate. `rows` yields (row_id,
+    {provider_name: prompt}); `backends` maps provider names to batch
+    backends. Cached answers are returned immediately, the rest are
+    submitted as one batch per provider, and `on_result(row_id,
+    provider_name, response)` is called for every answer once its batch
+    finishes. Failed items are reported and left for a later run.
+    Handles in `state_path` submitted by a pass of another `kind` are
+    left alone.
+    """
+    state = _load_state(state_path)
+    # Handles of another pass (or from before kinds were recorded) stay in
+    # the file untouched, and block a new batch for their provider
+    foreign = {name: handle for name, handle in state.items() if handle.get("kind") != kind}
+    for name, handle in foreign.items():
+        print(f"⚠️ {name} batch {handle['id']} in {state_path} is not a {kind} batch; "
+              f"skipping {name} (finish its own pass or delete the file)")
+    state = {name: handle for name, handle in state.items() if name not in foreign}
+
+    def save():
+        _save_state(state_path, {**foreign, **state})
+
+    requests = {name: [] for name in backends if name not in foreign}
+    prompts = {}
+    for row_id, row_prompts in rows:
+        for name, prompt in row_prompts.items():
+            if name in foreign:
+                continue
+            backend = backends[name]
+            if cache is not None:
+                cached = cache.get(name, backend.model, prompt, backend.temperature)
+                if cached is not None:
+                    on_result(row_id, name, cached)
+                    continue
+            custom_id = make_custom_id(kind, row_id)
+            prompts[name, custom_id] = prompt
+            requests[name].append((custom_id, prompt))
+
+    # Submit every provider that has work and no batch already in flight
+    for name, reqs in requests.items():
+        if name in state or not reqs:
+            continue
+        state[name] = dict(backends[name].submit(reqs), kind=kind)
+        save()
+        print(f"📤 Submitted {len(reqs)} {name} requests as batch {state[name]['id']}")
+
+    while state:
+        for name in list(state):
+            backend, handle = backends[name], state[name]
+            status = backend.status(handle)
+            if status == PENDING:
+                continue
+            if status == FAILED:
+                print(f"❌ {name} batch {handle['id']} failed; its rows will be retried next run")
+            else:
+                results, errors = backend.results(handle)
+                unknown = 0
+                for custom_id, text in results.items():
+                    row_id = parse_custom_id(kind, custom_id)
+                    if row_id is None:
+                        unknown += 1
+                        continue
+                    if backend.postprocess:
+                        text = backend.postprocess(text)
+                    prompt = prompts.get((name, custom_id))
+                    if cache is not None and prompt is not None:
+                        cache.put(name, backend.model, prompt, text, backend.temperature)
+                    on_result(row_id, name, text)
+                print(f"📥 {name} batch {handle['id']}: {len(results) - unknown} answers, {len(errors)} failed"
+                      + (f", {unknown} with unknown ids skipped" if unknown else ""))
+            del state[name]
+            save()
+        if state:
+            time.sleep(poll_seconds)
@@ -0,0 +1,125 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+# Persistent, content-addressed cache of LLM responses shared by both runners.
+# Entries are keyed by hash(provider, model, prompt, temperature), so re-running
+# a language, resuming after a crash or re-parsing with a new
+# extract_answer_and_reasoning costs no API calls for prompts already sent.
+
+
+def cache_key(provider, model, prompt, temperature=None):
+    """Content hash identifying one request."""
+    payload = json.dumps([provider, model, prompt, temperature], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed response store. WAL mode and a busy timeout make it safe
+    to share between threads and between runner processes. Once the stored
+    responses exceed `max_bytes`, the least recently used ones are evicted
+    down to `low_water` × `max_bytes`.
+    """
+
+    SIZE_CHECK_EVERY = 100  # puts between size checks
+
+    def __init__(self, path="llm_cache.sqlite", max_bytes=1 << 30, low_water=0.9):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, provider TEXT, model TEXT, response TEXT,"
+            " size INTEGER, created REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_used)")
+        self._conn.commit()
+
+    def get(self, provider, model, prompt, temperature=None):
+        """Return the cached response, or None on a miss."""
+        key = cache_key(provider, model, prompt, temperature)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def put(self, provider, model, prompt, response, temperature=None):
+        """
+        Store a response. Failed calls (the runners' "ERROR: ..." strings)
+        are never cached so they are retried next time.
+        """
+        if response is None or str(response).startswith("ERROR:"):
+            return
+        key = cache_key(provider, model, prompt, temperature)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, response, len(response.encode('utf-8')), now, now),
+            )
+            self._conn.commit()
+            self.writes += 1
+            if self.writes % self.SIZE_CHECK_EVERY == 0:
+                self._evict()
+
+    def size_bytes(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _evict(self):
+        # Caller holds the lock
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = total - self.max_bytes * self.low_water
+        victims = []
+        freed = 0
+        cursor = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used")
+        for key, size in cursor:
+            if freed >= target:
+                break
+            victims.append((key,))
+            freed += size
+        cursor.close()
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._conn.commit()
+        self.evictions += len(victims)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'writes': self.writes,
+            'evictions': self.evictions,
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"🗄️ Cache: {s['hits']} hits, {s['misses']} misses "
+                f"({s['hit_rate']:.1%} hit rate), {s['writes']} writes, {s['evictions']} evicted")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,85 @@
+import json
+import math
+
+# Single-token constrained answers for the non-CoT runner. Generation is cut to
+# one token, steered onto "A"/"B" with a logit bias where the provider allows
+# it, and the top log-probabilities of that token are kept so every answer
+# comes with P(A)/P(B) at no extra request.
+
+# "A" and "B" are single tokens with the same ids in cl100k/o200k (GPT-4
+# family) and in the Llama 3 tokenizer.
+AB_TOKEN_IDS = {"A": 32, "B": 33}
+AB_LOGIT_BIAS = {str(token_id): 100 for token_id in AB_TOKEN_IDS.values()}
+TOP_LOGPROBS = 5
+
+# Gemini has no logit bias; an enum response schema restricts it to A/B instead
+GEMINI_AB_CONFIG = {
+    "response_mime_type": "text/x.enum",
+    "response_schema": {"type": "STRING", "enum": ["A", "B"]},
+    "max_output_tokens": 1,
+}
+
+
+def _field(obj, name):
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def first_token_logprobs(logprobs):
+    """
+    {token: logprob} for the first generated token, from an OpenAI
+    (`content[0].top_logprobs`) or Together (`tokens` / `token_logprobs` /
+    `top_logprobs`) logprobs object.
+    """
+    if logprobs is None:
+        return {}
+    content = _field(logprobs, "content")
+    if content:
+        first = content[0]
+        found = {_field(t, "token"): _field(t, "logprob") for t in _field(first, "top_logprobs") or []}
+        found.setdefault(_field(first, "token"), _field(first, "logprob"))
+        return found
+    found = {}
+    top = _field(logprobs, "top_logprobs")
+    if top and isinstance(top[0], dict):
+        found.update(top[0])
+    tokens, token_logprobs = _field(logprobs, "tokens"), _field(logprobs, "token_logprobs")
+    if tokens and token_logprobs:
+        found.setdefault(tokens[0], token_logprobs[0])
+    return found
+
+
+def letter_probabilities(logprobs):
+    """
+    (P(A), P(B)) renormalized over the two letters, or (None, None) when
+    neither letter appears. If only one letter is reported, the other gets
+    the remaining mass.
+    """
+    mass = {"A": 0.0, "B": 0.0}
+    seen = set()
+    for token, logprob in first_token_logprobs(logprobs).items():
+        letter = (token or "").strip().upper()
+        if letter in mass and logprob is not None:
+            mass[letter] += math.exp(logprob)
+            seen.add(letter)
+    if not seen:
+        return None, None
+    if len(seen) == 1:
+        (letter,) = seen
+        p = min(mass[letter], 1.0)
+        return (p, 1.0 - p) if letter == "A" else (1.0 - p, p)
+    total = mass["A"] + mass["B"]
+    return mass["A"] / total, mass["B"] / total
+
+
+def encode_scored(answer, p_a=None, p_b=None):
+    """Pack an answer and its letter probabilities into one cacheable string."""
+    return json.dumps({"answer": answer, "p_A": p_a, "p_B": p_b})
+
+
+def decode_scored(response):
+    """Inverse of encode_scored; plain-text responses come back without probabilities."""
+    try:
+        scored = json.loads(response)
+        return scored["answer"], scored["p_A"], scored["p_B"]
+    except (TypeError, ValueError, KeyError):
+        return response, None, None
@@ -0,0 +1,416 @@
+import re
+import time
+import random
+import asyncio
+from collections import deque
+
+# Concurrent evaluation engine shared by gpt-gemini-llama.py and
+# gpt-gemini-llama-COT.py. Every row fans out to all providers at once; each
+# provider keeps a bounded number of requests in flight under its own
+# requests/min and tokens/min budget, and finished rows are handed back to the
+# runner strictly in row order. Rate-limit and overload responses (429/503)
+# shrink a provider's in-flight limit AIMD-style and are retried with jittered
+# exponential backoff that honours Retry-After; slow calls can be hedged with a
+# duplicate request once they run past a latency percentile. A call that still
+# fails is recorded for its (row, provider) cell and the run carries on.
+
+THROTTLE_STATUSES = {429, 503}
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+FATAL_STATUSES = {401, 403}  # Bad or missing credentials fail every call alike
+_FAILED = object()  # Stands in for the response of a failed cell
+
+
+def estimate_tokens(text):
+    """Rough token count (≈ 4 characters per token) used for tokens/min budgeting."""
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """
+    Sliding 60-second window over requests and tokens. `rpm` / `tpm`
+    of None means unlimited.
+    """
+
+    def __init__(self, rpm=None, tpm=None, window=60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self._events = deque()  # (timestamp, tokens)
+        self._tokens = 0
+        self._lock = None
+        self._loop = None
+
+    async def acquire(self, tokens=0):
+        # asyncio primitives belong to one loop; rebuild them for each evaluate()
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._events and now - self._events[0][0] >= self.window:
+                    self._tokens -= self._events.popleft()[1]
+                requests_ok = self.rpm is None or len(self._events) < self.rpm
+                # A single oversized request is let through once the window is empty
+                tokens_ok = (self.tpm is None or not self._events
+                             or self._tokens + tokens <= self.tpm)
+                if requests_ok and tokens_ok:
+                    self._events.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                await asyncio.sleep(self._events[0][0] + self.window - now)
+
+
+def error_status(exc):
+    """HTTP status carried by an SDK exception (OpenAI, Together, google-genai), or None."""
+    for attr in ("status_code", "http_status", "code", "status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    if isinstance(value, int):
+        return value
+    text = str(exc).upper()
+    if "RESOURCE_EXHAUSTED" in text or "RATE LIMIT" in text:
+        return 429
+    if "UNAVAILABLE" in text or "OVERLOADED" in text:
+        return 503
+    match = re.search(r"\b(408|409|429|500|502|503|504)\b", text)
+    return int(match.group(1)) if match else None
+
+
+def is_retryable(exc, status=None):
+    """Transient failures: throttling, server errors, timeouts and dropped connections."""
+    if status in RETRY_STATUSES:
+        return True
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    name = type(exc).__name__
+    return status is None and ("Timeout" in name or "Connection" in name)
+
+
+def is_fatal(exc, status=None):
+    """Errors that would fail every other call too, so the run stops: authentication and permission."""
+    status = error_status(exc) if status is None else status
+    name = type(exc).__name__
+    return status in FATAL_STATUSES or "Authentication" in name or "PermissionDenied" in name
+
+
+def retry_after_seconds(exc):
+    """Server-requested wait from Retry-After headers or a Gemini retryDelay, or None."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or getattr(exc, "headers", None)
+    if headers:
+        try:
+            if headers.get("retry-after-ms") is not None:
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after") is not None:
+                return float(headers["retry-after"])
+        except (TypeError, ValueError):
+            pass  # an HTTP date; fall back to backoff
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(exc))
+    return float(match.group(1)) if match else None
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0, retry_after=None, rng=random):
+    """
+    Full-jitter exponential backoff: uniform in [0, min(cap, base·2^attempt)],
+    but never shorter than a server-provided `retry_after`.
+    """
+    delay = rng.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after) if retry_after is not None else delay
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD in-flight limit: every success raises the limit by `increase /
+    limit` (about +1 per limit's worth of successes), every throttle
+    multiplies it by `decrease`. Throttles from requests started before the
+    last decrease are ignored, so one burst of 429s halves the limit once.
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, increase=1.0, decrease=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum or 4 * initial
+        self.increase = increase
+        self.decrease = decrease
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._cond = None
+        self._loop = None
+
+    def _condition(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._cond, self._loop = asyncio.Condition(), loop
+            self.in_flight = 0
+        return self._cond
+
+    async def acquire(self):
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            cond.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+
+    def on_throttle(self, started_at):
+        if started_at < self._last_decrease:
+            return False
+        self.limit = max(self.minimum, self.limit * self.decrease)
+        self._last_decrease = time.monotonic()
+        return True
+
+
+class LatencyTracker:
+    """Recent successful call latencies, for picking the hedging delay."""
+
+    def __init__(self, size=200, min_samples=20):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def quantile(self, q):
+        """The q-th latency quantile, or None until `min_samples` calls have finished."""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Provider:
+    """
+    One model endpoint: an async `ask(prompt)` plus its concurrency and
+    rate limits. `completion_tokens` is the expected reply size, counted
+    against `tpm` together with the prompt. With a `cache` (see
+    llm_cache.py), responses already stored for (name, model, prompt,
+    temperature) are returned without calling `ask`.
+
+    `max_in_flight` is the starting point of an AIMD limit that grows on
+    success up to `max_limit` and halves on 429/503. Transient errors are
+    retried up to `max_retries` times with jittered exponential backoff, and
+    a Retry-After pauses the whole provider. With `hedge_quantile` set, a call
+    still running past that latency quantile gets a duplicate request and the
+    first answer wins; hedges count against the rate limit, not the
+    in-flight limit. With `metrics` (see llm_metrics.py), every call's
+    latency, queue wait, retries and tokens are recorded.
+    """
+
+    def __init__(self, name, ask, max_in_flight=4, rpm=None, tpm=None, completion_tokens=16,
+                 model=None, temperature=None, cache=None, max_limit=None, max_retries=6,
+                 backoff_base=1.0, backoff_cap=60.0, hedge_quantile=None, metrics=None):
+        self.name = name
+        self.ask = ask
+        self.max_in_flight = max_in_flight
+        self.completion_tokens = completion_tokens
+        self.model = model
+        self.temperature = temperature
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge_quantile = hedge_quantile
+        self.metrics = metrics
+        self.limiter = RateLimiter(rpm, tpm)
+        self.concurrency = AdaptiveConcurrency(max_in_flight, maximum=max_limit)
+        self.latency = LatencyTracker()
+        self.retries = 0
+        self.throttles = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._paused_until = 0.0
+
+    async def __call__(self, prompt):
+        call = self.metrics.begin(self.name) if self.metrics is not None else {}
+        try:
+            response = await self._call(prompt, call)
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.end(call, prompt, error=e)
+            raise
+        if self.metrics is not None:
+            self.metrics.end(call, prompt, response)
+        return response
+
+    async def _call(self, prompt, call):
+        if self.cache is not None:
+            cached = self.cache.get(self.name, self.model, prompt, self.temperature)
+            if cached is not None:
+                call["cached"] = True
+                return cached
+        tokens = estimate_tokens(prompt) + self.completion_tokens
+        attempt = 0
+        call["queue_wait"] = 0.0
+        while True:
+            queued = time.monotonic()
+            pause = self._paused_until - queued
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.concurrency.acquire()
+            started = time.monotonic()
+            try:
+                await self.limiter.acquire(tokens)
+                sent = time.monotonic()
+                call["queue_wait"] += sent - queued
+                response = await self._ask_hedged(prompt, tokens, call)
+                call["latency"] = time.monotonic() - sent
+                self.concurrency.on_success()
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, started)
+            finally:
+                await self.concurrency.release()
+            await asyncio.sleep(delay)
+            attempt += 1
+            call["retries"] = attempt
+        if self.cache is not None:
+            self.cache.put(self.name, self.model, prompt, response, self.temperature)
+        return response
+
+    def _retry_delay(self, exc, attempt, started):
+        # Re-raises `exc` unless it is transient and retries remain
+        status = error_status(exc)
+        if status in THROTTLE_STATUSES:
+            self.throttles += 1
+            self.concurrency.on_throttle(started)
+        if not is_retryable(exc, status) or attempt >= self.max_retries:
+            raise exc
+        retry_after = retry_after_seconds(exc)
+        if retry_after is not None:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, retry_after)
+        self.retries += 1
+        print(f"⏳ {self.name}: {status or type(exc).__name__} (attempt {attempt + 1}/{self.max_retries}), "
+              f"retrying in {delay:.1f}s with {int(self.concurrency.limit)} in flight")
+        return delay
+
+    async def _timed_ask(self, prompt):
+        start = time.monotonic()
+        response = await self.ask(prompt)
+        self.latency.record(time.monotonic() - start)
+        return response
+
+    async def _ask_hedged(self, prompt, tokens, call):
+        hedge_after = self.latency.quantile(self.hedge_quantile) if self.hedge_quantile else None
+        if hedge_after is None:
+            return await self._timed_ask(prompt)
+        primary = asyncio.ensure_future(self._timed_ask(prompt))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                await self.limiter.acquire(tokens)
+                self.hedges += 1
+                call["hedged"] = True
+                tasks.append(asyncio.ensure_future(self._timed_ask(prompt)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.hedge_wins += task is not primary
+                        return task.result()
+            return primary.result()  # every attempt failed: raise the primary's error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def summary(self):
+        return (f"📶 {self.name}: in-flight limit {self.concurrency.limit:.1f}, {self.retries} retries, "
+                f"{self.throttles} throttled, {self.hedges} hedged ({self.hedge_wins} won)")
+
+
+async def run_rows(rows, providers, on_row, window=None, on_result=None, on_error=None):
+    """
+    Evaluate `rows`, an iterable of (row_id, {provider_name: prompt}), with
+    all providers concurrently. `on_row(row_id, {provider_name: response})`
+    is called in the order rows were given; `on_result(row_id, provider_name,
+    response)`, if given, is called as soon as each single response arrives.
+    At most `window` rows are outstanding at once (default: 2× the total
+    ceiling of the adaptive in-flight limits).
+
+    A provider call that fails for good (a non-retryable error such as a
+    400, or a transient one that ran out of retries) fails only its cell:
+    it is printed, passed to `on_error(row_id, provider_name, exc)`, and
+    left out of that row's responses, and the run carries on. Only
+    authentication/permission errors (see is_fatal) and exceptions raised
+    by the callbacks cancel the run; the first of them is raised.
+    """
+    providers = {p.name: p for p in providers}
+    window = asyncio.Semaphore(window or 2 * sum(p.concurrency.maximum for p in providers.values()))
+    finished = {}
+    next_seq = 0
+    tasks = set()
+    failure = None
+
+    def flush():
+        nonlocal next_seq
+        while next_seq in finished:
+            row_id, results = finished.pop(next_seq)
+            on_row(row_id, results)
+            next_seq += 1
+
+    async def ask(row_id, name, prompt):
+        try:
+            response = await providers[name](prompt)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if is_fatal(e):
+                raise
+            print(f"❌ {name}: row {row_id} failed and is left for the next run: {type(e).__name__}: {e}")
+            if on_error is not None:
+                on_error(row_id, name, e)
+            return _FAILED
+        if on_result is not None:
+            on_result(row_id, name, response)
+        return response
+
+    async def run_row(seq, row_id, prompts):
+        nonlocal failure
+        try:
+            names = list(prompts)
+            responses = await asyncio.gather(*(ask(row_id, n, prompts[n]) for n in names))
+            finished[seq] = (row_id, {n: r for n, r in zip(names, responses) if r is not _FAILED})
+            flush()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if failure is None:
+                failure = e
+                for task in list(tasks):
+                    if task is not asyncio.current_task():
+                        task.cancel()
+        finally:
+            window.release()
+
+    for seq, (row_id, prompts) in enumerate(rows):
+        await window.acquire()
+        if failure is not None:
+            break
+        task = asyncio.create_task(run_row(seq, row_id, prompts))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if failure is not None:
+        raise failure
+
+
+def evaluate(rows, providers, on_row, window=None, on_result=None, on_error=None):
+    """Synchronous wrapper around run_rows for the runner scripts."""
+    asyncio.run(run_rows(rows, providers, on_row, window, on_result, on_error))
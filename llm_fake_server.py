@@ -0,0 +1,403 @@
+"""
+Local OpenAI / Together / Gemini stand-in for offline runs of the evaluation runners.
+
+Serves /v1/chat/completions (OpenAI), /together/v1/chat/completions (Together
+logprobs format), /v1beta/models/<model>:generateContent and
+:streamGenerateContent (Gemini), plus the Files and Batches endpoints used by
+llm_batch.py. Every prompt is answered deterministically (a hash of the prompt
+picks A or B; CoT prompts get a line of reasoning before the letter and
+packed multi-question prompts get one numbered answer per question).
+Responses can be delayed by a latency distribution and replaced by 429/503
+errors at a given rate (seeded), per route; GET /stats counts what was served.
+
+    python llm_fake_server.py --port 8765 --latency lognormal:0.4,0.5 --error-rate 429=0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 \
+    TOGETHER_BASE_URL=http://127.0.0.1:8765/together/v1 \
+    NSP_GEMINI_BASE_URL=http://127.0.0.1:8765 python nsp.py run questions.csv
+    NSP_BATCH_BASE_URL=http://127.0.0.1:8765/v1 python gpt-gemini-llama.py questions.csv
+"""
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SINGLE_LETTER_HINT = "Only reply with a single letter"
+ROUTES = ("openai", "together", "gemini")
+GEMINI_ROUTE = re.compile(r"/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)")
+# Latency distributions (seconds) and their parameters
+LATENCY_KINDS = {
+    "fixed": (1, lambda rng, s: s),
+    "uniform": (2, lambda rng, lo, hi: rng.uniform(lo, hi)),
+    "exp": (1, lambda rng, mean: rng.expovariate(1 / mean)),
+    "lognormal": (2, lambda rng, median, sigma: rng.lognormvariate(math.log(median), sigma)),
+}
+
+
+def fake_answer(prompt):
+    """
+    Deterministic reply for a prompt: a bare letter, reasoning + letter for
+    CoT prompts, or one numbered line per question for packed prompts.
+    """
+    digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+    packed = re.findall(r"^Question (\d+) \(context", prompt, re.M)
+    if packed:
+        return "\n".join(f"{n}: {'AB'[digest[i % len(digest)] % 2]}" for i, n in enumerate(packed))
+    letter = "AB"[digest[0] % 2]
+    if SINGLE_LETTER_HINT in prompt:
+        return letter
+    return f"Option {letter} continues the story most naturally.\n{letter}"
+
+
+def fake_logprobs(prompt, top=5):
+    """OpenAI-style logprobs for a one-token A/B answer with a prompt-dependent P(A)."""
+    p_a = 0.05 + 0.9 * hashlib.sha256(prompt.encode("utf-8")).digest()[1] / 255
+    top_tokens = sorted([("A", p_a), ("B", 1 - p_a)], key=lambda t: -t[1])
+    entries = [{"token": t, "logprob": math.log(p), "bytes": list(t.encode())} for t, p in top_tokens]
+    return {"content": [dict(entries[0], top_logprobs=entries[:max(top, 1)])]}
+
+
+def together_logprobs(logprobs):
+    """The same first-token logprobs in Together's tokens / token_logprobs / top_logprobs form."""
+    first = logprobs["content"][0]
+    return {"tokens": [first["token"]], "token_logprobs": [first["logprob"]],
+            "top_logprobs": [{t["token"]: t["logprob"] for t in first["top_logprobs"]}]}
+
+
+def parse_latency(spec):
+    """
+    Latency sampler for a spec such as "fixed:0.2", "uniform:0.1,0.5",
+    "exp:0.3" (mean) or "lognormal:0.4,0.5" (median, sigma); all in
+    seconds. Returns a function of a random.Random giving one delay.
+    """
+    kind, _, params = spec.partition(":")
+    if kind not in LATENCY_KINDS:
+        raise ValueError(f"latency kind must be one of {', '.join(LATENCY_KINDS)}, got {kind!r}")
+    arity, sample = LATENCY_KINDS[kind]
+    values = [float(v) for v in params.split(",")] if params else []
+    if len(values) != arity:
+        raise ValueError(f"{kind} latency takes {arity} parameter(s), got {spec!r}")
+    return lambda rng: max(0.0, sample(rng, *values))
+
+
+def chat_completion(body, route="openai"):
+    prompt = body["messages"][-1]["content"]
+    logprobs = None
+    if body.get("max_tokens") == 1 and body.get("logprobs"):
+        # Constrained single-token answer: the likelier letter plus its logprobs
+        top = body.get("top_logprobs") or body["logprobs"]
+        logprobs = fake_logprobs(prompt, top if type(top) is int else 5)
+        content = logprobs["content"][0]["token"]
+        if route == "together":
+            logprobs = together_logprobs(logprobs)
+    else:
+        content = fake_answer(prompt)
+    prompt_tokens = len(prompt) // 4 + 1
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "id": f"chatcmpl-{hashlib.md5(prompt.encode('utf-8')).hexdigest()[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "finish_reason": "stop", "logprobs": logprobs,
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def gemini_response(body, model):
+    """generateContent reply in Gemini's REST shape, answering the last user turn."""
+    prompt = "".join(part.get("text", "") for part in body["contents"][-1]["parts"])
+    content = fake_answer(prompt)
+    prompt_tokens = len(prompt) // 4 + 1
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": content}]},
+                        "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens,
+                          "totalTokenCount": prompt_tokens + completion_tokens},
+        "modelVersion": model,
+    }
+
+
+def error_body(route, status, retry_after):
+    """A 429/503 error body as the provider of `route` would send it."""
+    if route == "gemini":
+        body = {"code": status, "message": "Fake server: injected error",
+                "status": "RESOURCE_EXHAUSTED" if status == 429 else "UNAVAILABLE"}
+        if status == 429:
+            body["details"] = [{"@type": "type.googleapis.com/google.rpc.RetryInfo",
+                                "retryDelay": f"{retry_after:g}s"}]
+        return {"error": body}
+    kind = "rate_limit_exceeded" if status == 429 else "service_unavailable"
+    return {"error": {"message": f"Fake server: injected {status}", "type": kind, "code": kind}}
+
+
+class FakeState:
+    """
+    In-memory files and batches shared by all request handlers, plus the
+    per-route latency samplers, error rates and request counts.
+    """
+
+    def __init__(self, batch_delay=1.0, latency=None, error_rates=None, retry_after=1.0,
+                 chunk_delay=0.0, seed=0):
+        self.batch_delay = batch_delay
+        # {route or "*": sampler}; "*" applies to routes without their own
+        self.latency = {route: parse_latency(spec) if isinstance(spec, str) else spec
+                        for route, spec in (latency or {}).items()}
+        self.error_rates = dict(error_rates or {})  # {status: probability}
+        self.retry_after = retry_after
+        self.chunk_delay = chunk_delay
+        self.rng = random.Random(seed)
+        self.stats = {route: Counter() for route in ROUTES}
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+        self._next = 0
+
+    def draw(self, route):
+        """(delay in seconds, injected error status or None) for one request."""
+        sampler = self.latency.get(route, self.latency.get("*"))
+        with self.lock:
+            delay = sampler(self.rng) if sampler else 0.0
+            roll = self.rng.random()
+            status = None
+            for code, rate in sorted(self.error_rates.items()):
+                if roll < rate:
+                    status = code
+                    break
+                roll -= rate
+            self.stats[route]["requests"] += 1
+            self.stats[route][str(status or 200)] += 1
+        return delay, status
+
+    def new_id(self, prefix):
+        with self.lock:
+            self._next += 1
+            return f"{prefix}-{self._next}"
+
+    def add_file(self, content, filename, purpose):
+        file_id = self.new_id("file")
+        self.files[file_id] = {
+            "meta": {"id": file_id, "object": "file", "bytes": len(content),
+                     "created_at": int(time.time()), "filename": filename,
+                     "purpose": purpose, "status": "processed"},
+            "content": content,
+        }
+        return self.files[file_id]["meta"]
+
+    def add_batch(self, input_file_id, endpoint, completion_window):
+        batch_id = self.new_id("batch")
+        lines = self.files[input_file_id]["content"].decode("utf-8").splitlines()
+        batch = {"id": batch_id, "object": "batch", "endpoint": endpoint,
+                 "input_file_id": input_file_id, "completion_window": completion_window,
+                 "status": "in_progress", "created_at": int(time.time()),
+                 "output_file_id": None, "error_file_id": None,
+                 "request_counts": {"total": len([l for l in lines if l.strip()]),
+                                    "completed": 0, "failed": 0}}
+        self.batches[batch_id] = batch
+        threading.Timer(self.batch_delay, self._finish_batch, args=(batch_id, lines)).start()
+        return batch
+
+    def _finish_batch(self, batch_id, lines):
+        output = []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            output.append(json.dumps({
+                "id": self.new_id("batch_req"),
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": chat_completion(request["body"])},
+                "error": None,
+            }, ensure_ascii=False))
+        meta = self.add_file(("\n".join(output) + "\n").encode("utf-8"), "output.jsonl", "batch_output")
+        batch = self.batches[batch_id]
+        batch["request_counts"]["completed"] = len(output)
+        batch["output_file_id"] = meta["id"]
+        batch["completed_at"] = int(time.time())
+        batch["status"] = "completed"
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, payload, status=200, raw=False, headers=None):
+            body = payload if raw else json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/octet-stream" if raw else "application/json")
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, completion, include_usage=False):
+            # Server-sent events: the reply goes out a few characters per chunk
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            content = completion["choices"][0]["message"]["content"]
+            base = {k: completion[k] for k in ("id", "created", "model")}
+            for i in range(0, len(content), 8):
+                chunk = dict(base, object="chat.completion.chunk", choices=[
+                    {"index": 0, "delta": {"content": content[i:i + 8]}, "finish_reason": None}])
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(state.chunk_delay)
+            final = dict(base, object="chat.completion.chunk",
+                         choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                final["usage"] = completion["usage"]
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self.close_connection = True
+
+        def _stream_gemini(self, response):
+            # Gemini's alt=sse stream: one GenerateContentResponse per event
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            text = response["candidates"][0]["content"]["parts"][0]["text"]
+            pieces = [text[i:i + 8] for i in range(0, len(text), 8)] or [""]
+            for n, piece in enumerate(pieces):
+                chunk = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]},
+                                         "index": 0}],
+                         "modelVersion": response["modelVersion"]}
+                if n == len(pieces) - 1:
+                    chunk["candidates"][0]["finishReason"] = "STOP"
+                    chunk["usageMetadata"] = response["usageMetadata"]
+                self.wfile.write(f"data: {json.dumps(chunk)}\r\n\r\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(state.chunk_delay)
+            self.close_connection = True
+
+        def _body(self):
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def _injected(self, route):
+            # Sleep for the route's latency; True if an error was sent instead of a reply
+            delay, status = state.draw(route)
+            if status is not None:
+                headers = {"retry-after": f"{state.retry_after:g}"} if status == 429 else None
+                self._send(error_body(route, status, state.retry_after), status=status, headers=headers)
+                return True
+            time.sleep(delay)
+            return False
+
+        def do_POST(self):
+            # A request the client gave up on (a cancelled hedge) arrives with an
+            # empty or partial body, or hangs up before the reply: drop it quietly
+            try:
+                self._post()
+            except (ValueError, ConnectionError):
+                self.close_connection = True
+
+        def _post(self):
+            gemini = GEMINI_ROUTE.search(self.path)
+            if gemini:
+                body = json.loads(self._body())
+                if self._injected("gemini"):
+                    return
+                response = gemini_response(body, gemini["model"])
+                if gemini["method"] == "streamGenerateContent":
+                    if "alt=sse" in self.path:
+                        return self._stream_gemini(response)
+                    return self._send([response])
+                return self._send(response)
+            if self.path.endswith("/chat/completions"):
+                route = "together" if self.path.startswith("/together/") else "openai"
+                body = json.loads(self._body())
+                if self._injected(route):
+                    return
+                if body.get("stream"):
+                    return self._stream(chat_completion(body, route),
+                                        (body.get("stream_options") or {}).get("include_usage", False))
+                return self._send(chat_completion(body, route))
+            if self.path.endswith("/files"):
+                header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+                message = BytesParser(policy=HTTP).parsebytes(header + self._body())
+                fields = {part.get_param("name", header="content-disposition"): part
+                          for part in message.iter_parts()}
+                upload = fields["file"]
+                purpose = fields["purpose"].get_content().strip() if "purpose" in fields else "batch"
+                return self._send(state.add_file(upload.get_payload(decode=True),
+                                                 upload.get_filename() or "upload.jsonl", purpose))
+            if self.path.endswith("/batches"):
+                body = json.loads(self._body())
+                return self._send(state.add_batch(body["input_file_id"], body["endpoint"],
+                                                  body.get("completion_window", "24h")))
+            self._send({"error": {"message": f"Unknown route {self.path}"}}, status=404)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/stats":
+                with state.lock:
+                    return self._send({route: dict(counts) for route, counts in state.stats.items()})
+            parts = self.path.rstrip("/").split("/")
+            if "batches" in parts and parts[-1] in state.batches:
+                return self._send(state.batches[parts[-1]])
+            if "files" in parts:
+                if parts[-1] == "content" and parts[-2] in state.files:
+                    return self._send(state.files[parts[-2]]["content"], raw=True)
+                if parts[-1] in state.files:
+                    return self._send(state.files[parts[-1]]["meta"])
+            self._send({"error": {"message": f"Unknown route {self.path}"}}, status=404)
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=8765, batch_delay=1.0, **options):
+    """
+    Start the stand-in server in a background thread and return it (port 0
+    picks a free one; see server.server_port). `options` go to FakeState,
+    which is kept as server.state.
+    """
+    state = FakeState(batch_delay, **options)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_route_options(values, parse_value):
+    """{"route": value} from "[ROUTE=]VALUE" strings; a bare VALUE applies to every route ("*")."""
+    options = {}
+    for item in values or []:
+        route, _, value = item.rpartition("=")
+        if route and route not in ROUTES:
+            raise ValueError(f"route must be one of {', '.join(ROUTES)}, got {route!r}")
+        options[route or "*"] = parse_value(value)
+    return options
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-delay", type=float, default=1.0,
+                        help="seconds before a submitted batch completes")
+    parser.add_argument("--latency", action="append", metavar="[ROUTE=]SPEC",
+                        help="e.g. lognormal:0.4,0.5 or gemini=uniform:0.2,1.5 (fixed / uniform / exp / lognormal)")
+    parser.add_argument("--error-rate", action="append", metavar="STATUS=RATE",
+                        help="share of chat requests answered with this status, e.g. 429=0.05 503=0.01")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="seconds advertised on 429s")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--seed", type=int, default=0, help="seeds the latency and error draws")
+    args = parser.parse_args()
+    latency = parse_route_options(args.latency, parse_latency)
+    error_rates = {int(status): float(rate) for status, _, rate in
+                   (item.partition("=") for item in args.error_rate or [])}
+    state = FakeState(args.batch_delay, latency, error_rates, args.retry_after, args.chunk_delay, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"🧪 Fake LLM server on http://{args.host}:{args.port}/v1 "
+          f"(Together: /together/v1, Gemini: http://{args.host}:{args.port})")
+    server.serve_forever()
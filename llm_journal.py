@@ -0,0 +1,100 @@
+import os
+import json
+import time
+
+# Append-only result journal for the evaluation runners. Every model answer is
+# appended as one JSON line the moment it arrives, so checkpointing costs
+# O(1) per answer instead of rewriting the whole CSV. On startup the journal
+# is replayed onto the dataframe to resume automatically, and compact() folds
+# it into the final CSV.
+
+
+class ResultJournal:
+    """
+    JSONL journal of {"row": idx, "model": name, "values": {column: value}}
+    records; a failed call is journaled with empty values and its "error". Each record is flushed to the OS immediately (a crashed process
+    loses nothing already written); fsync is batched every `fsync_every`
+    records or `fsync_interval` seconds to bound loss on power failure.
+    """
+
+    def __init__(self, path, fsync_every=32, fsync_interval=1.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def records(self):
+        """Yield every complete record in the journal, oldest first."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write
+                    continue
+
+    def replay(self, df):
+        """
+        Apply journaled values onto `df` in place (later records win).
+        Returns the number of records applied.
+        """
+        applied = 0
+        for record in self.records():
+            for col, value in record["values"].items():
+                df.at[record["row"], col] = value
+            applied += bool(record["values"])
+        return applied
+
+    def append(self, row, model, values, error=None):
+        """Record the column values one model produced for one row (or the error it failed with)."""
+        if self._file is None:
+            self._open()
+        record = {"row": int(row), "model": model, "values": values}
+        if error is not None:
+            record["error"] = error
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if (self._unsynced >= self.fsync_every
+                or time.monotonic() - self._last_sync >= self.fsync_interval):
+            self.sync()
+
+    def _open(self):
+        torn = False
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self._file = open(self.path, 'a', encoding='utf-8')
+        # Terminate a torn final line so the next record starts cleanly
+        if torn:
+            self._file.write("\n")
+
+    def sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def compact(self, df, output_csv):
+        """
+        Merge the journal into `output_csv`: replay it onto `df`, write the
+        CSV atomically, then drop the journal.
+        """
+        self.close()
+        self.replay(df)
+        tmp_path = f"{output_csv}.tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, output_csv)
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,278 @@
+import os
+import sys
+import math
+import time
+import json
+import argparse
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from nsp_columns import FEATURES, ANSWER_COL, load_columns, read_header
+
+# Live scoring of a run in progress. The scorer loads the questions' labels and
+# features once, then tails the runner's result journal, updating per-column
+# and per-feature counts in O(new records). Accuracy is reported with Wilson
+# confidence intervals, and once every interval is narrower than a target the
+# scorer can drop a stop marker that makes the runners stop queueing rows.
+
+# Per-row answer states
+UNANSWERED, WRONG, CORRECT, INVALID = -1, 0, 1, 2
+
+
+def stop_path(csv_path):
+    """Marker file that tells the runner working on `csv_path` to stop queueing rows."""
+    return f"{csv_path}.stop"
+
+
+def wilson_interval(correct, n, z):
+    """Wilson score interval for `correct` successes out of `n`; (0, 1) when n is 0."""
+    if n == 0:
+        return 0.0, 1.0
+    p = correct / n
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+class JournalTail:
+    """
+    Reads the records appended to a ResultJournal since the last poll. Only
+    complete lines are consumed, so a record being written is picked up on
+    the next poll; `reset` is set when the journal was removed or replaced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.position = 0
+        self._inode = None
+        self.reset = False
+
+    def poll(self):
+        """Return the new records (oldest first)."""
+        self.reset = False
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self.position:
+                self.reset = True  # compacted into the CSV
+            self.position, self._inode = 0, None
+            return []
+        if stat.st_ino != self._inode or stat.st_size < self.position:
+            self.reset = self._inode is not None
+            self.position, self._inode = 0, stat.st_ino
+        if stat.st_size == self.position:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self.position)
+            data = f.read(stat.st_size - self.position)
+        end = data.rfind(b"\n") + 1
+        self.position += end
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # a torn line terminated by the journal on reopen
+        return records
+
+
+class LiveScorer:
+    """
+    Running accuracy for the answer columns of one results CSV. Each
+    (row, column) keeps its current state, so a re-asked row replaces its
+    earlier answer instead of being counted twice. Intervals assume the
+    rows answered so far are a random subsample; the runners ask rows in a
+    seeded random order (ROW_ORDER_SEED) so that this holds for any file.
+    """
+
+    def __init__(self, csv_path, answer_cols=None, features=FEATURES, confidence=0.95):
+        self.csv_path = csv_path
+        self.requested_cols = answer_cols
+        self.requested_features = features
+        self.z = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+        self.load()
+
+    def load(self):
+        """(Re)build every count from the CSV as it is on disk."""
+        header = read_header(self.csv_path)
+        # Answer columns the CSV lacks (the runner adds them when it compacts
+        # its journal) start unanswered; feed() adds any others it meets
+        cols = self.requested_cols or [c for c in header if ANSWER_COL.match(c)]
+        self.features = [f for f in self.requested_features if f in header]
+        self.csv_mtime = os.path.getmtime(self.csv_path)
+        df = load_columns(self.csv_path, ['label'] + self.features + [c for c in cols if c in header])
+        self.labels = df['label'].astype(object).fillna('').str.strip().str.upper().to_numpy()
+        # Feature values as small integer codes, so per-value counts are array slots
+        self.codes, self.values = {}, {}
+        for feature in self.features:
+            codes, values = pd.factorize(df[feature], sort=True)
+            self.codes[feature], self.values[feature] = codes, values
+
+        self.columns, self.state, self.counts, self.feature_counts = [], {}, {}, {}
+        for col in cols:
+            self._add_column(col, df[col] if col in df else None)
+
+    def _add_column(self, col, answers=None):
+        # `answers` are the column's values in the CSV, if it has the column
+        state = np.full(len(self.labels), UNANSWERED, dtype=np.int8)
+        if answers is not None:
+            # all-empty answer columns are parsed as float
+            answers = answers.astype(object).fillna('').astype(str).str.strip().str.upper().to_numpy()
+            state = np.where(answers == '', UNANSWERED,
+                             np.where(~np.isin(answers, ['A', 'B']), INVALID,
+                                      (answers == self.labels).astype(np.int8))).astype(np.int8)
+        answered = state != UNANSWERED
+        self.columns.append(col)
+        self.state[col] = state
+        self.counts[col] = np.bincount(state[answered], minlength=3).astype(np.int64)  # wrong, correct, invalid
+        for feature in self.features:
+            counts = np.zeros((len(self.values[feature]), 3), dtype=np.int64)
+            np.add.at(counts, (self.codes[feature][answered], state[answered]), 1)
+            self.feature_counts[col, feature] = counts
+
+    def _classify(self, row, answer):
+        if answer is None or (isinstance(answer, float) and math.isnan(answer)):
+            return UNANSWERED
+        answer = str(answer).strip().upper()
+        if not answer:
+            return UNANSWERED
+        if answer not in ('A', 'B'):
+            return INVALID
+        return CORRECT if answer == self.labels[row] else WRONG
+
+    def update(self, row, col, answer):
+        """Set the answer of one (row, column), replacing any earlier one."""
+        new = self._classify(row, answer)
+        old = self.state[col][row]
+        if new == old:
+            return
+        for state, delta in ((old, -1), (new, 1)):
+            if state == UNANSWERED:
+                continue
+            self.counts[col][state] += delta
+            for feature in self.features:
+                self.feature_counts[col, feature][self.codes[feature][row], state] += delta
+        self.state[col][row] = new
+
+    def feed(self, records):
+        """Apply journal records; returns how many touched a scored column."""
+        applied = 0
+        for record in records:
+            for col, value in record.get("values", {}).items():
+                if col not in self.state and not self.requested_cols and ANSWER_COL.match(col):
+                    self._add_column(col)  # not in the CSV header until the journal is compacted
+                if col in self.state and 0 <= record["row"] < len(self.labels):
+                    self.update(record["row"], col, value)
+                    applied += 1
+        return applied
+
+    def stats(self, col):
+        """(answered, correct, invalid, accuracy, ci_low, ci_high) for one column."""
+        wrong, correct, invalid = (int(v) for v in self.counts[col])
+        n = wrong + correct + invalid
+        low, high = wilson_interval(correct, n, self.z)
+        return n, correct, invalid, correct / n if n else float('nan'), low, high
+
+    def feature_table(self, col, feature):
+        """Accuracy and interval per value of `feature` for one column."""
+        rows = []
+        for value, (wrong, correct, invalid) in zip(self.values[feature], self.feature_counts[col, feature]):
+            n = int(wrong + correct + invalid)
+            low, high = wilson_interval(int(correct), n, self.z)
+            rows.append({'value': value, 'n': n, 'accuracy': correct / n if n else float('nan'),
+                         'ci_low': low, 'ci_high': high})
+        return pd.DataFrame(rows)
+
+    def max_width(self):
+        return max((high - low for *_, low, high in map(self.stats, self.columns)), default=1.0)
+
+    def settled(self, target_width, min_rows=100):
+        """True once every column has `min_rows` answers and a CI narrower than `target_width`."""
+        return bool(self.columns) and all(
+            n >= min_rows and high - low <= target_width
+            for n, _, _, _, low, high in map(self.stats, self.columns)
+        )
+
+    def complete(self):
+        """True once every row of every known answer column is answered (False if none is known)."""
+        return bool(self.state) and all((state != UNANSWERED).all() for state in self.state.values())
+
+    def report(self, features=()):
+        lines = [f"📊 {os.path.basename(self.csv_path)} — {time.strftime('%H:%M:%S')}"]
+        for col in self.columns:
+            n, correct, invalid, acc, low, high = self.stats(col)
+            bad = f", {invalid} invalid" if invalid else ""
+            lines.append(f"  {col:<20} {acc:7.2%} [{low:.2%}, {high:.2%}] ±{(high - low) / 2:.2%} "
+                         f"({correct}/{n} of {len(self.labels)}{bad})")
+        for feature in features:
+            if feature not in self.features:
+                continue
+            lines.append(f"  📐 by {feature}:")
+            table = pd.DataFrame({col: self.feature_table(col, feature).set_index('value')['accuracy']
+                                  for col in self.columns})
+            lines.extend("    " + line for line in (table * 100).round(1).to_string().splitlines())
+        return "\n".join(lines)
+
+
+def watch(csv_path, journal_path=None, answer_cols=None, features=(), target_width=None,
+          min_rows=100, interval=5.0, stop=False, confidence=0.95):
+    """
+    Tail `journal_path` (the runner's journal by default) and print live
+    accuracy every `interval` seconds while it changes. Returns once the
+    intervals are narrower than `target_width` (writing the stop marker if
+    `stop`), once every row is answered, or on Ctrl+C.
+    """
+    journal_path = journal_path or f"{csv_path}.journal.jsonl"
+    scorer = LiveScorer(csv_path, answer_cols, confidence=confidence)
+    tail = JournalTail(journal_path)
+    scorer.feed(tail.poll())
+    print(scorer.report(features))
+    try:
+        while True:
+            if scorer.complete():
+                print("✅ Every row is answered.")
+                break
+            if target_width is not None and scorer.settled(target_width, min_rows):
+                print(f"🏁 Every interval is narrower than {target_width:.2%} — the result is settled.")
+                if stop:
+                    open(stop_path(csv_path), 'w').close()
+                    print(f"🛑 Wrote {stop_path(csv_path)}; the runner stops queueing rows.")
+                break
+            time.sleep(interval)
+            records = tail.poll()
+            if tail.reset or os.path.getmtime(csv_path) != scorer.csv_mtime:
+                # Journal compacted into the CSV (or a new run started): recount
+                scorer.load()
+                tail = JournalTail(journal_path)
+                records = tail.poll()
+            if scorer.feed(records) or tail.reset:
+                print(scorer.report(features))
+    except KeyboardInterrupt:
+        pass
+    print(scorer.report(features))
+    return scorer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live accuracy of an evaluation run, from its journal.")
+    parser.add_argument("csv", help="The CSV the runner is writing to")
+    parser.add_argument("--journal", help="Journal to tail (default: <csv>.journal.jsonl)")
+    parser.add_argument("--columns", nargs="+", help="Answer columns to score (default: all)")
+    parser.add_argument("--features", nargs="*", default=[], choices=FEATURES,
+                        help="Also print accuracy by these features")
+    parser.add_argument("--target-width", type=float,
+                        help="Stop once every CI is narrower than this (e.g. 0.05)")
+    parser.add_argument("--min-rows", type=int, default=100)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls")
+    parser.add_argument("--stop", action="store_true",
+                        help="Write <csv>.stop when settled, so the runner stops early")
+    args = parser.parse_args()
+    if not os.path.exists(args.csv):
+        print(f"❌ Error: File '{args.csv}' not found.")
+        sys.exit(1)
+    watch(args.csv, args.journal, args.columns, args.features, args.target_width,
+          args.min_rows, args.interval, args.stop, args.confidence)
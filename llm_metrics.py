@@ -0,0 +1,181 @@
+import json
+import time
+import contextvars
+from collections import deque
+
+from llm_engine import estimate_tokens
+
+# Per-call instrumentation for the evaluation runners. Every provider call is
+# written to a per-run JSONL metrics file (wall latency, queue wait, retries,
+# hedging, prompt/completion tokens, cost), and a rolling summary with
+# rows/min, latency percentiles per provider and projected time and cost to
+# completion is printed while the run is going.
+
+# The call record of the provider request running in the current task; the
+# ask_* functions report provider usage into it through record_usage()
+_current_call = contextvars.ContextVar("llm_metrics_call", default=None)
+
+
+def _field(obj, name):
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def usage_of(response):
+    """
+    (prompt_tokens, completion_tokens) from an OpenAI/Together `usage` or a
+    Gemini `usage_metadata` field, or None if the response carries neither.
+    """
+    usage = _field(response, "usage")
+    if usage is not None and _field(usage, "prompt_tokens") is not None:
+        return _field(usage, "prompt_tokens"), _field(usage, "completion_tokens") or 0
+    meta = _field(response, "usage_metadata")
+    if meta is not None and _field(meta, "prompt_token_count") is not None:
+        return _field(meta, "prompt_token_count"), _field(meta, "candidates_token_count") or 0
+    return None
+
+
+def record_usage(response):
+    """Add a provider response's reported token usage to the current call."""
+    call = _current_call.get()
+    usage = usage_of(response)
+    if call is None or usage is None:
+        return
+    call["prompt_tokens"] = (call.get("prompt_tokens") or 0) + usage[0]
+    call["completion_tokens"] = (call.get("completion_tokens") or 0) + usage[1]
+    call["usage_reported"] = True
+
+
+def quantile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _duration(seconds):
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+
+class RunMetrics:
+    """
+    Collects one record per provider call into `path` (JSONL) and keeps
+    rolling per-provider stats. `prices` maps provider names to USD per
+    million (prompt, completion) tokens. Set `total_rows` before the run
+    for time and cost projections; the runner calls row_done() as rows
+    finish, which prints summary() every `summary_every` seconds.
+    """
+
+    def __init__(self, path, prices=None, total_rows=None, summary_every=30.0, window=500):
+        self.path = path
+        self.prices = prices or {}
+        self.total_rows = total_rows
+        self.summary_every = summary_every
+        self.window = window
+        self.started = time.monotonic()
+        self.rows_done = 0
+        self._row_times = deque()
+        self._last_summary = self.started
+        self._providers = {}
+        self._file = None
+
+    def _stats(self, provider):
+        if provider not in self._providers:
+            self._providers[provider] = {
+                "calls": 0, "cached": 0, "errors": 0, "retries": 0, "hedged": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0,
+                "latency": deque(maxlen=self.window), "queue_wait": deque(maxlen=self.window),
+            }
+        return self._providers[provider]
+
+    def begin(self, provider):
+        """Start the record for one provider call in the current task."""
+        call = {"provider": provider, "started": time.time(), "queue_wait": 0.0, "latency": None,
+                "retries": 0, "hedged": False, "cached": False,
+                "prompt_tokens": None, "completion_tokens": None, "usage_reported": False}
+        _current_call.set(call)
+        return call
+
+    def cost(self, provider, prompt_tokens, completion_tokens):
+        price_in, price_out = self.prices.get(provider, (0.0, 0.0))
+        return (prompt_tokens * price_in + completion_tokens * price_out) / 1e6
+
+    def end(self, call, prompt, response=None, error=None):
+        """Finish a call record: fill token estimates and cost, update stats, write it out."""
+        if call["cached"]:
+            call["prompt_tokens"] = call["completion_tokens"] = 0
+        elif not call["usage_reported"]:
+            # Provider reported no usage: fall back to the ≈4 chars/token estimate
+            call["prompt_tokens"] = estimate_tokens(prompt) * (1 + call["hedged"])
+            call["completion_tokens"] = estimate_tokens(response) if response else 0
+        call["cost"] = self.cost(call["provider"], call["prompt_tokens"], call["completion_tokens"])
+        if error is not None:
+            call["error"] = f"{type(error).__name__}: {error}"
+
+        stats = self._stats(call["provider"])
+        stats["calls"] += 1
+        stats["cached"] += call["cached"]
+        stats["errors"] += error is not None
+        stats["retries"] += call["retries"]
+        stats["hedged"] += call["hedged"]
+        stats["prompt_tokens"] += call["prompt_tokens"]
+        stats["completion_tokens"] += call["completion_tokens"]
+        stats["cost"] += call["cost"]
+        if not call["cached"] and call["latency"] is not None:
+            stats["latency"].append(call["latency"])
+            stats["queue_wait"].append(call["queue_wait"])
+
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(call) + "\n")
+
+    def row_done(self, count=1):
+        """Count finished rows; prints the rolling summary every `summary_every` seconds."""
+        now = time.monotonic()
+        self.rows_done += count
+        self._row_times.append((now, count))
+        while now - self._row_times[0][0] > 60:
+            self._row_times.popleft()
+        if now - self._last_summary >= self.summary_every:
+            self._last_summary = now
+            print(self.summary())
+
+    def rows_per_minute(self):
+        """Throughput over the last minute (or since the start, if shorter)."""
+        if not self._row_times:
+            return 0.0
+        span = min(60.0, time.monotonic() - self.started)
+        return sum(count for _, count in self._row_times) / span * 60 if span > 0 else 0.0
+
+    def summary(self):
+        spent = sum(s["cost"] for s in self._providers.values())
+        rate = self.rows_per_minute()
+        lines = []
+        if self.total_rows:
+            remaining = max(self.total_rows - self.rows_done, 0)
+            eta = remaining / rate * 60 if rate else None
+            per_row = spent / self.rows_done if self.rows_done else 0.0
+            lines.append(f"📈 {self.rows_done}/{self.total_rows} rows, {rate:.1f} rows/min, "
+                         f"ETA {_duration(eta)}, spent ${spent:.2f}, "
+                         f"projected ${spent + per_row * remaining:.2f}")
+        else:
+            lines.append(f"📈 {self.rows_done} rows, {rate:.1f} rows/min, spent ${spent:.2f}")
+        for name, s in self._providers.items():
+            lat = list(s["latency"])
+            p50, p95, p99 = (quantile(lat, q) for q in (0.5, 0.95, 0.99))
+            wait = quantile(list(s["queue_wait"]), 0.5)
+            fmt = lambda v: f"{v:.2f}s" if v is not None else "-"
+            lines.append(
+                f"   {name:<7} p50 {fmt(p50)}  p95 {fmt(p95)}  p99 {fmt(p99)}  queue p50 {fmt(wait)}  "
+                f"{s['calls']} calls ({s['cached']} cached, {s['retries']} retries, {s['errors']} errors)  "
+                f"tokens {s['prompt_tokens']}/{s['completion_tokens']}  ${s['cost']:.2f}"
+            )
+        return "\n".join(lines)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
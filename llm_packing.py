@@ -0,0 +1,178 @@
+import re
+
+# Multi-question prompt packing for the evaluation runners. Questions cut from
+# the same story share most of their context (sliding windows in
+# generate_nsp_items), so a pack sends the story text once as numbered
+# segments, refers to each question's context by segment range, and asks for
+# one numbered answer per question. Anything the reply doesn't answer
+# unambiguously is left for a solo retry. A question is only packed with
+# others whose shared text shows none of its options: a later window of the
+# same story would otherwise contain its true next sentence (or distractor).
+
+MIN_OVERLAP = 20  # characters two contexts must share before they are joined
+
+PACKED_INSTRUCTION = (
+    'Reply with one line per question in the form "<question number>: <letter>", '
+    'for example "1: A". Use only the letters A or B, and answer every question.'
+)
+
+
+def _join(left, right):
+    """Join two texts that overlap at a word boundary, or return None."""
+    if right in left:
+        return left
+    if left in right:
+        return right
+    for size in range(min(len(left), len(right)) - 1, MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:size]) and right[size:size + 1] in ("", " "):
+            return left + right[size:]
+    return None
+
+
+def merge_contexts(contexts):
+    """
+    Lay out overlapping contexts as numbered segments.
+
+    Returns (excerpts, spans): `excerpts` is a list of excerpts, each a
+    list of segment strings numbered consecutively from 1 across all
+    excerpts; spans[i] is the (first, last) segment numbers that make up
+    contexts[i].
+    """
+    passages = []
+    for ctx in dict.fromkeys(contexts):
+        passages.append(ctx)
+        # Keep joining until no two passages overlap
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(passages)):
+                for j in range(len(passages)):
+                    if i == j:
+                        continue
+                    joined = _join(passages[i], passages[j])
+                    if joined is not None:
+                        passages[i] = joined
+                        del passages[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+
+    # Cut every passage wherever a context starts or ends
+    located = []
+    for ctx in contexts:
+        p = next(k for k, passage in enumerate(passages) if ctx in passage)
+        start = passages[p].index(ctx)
+        located.append((p, start, start + len(ctx)))
+
+    excerpts, starts, ends = [], {}, {}
+    number = 1
+    for p, passage in enumerate(passages):
+        cuts = sorted({0, len(passage)} | {c for q, s, e in located if q == p for c in (s, e)})
+        segments = []
+        for start, end in zip(cuts, cuts[1:]):
+            starts[p, start] = ends[p, end] = number
+            segments.append(passage[start:end].strip())
+            number += 1
+        excerpts.append(segments)
+
+    spans = [(starts[p, start], ends[p, end]) for p, start, end in located]
+    return excerpts, spans
+
+
+def leaked_options(excerpts, options):
+    """The options that appear anywhere in the excerpts' text."""
+    texts = [" ".join(segments) for segments in excerpts]
+    return [opt for opt in options if any(opt in text for text in texts)]
+
+
+def _apart(a, b):
+    """True if neither question's options appear in the other's context."""
+    (_, ctx_a, opts_a), (_, ctx_b, opts_b) = a, b
+    return not any(opt in ctx_b for opt in opts_a) and not any(opt in ctx_a for opt in opts_b)
+
+
+def plan_packs(questions, size):
+    """
+    Group one story's questions into packs of up to `size` that give no
+    answer away. `questions` is a list of (key, context, options); a
+    question joins a pack only if the pack's merged text contains none of
+    the pack's options. Yields tuples of keys, in question order; questions
+    that end up alone are not yielded (they go through the solo pass).
+    """
+    remaining = [q for q in questions if _apart(q, q)]
+    while remaining:
+        pack, rest = [remaining[0]], []
+        for q in remaining[1:]:
+            if len(pack) < size and all(_apart(q, p) for p in pack):
+                # Options can still show up where two contexts are joined
+                excerpts, _ = merge_contexts([ctx for _, ctx, _ in pack + [q]])
+                if not leaked_options(excerpts, [opt for _, _, opts in pack + [q] for opt in opts]):
+                    pack.append(q)
+                    continue
+            rest.append(q)
+        remaining = rest
+        if len(pack) > 1:
+            yield tuple(key for key, _, _ in pack)
+
+
+def build_packed_prompt(excerpts, questions, instruction=PACKED_INSTRUCTION):
+    """
+    Prompt for several questions over one story. `questions` is a list of
+    ((first, last), option_a, option_b) with segment spans from merge_contexts.
+    """
+    story = []
+    for k, segments in enumerate(excerpts):
+        if len(excerpts) > 1:
+            story.append(f"Excerpt {k + 1}:")
+        offset = sum(len(s) for s in excerpts[:k])
+        story.extend(f"[{offset + n + 1}] {segment}" for n, segment in enumerate(segments))
+        story.append("")
+
+    parts = [
+        "Read the following story text. It is split into numbered segments.\n",
+        "\n".join(story),
+        "Each question below gives a context made of consecutive segments. "
+        "Decide which sentence comes right after that context.\n",
+    ]
+    for n, ((first, last), opt_a, opt_b) in enumerate(questions, 1):
+        where = f"segment {first}" if first == last else f"segments {first}-{last}"
+        parts.append(f"Question {n} (context: {where})\nA: {opt_a}\nB: {opt_b}\n")
+    parts.append(instruction)
+    return "\n".join(parts)
+
+
+ANSWER_LINE = re.compile(
+    r"^[\s*#>\-]*(?:question|q|answer)?\s*(\d+)\s*\**\s*(?:\([^)]*\))?\s*[:.)\-–—=]*\s*\**\s*"
+    r"(?:answer\s*[:\-]?\s*)?\**\s*[\(\[\"']?([AB])\b",
+    re.IGNORECASE,
+)
+
+
+def parse_packed_answers(text, n):
+    """
+    Map a packed reply to {question number: 'A' | 'B'} for questions 1..n.
+    Numbered lines ("1: A", "Question 2 - b", "**3.** A") are read first;
+    a bare sequence of exactly `n` letters ("A, B, A") is accepted as a
+    fallback. Questions answered twice with different letters are dropped.
+    """
+    answers, conflicts = {}, set()
+    for line in (text or "").splitlines():
+        match = ANSWER_LINE.match(line)
+        if not match:
+            continue
+        number, letter = int(match.group(1)), match.group(2).upper()
+        if not 1 <= number <= n:
+            continue
+        if answers.get(number, letter) != letter:
+            conflicts.add(number)
+        answers[number] = letter
+    for number in conflicts:
+        del answers[number]
+
+    if not answers and not conflicts:
+        letters = re.findall(r"\b([AB])\b", text or "", re.IGNORECASE)
+        leftover = re.sub(r"\b[AB]\b|[\s,;.:\-]", "", text or "", flags=re.IGNORECASE)
+        if len(letters) == n and not leftover:
+            answers = {i: letter.upper() for i, letter in enumerate(letters, 1)}
+    return answers
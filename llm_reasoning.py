@@ -0,0 +1,162 @@
+import os
+import zlib
+import struct
+import argparse
+
+import pandas as pd
+
+# Compressed sidecar store for CoT reasoning. The runner appends each model's
+# reasoning as one zlib-compressed record and keeps only the record's byte
+# offset in the CSV (`*_reasoning_offset_COT`), so scoring and analysis load a
+# small CSV and only decompress the reasoning they actually look at.
+
+# row index, model-name length, compressed payload length
+_HEADER = struct.Struct("<qHI")
+
+REASONING_COLS = {
+    "gpt": ("gpt_reasoning_COT", "gpt_reasoning_offset_COT"),
+    "gemini": ("gemini_reasoning_COT", "gemini_reasoning_offset_COT"),
+    "llama": ("llama_reasoning_COT", "llama_reasoning_offset_COT"),
+}
+
+
+def reasoning_path(csv_path):
+    """Sidecar file holding the reasoning for `csv_path`."""
+    return f"{csv_path}.reasoning.bin"
+
+
+class ReasoningStore:
+    """
+    Append-only file of (row, model, zlib(reasoning)) records addressed by
+    byte offset. A torn record left by a crash is truncated on open.
+    """
+
+    def __init__(self, path, level=9):
+        self.path = path
+        self.level = level
+        self._writer = None
+        self._reader = None
+
+    def _records_end(self):
+        # Offset just past the last complete record
+        end = 0
+        size = os.path.getsize(self.path)
+        with open(self.path, "rb") as f:
+            while end + _HEADER.size <= size:
+                f.seek(end)
+                _, name_len, payload_len = _HEADER.unpack(f.read(_HEADER.size))
+                next_end = end + _HEADER.size + name_len + payload_len
+                if next_end > size:
+                    break
+                end = next_end
+        return end
+
+    def _open_writer(self):
+        if os.path.exists(self.path):
+            end = self._records_end()
+            if end != os.path.getsize(self.path):
+                with open(self.path, "r+b") as f:
+                    f.truncate(end)
+        self._writer = open(self.path, "ab")
+
+    def append(self, row, model, text):
+        """Store one reasoning text and return its offset."""
+        if self._writer is None:
+            self._open_writer()
+        name = model.encode("utf-8")
+        payload = zlib.compress((text or "").encode("utf-8"), self.level)
+        offset = self._writer.tell()
+        self._writer.write(_HEADER.pack(int(row), len(name), len(payload)) + name + payload)
+        # Flushed before the offset is journaled, so it never points past the file
+        self._writer.flush()
+        return offset
+
+    def read(self, offset):
+        """Return (row, model, text) for the record at `offset`."""
+        if self._reader is None:
+            self._reader = open(self.path, "rb")
+        self._reader.seek(int(offset))
+        row, name_len, payload_len = _HEADER.unpack(self._reader.read(_HEADER.size))
+        model = self._reader.read(name_len).decode("utf-8")
+        text = zlib.decompress(self._reader.read(payload_len)).decode("utf-8")
+        return row, model, text
+
+    def get(self, offset):
+        """Reasoning text at `offset`; missing offsets give ""."""
+        if offset is None or pd.isna(offset):
+            return ""
+        return self.read(offset)[2]
+
+    def records(self):
+        """Yield (offset, row, model, text) for every complete record."""
+        if not os.path.exists(self.path):
+            return
+        end = self._records_end()
+        offset = 0
+        while offset < end:
+            row, model, text = self.read(offset)
+            yield offset, row, model, text
+            offset = self._reader.tell()
+
+    def close(self):
+        for f in (self._writer, self._reader):
+            if f is not None:
+                f.close()
+        self._writer = self._reader = None
+
+
+def externalize_reasoning(df, store, columns=REASONING_COLS):
+    """
+    Move inline reasoning columns of `df` into `store`, replacing each with
+    its offset column. Returns the number of texts moved.
+    """
+    moved = 0
+    for model, (text_col, offset_col) in columns.items():
+        if offset_col not in df.columns:
+            df[offset_col] = pd.Series(pd.NA, index=df.index, dtype="Int64")
+        else:
+            df[offset_col] = df[offset_col].astype("Int64")
+        if text_col not in df.columns:
+            continue
+        for idx, text in df[text_col].items():
+            if isinstance(text, str) and text:
+                df.at[idx, offset_col] = store.append(idx, model, text)
+                moved += 1
+        # Keep the offset column where the text column was
+        position = df.columns.get_loc(text_col)
+        offsets = df.pop(offset_col)
+        df.drop(columns=text_col, inplace=True)
+        df.insert(position, offset_col, offsets)
+    return moved
+
+
+def attach_reasoning(df, store, columns=REASONING_COLS, models=None):
+    """Add the reasoning text columns back onto `df` (for the models asked for)."""
+    for model, (text_col, offset_col) in columns.items():
+        if (models is None or model in models) and offset_col in df.columns:
+            df[text_col] = [store.get(offset) for offset in df[offset_col]]
+    return df
+
+
+def migrate_csv(csv_path):
+    """Rewrite a CSV with inline reasoning to the offset + sidecar layout, atomically."""
+    df = pd.read_csv(csv_path)
+    store = ReasoningStore(reasoning_path(csv_path))
+    moved = externalize_reasoning(df, store)
+    store.close()
+    tmp_path = f"{csv_path}.tmp"
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, csv_path)
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move inline *_reasoning_COT columns into a sidecar store.")
+    parser.add_argument("csv", nargs="+")
+    args = parser.parse_args()
+    for path in args.csv:
+        before = os.path.getsize(path)
+        moved = migrate_csv(path)
+        print(f"🗜️ {path}: moved {moved} reasoning texts, "
+              f"{before / 1e6:.1f} MB → {os.path.getsize(path) / 1e6:.1f} MB "
+              f"(+{os.path.getsize(reasoning_path(path)) / 1e6:.1f} MB sidecar)")
@@ -0,0 +1,92 @@
+import re
+import time
+
+from llm_metrics import usage_of, record_usage
+
+# Streamed completions for the CoT runner. Text deltas are fed through an
+# incremental detector that spots the final "A"/"B" answer line as soon as its
+# token arrives, so every response carries a time-to-answer measurement
+# alongside the full text.
+
+ANSWER_LINE = re.compile(r"^[\"']?([AB])[\"']?$", re.IGNORECASE)
+
+
+class StreamedText(str):
+    """
+    A completed response. Behaves exactly like the text (and is cached as
+    plain text); `time_to_answer` is the seconds from sending the request
+    to the arrival of the final answer line, or None if none was seen.
+    """
+
+    def __new__(cls, text, time_to_answer=None):
+        obj = super().__new__(cls, text)
+        obj.time_to_answer = time_to_answer
+        return obj
+
+
+class AnswerDetector:
+    """
+    Incremental counterpart of extract_answer_and_reasoning's line scan:
+    the last line consisting of just A or B is the answer. A candidate is
+    timed when the letter arrives and dropped if more text follows it on
+    the same line.
+    """
+
+    def __init__(self, started=None):
+        self.started = time.monotonic() if started is None else started
+        self.answer = None
+        self.answered_at = None
+        self._line = ""
+        self._candidate_at = None
+
+    def feed(self, text, now=None):
+        now = time.monotonic() if now is None else now
+        *complete, self._line = (self._line + text).split("\n")
+        for line in complete:
+            self._close_line(line, now)
+        if ANSWER_LINE.match(self._line.strip()):
+            if self._candidate_at is None:
+                self._candidate_at = now
+        else:
+            self._candidate_at = None
+
+    def _close_line(self, line, now):
+        match = ANSWER_LINE.match(line.strip())
+        if match:
+            self.answer = match.group(1).upper()
+            self.answered_at = self._candidate_at or now
+        self._candidate_at = None
+
+    def finish(self, now=None):
+        """Flush the last line; returns the detected answer (or None)."""
+        if self._line:
+            self._close_line(self._line, time.monotonic() if now is None else now)
+            self._line = ""
+        return self.answer
+
+    @property
+    def time_to_answer(self):
+        return None if self.answered_at is None else self.answered_at - self.started
+
+
+async def collect_stream(chunks, delta, started):
+    """
+    Drain an async stream of completion chunks into a StreamedText.
+    `delta(chunk)` returns the chunk's new text (or None); `started` is the
+    monotonic time the request was sent. Token usage reported by the stream
+    is recorded for llm_metrics.
+    """
+    detector = AnswerDetector(started)
+    parts = []
+    usage_chunk = None
+    async for chunk in chunks:
+        text = delta(chunk)
+        if text:
+            parts.append(text)
+            detector.feed(text)
+        if usage_of(chunk) is not None:
+            usage_chunk = chunk  # usage is cumulative; the last report counts
+    detector.finish()
+    if usage_chunk is not None:
+        record_usage(usage_chunk)
+    return StreamedText("".join(parts), detector.time_to_answer)
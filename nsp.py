@@ -0,0 +1,179 @@
+import os
+import sys
+import argparse
+import importlib.util
+
+# Single command-line entry point over the repo's scripts. Only the standard
+# library is imported up front; each subcommand loads the module it drives when
+# it runs, so `nsp generate` never imports pandas, `nsp score` never imports a
+# provider SDK, and `nsp run --models gemini` imports google-genai alone.
+#
+#   python nsp.py generate txt-ha/all_books.txt -o nsp_questions_ha.csv --workers 8
+#   python nsp.py sample nsp_questions_ha.csv datasets/NSP_QUESTIONS_HA_1000.csv -n 1000
+#   python nsp.py run datasets/NSP_QUESTIONS_HA_1000.csv --models gemini
+#   python nsp.py run-cot datasets/NSP_QUESTIONS_HA_1000.csv --lang HA
+#   python nsp.py score datasets/*_COT.csv --features distractor_distance
+#   python nsp.py features datasets/NSP_QUESTIONS_HA_1000.csv --device cpu
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MODELS = ("gpt", "gemini", "llama")
+FEATURES = ('context_length', 'distractor_distance', 'distractor_length', 'story_length')
+
+
+def load_script(filename):
+    """
+    Import one of the repo's scripts by file name (they are hyphenated, so
+    not importable by name). The module is registered in sys.modules, so
+    worker processes can unpickle its functions.
+    """
+    name = os.path.splitext(filename)[0].replace('-', '_')
+    if name in sys.modules:
+        return sys.modules[name]
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)  # for the llm_* / nsp_* modules the scripts import
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def require_files(paths):
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"❌ Error: File '{path}' not found.")
+            sys.exit(1)
+
+
+def cmd_generate(args):
+    require_files([args.input])
+    gen = load_script('generate-nsp.py')
+    # The generator reads its configuration from module constants (workers inherit them)
+    gen.INPUT_TXT = args.input
+    if args.format == 'compact':
+        gen.OUTPUT_COMPACT = args.output or gen.OUTPUT_COMPACT
+    else:
+        gen.OUTPUT_CSV = args.output or gen.OUTPUT_CSV
+    gen.OUTPUT_FORMAT = args.format
+    gen.LANG = args.lang
+    gen.SEED = args.seed
+    gen.WORKERS = args.workers
+    gen.SAMPLE_SIZE = args.sample
+    gen.SAMPLE_STRATIFY = args.stratify
+    gen.DISTRACTOR_MODE = args.distractors
+    if args.band:
+        gen.DISTRACTOR_BAND = tuple(args.band)
+    gen.main()
+
+
+def cmd_sample(args):
+    require_files([args.input])
+    metrics = load_script('evaluation-metrics.py')
+    metrics.sample_csv(args.input, args.output, n=args.n, strata=tuple(args.strata),
+                       weight_col=args.weight_col, seed=args.seed)
+
+
+def cmd_run(args):
+    require_files([args.csv])
+    runner = load_script('gpt-gemini-llama.py')
+    runner.load_dotenv()
+    runner.main(args.csv, models=args.models, mode=args.mode, pack=args.pack,
+                answer_mode=args.answer_mode)
+
+
+def cmd_run_cot(args):
+    require_files([args.csv])
+    runner = load_script('gpt-gemini-llama-COT.py')
+    runner.load_dotenv()
+    runner.main(args.csv, models=args.models, mode=args.mode, reasoning_lang=args.lang)
+
+
+def cmd_score(args):
+    require_files(args.csv)
+    metrics = load_script('evaluation-metrics.py')
+    results = metrics.score_files(args.csv, args.columns, n_boot=args.n_boot, confidence=args.confidence)
+    metrics.print_report(results, features=args.features)
+    if args.wrong_answers:
+        metrics.save_wrong_answers(results, args.csv, args.wrong_answers)
+
+
+def cmd_features(args):
+    require_files([args.csv])
+    from nsp_features import main as add_features
+    add_features(args.csv, args.output, args.model, args.store, args.device, args.batch_size,
+                 args.lm, not args.no_mask_context, args.lm_batch_size)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="nsp", description="Generate, run and score NSP question sets.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("generate", help="Build NSP questions from a story corpus (generate-nsp.py)")
+    p.add_argument("input", help="Corpus text file; stories separated by lines of dashes")
+    p.add_argument("-o", "--output", help="Output CSV (or compact bank directory)")
+    p.add_argument("--format", choices=["csv", "compact"], default="csv")
+    p.add_argument("--lang", choices=["EN", "SW", "HA"], help="Abbreviation-aware sentence splitting")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--sample", type=int, help="Draw this many questions instead of the full bank")
+    p.add_argument("--stratify", choices=["context_length", "distractor_distance"])
+    p.add_argument("--distractors", choices=["random", "similarity", "length"], default="random",
+                   help="Distractor selection (see nsp_distractors.py)")
+    p.add_argument("--band", type=float, nargs=2, metavar=("LOW", "HIGH"),
+                   help="Target similarity (or length ratio) band for --distractors")
+    p.set_defaults(func=cmd_generate)
+
+    p = commands.add_parser("sample", help="Stratified sample of a question CSV (evaluation-metrics.py)")
+    p.add_argument("input")
+    p.add_argument("output")
+    p.add_argument("-n", type=int, default=1000)
+    p.add_argument("--strata", nargs="*", default=["context_length", "distractor_distance", "story_length"])
+    p.add_argument("--weight-col", help="Column of sampling weights (default: uniform)")
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=cmd_sample)
+
+    for name, help_text, func in (
+            ("run", "Ask the models for one-letter answers (gpt-gemini-llama.py)", cmd_run),
+            ("run-cot", "Ask the models with chain-of-thought (gpt-gemini-llama-COT.py)", cmd_run_cot)):
+        p = commands.add_parser(name, help=help_text)
+        p.add_argument("csv", help="Question CSV; answers are written back to it")
+        p.add_argument("--models", nargs="+", choices=MODELS, default=list(MODELS),
+                       help="Only these providers are asked (and their SDKs imported)")
+        p.add_argument("--mode", choices=["sync", "batch"], default="sync")
+        if name == "run":
+            p.add_argument("--pack", action="store_true", help="Ask several questions of a story per request")
+            p.add_argument("--answer-mode", choices=["text", "logprobs"], default="text")
+        else:
+            p.add_argument("--lang", choices=["EN", "HA", "SW"], default="EN", help="Reasoning language")
+        p.set_defaults(func=func)
+
+    p = commands.add_parser("score", help="Accuracy with CIs and CoT comparisons (evaluation-metrics.py)")
+    p.add_argument("csv", nargs="+")
+    p.add_argument("--columns", nargs="+", help="Answer columns to score (default: all)")
+    p.add_argument("--features", nargs="*", default=list(FEATURES), choices=FEATURES)
+    p.add_argument("--n-boot", type=int, default=2000, help="Bootstrap resamples per CI")
+    p.add_argument("--confidence", type=float, default=0.95)
+    p.add_argument("--wrong-answers", metavar="CSV", help="Also write every wrong answer to this CSV")
+    p.set_defaults(func=cmd_score)
+
+    p = commands.add_parser("features", help="Add semantic-similarity / perplexity features (nsp_features.py)")
+    p.add_argument("csv")
+    p.add_argument("--output", help="Where to write the CSV (default: in place)")
+    p.add_argument("--model", default="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+    p.add_argument("--store", help="Embedding store directory (default: embeddings/<model>)")
+    p.add_argument("--device", help="cpu / cuda (default: whatever torch picks)")
+    p.add_argument("--batch-size", type=int, default=128)
+    p.add_argument("--lm", help="Causal LM for ppl_A/ppl_B; skipped if unset")
+    p.add_argument("--no-mask-context", action="store_true")
+    p.add_argument("--lm-batch-size", type=int, default=16)
+    p.set_defaults(func=cmd_features)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
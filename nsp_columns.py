@@ -0,0 +1,208 @@
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Columnar cache for the dataset CSVs. Each CSV is parsed once into a directory
+# of per-column files next to it; analysis code then loads only the columns it
+# asks for, memory-mapped, without touching the context, option or reasoning
+# text. The cache is rebuilt when the CSV's size/mtime change and its content
+# hash no longer matches.
+#
+#   <csv>.cols/meta.json     source size/mtime/hash, row count, column specs
+#   <csv>.cols/<i>.npy       numeric column i, or int32 codes of a dictionary column
+#   <csv>.cols/<i>.txt       text column i: UTF-8 of all values, back to back
+#   <csv>.cols/<i>.pos.npy   int64 character offsets into <i>.txt (rows + 1)
+#   <csv>.cols/<i>.null.npy  missing-value mask of a text column (if any are missing)
+
+# Question feature columns, and the answer columns the runners write:
+# <model>_answer for the plain prompt and <model>_answer_COT for CoT. Other
+# per-model columns (probabilities, reasoning, timings) never match.
+FEATURES = ['context_length', 'distractor_distance', 'distractor_length', 'story_length']
+ANSWER_MODELS = ('gpt', 'gemini', 'llama')
+ANSWER_COL = re.compile(rf"^(?P<model>{'|'.join(ANSWER_MODELS)})_answer(?P<cot>_COT)?$")
+
+FORMAT_VERSION = 1
+# String columns with at most this many distinct values are dictionary-encoded
+MAX_CATEGORIES = 1024
+
+
+def cache_path(csv_path):
+    """Cache directory for `csv_path`."""
+    return f"{csv_path}.cols"
+
+
+def file_hash(path, block=1 << 20):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(block), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return meta if meta.get('format') == FORMAT_VERSION else None
+
+
+def fresh_meta(csv_path):
+    """
+    The cache's metadata if it matches the CSV, else None. Size and mtime
+    are checked first; only when they changed is the CSV hashed, and a
+    matching hash (a touched but unchanged file) just refreshes the mtime.
+    """
+    cache_dir = cache_path(csv_path)
+    meta = _read_meta(cache_dir)
+    if meta is None:
+        return None
+    stat = os.stat(csv_path)
+    source = meta['source']
+    if source['size'] == stat.st_size and source['mtime_ns'] == stat.st_mtime_ns:
+        return meta
+    if source['size'] != stat.st_size or file_hash(csv_path) != source['hash']:
+        return None
+    source['mtime_ns'] = stat.st_mtime_ns
+    _write_meta(cache_dir, meta)
+    return meta
+
+
+def _write_meta(cache_dir, meta):
+    tmp = os.path.join(cache_dir, 'meta.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, os.path.join(cache_dir, 'meta.json'))
+
+
+def _write_column(cache_dir, i, values):
+    """Write one column; returns its spec for meta.json."""
+    if values.dtype.kind in 'biuf':
+        np.save(os.path.join(cache_dir, f'{i}.npy'), values.to_numpy())
+        return {'kind': 'numeric', 'dtype': str(values.dtype)}
+
+    missing = values.isna().to_numpy()
+    strings = values.astype(object).where(~missing, '').astype(str)
+    categories = pd.unique(strings[~missing])
+    if len(categories) <= MAX_CATEGORIES:
+        codes = pd.Categorical(strings, categories=categories).codes.astype(np.int32)
+        codes[missing] = -1
+        np.save(os.path.join(cache_dir, f'{i}.npy'), codes)
+        return {'kind': 'dictionary', 'categories': list(categories)}
+
+    lengths = strings.str.len().to_numpy(dtype=np.int64)
+    with open(os.path.join(cache_dir, f'{i}.txt'), 'w', encoding='utf-8', newline='') as f:
+        f.write(''.join(strings))
+    np.save(os.path.join(cache_dir, f'{i}.pos.npy'), np.concatenate([[0], np.cumsum(lengths)]))
+    if missing.any():
+        np.save(os.path.join(cache_dir, f'{i}.null.npy'), missing)
+    return {'kind': 'text', 'nulls': bool(missing.any())}
+
+
+def build_cache(csv_path):
+    """Parse `csv_path` once and (re)write its column cache atomically. Returns the metadata."""
+    cache_dir = cache_path(csv_path)
+    tmp_dir = f"{cache_dir}.tmp"
+    stat = os.stat(csv_path)
+    df = pd.read_csv(csv_path)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    columns = []
+    for i, name in enumerate(df.columns):
+        spec = _write_column(tmp_dir, i, df[name])
+        columns.append({'name': name, **spec})
+    meta = {
+        'format': FORMAT_VERSION,
+        'source': {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': file_hash(csv_path)},
+        'rows': len(df),
+        'columns': columns,
+    }
+    _write_meta(tmp_dir, meta)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+    return meta
+
+
+def _read_column(cache_dir, i, spec, rows):
+    if spec['kind'] == 'numeric':
+        return np.load(os.path.join(cache_dir, f'{i}.npy'), mmap_mode='r')
+    if spec['kind'] == 'dictionary':
+        codes = np.load(os.path.join(cache_dir, f'{i}.npy'), mmap_mode='r')
+        lookup = np.array(spec['categories'] + [np.nan], dtype=object)
+        return lookup[codes]  # code -1 picks the trailing NaN
+    with open(os.path.join(cache_dir, f'{i}.txt'), encoding='utf-8', newline='') as f:
+        text = f.read()
+    pos = np.load(os.path.join(cache_dir, f'{i}.pos.npy'))
+    values = np.empty(rows, dtype=object)
+    values[:] = [text[a:b] for a, b in zip(pos[:-1].tolist(), pos[1:].tolist())]
+    if spec['nulls']:
+        values[np.load(os.path.join(cache_dir, f'{i}.null.npy'))] = np.nan
+    return values
+
+
+def load_meta(csv_path, cache=True):
+    """Metadata of a fresh cache for `csv_path`, building it if needed (None if `cache` is off)."""
+    if not cache:
+        return None
+    meta = fresh_meta(csv_path)
+    if meta is None:
+        try:
+            meta = build_cache(csv_path)
+        except OSError:
+            return None  # read-only location: callers fall back to the CSV
+    return meta
+
+
+def read_header(csv_path, cache=True):
+    """Column names of `csv_path`, from the cache when it is fresh."""
+    meta = fresh_meta(csv_path) if cache else None
+    if meta is None:
+        return list(pd.read_csv(csv_path, nrows=0).columns)
+    return [c['name'] for c in meta['columns']]
+
+
+def load_columns(csv_path, columns=None, cache=True):
+    """
+    Load `columns` (all by default) of `csv_path` as a DataFrame, like
+    pd.read_csv(csv_path, usecols=columns) but from the column cache.
+    Numeric columns are memory-mapped; text is only read for text columns
+    that are asked for. Falls back to the CSV when no cache can be written.
+    """
+    meta = load_meta(csv_path, cache)
+    if meta is None:
+        return pd.read_csv(csv_path, usecols=columns)
+    specs = {c['name']: (i, c) for i, c in enumerate(meta['columns'])}
+    wanted = list(specs) if columns is None else list(columns)
+    missing = [c for c in wanted if c not in specs]
+    if missing:
+        raise ValueError(f"Columns not found in {csv_path}: {missing}")
+    # Keep the CSV's column order, as usecols does
+    wanted.sort(key=lambda c: specs[c][0])
+    cache_dir = cache_path(csv_path)
+    return pd.DataFrame({name: _read_column(cache_dir, *specs[name], meta['rows']) for name in wanted})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build (or refresh) the column cache of dataset CSVs.")
+    parser.add_argument("csv", nargs="+")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the cache is fresh")
+    args = parser.parse_args()
+    for path in args.csv:
+        if not os.path.exists(path):
+            print(f"❌ Error: File '{path}' not found.")
+            sys.exit(1)
+        if not args.force and fresh_meta(path) is not None:
+            print(f"✅ {path}: cache is fresh")
+            continue
+        meta = build_cache(path)
+        kinds = pd.Series([c['kind'] for c in meta['columns']]).value_counts().to_dict()
+        print(f"🗂️ {path}: cached {meta['rows']} rows × {len(meta['columns'])} columns {kinds} "
+              f"in {cache_path(path)}")
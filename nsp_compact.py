@@ -0,0 +1,196 @@
+import os
+import json
+import numpy as np
+
+# Compact NSP question bank: every story's cleaned sentences are stored once,
+# and each question is a fixed-size record of sentence indices.
+#
+#   <bank>/meta.json            counts and generation settings
+#   <bank>/sentences.bin        UTF-8 text of all sentences, back to back
+#   <bank>/sentence_offsets.bin int64 byte offsets into sentences.bin (M + 1)
+#   <bank>/story_offsets.bin    int64 index of each story's first sentence (S + 1)
+#   <bank>/items.bin            one ITEM_DTYPE record per question
+#
+# Sentence indices in items.bin are relative to the start of their story.
+
+FORMAT_VERSION = 1
+LABELS = np.array(['A', 'B'])
+
+ITEM_DTYPE = np.dtype([
+    ('story_id', '<i4'),
+    ('start', '<i4'),
+    ('context_len', '<i2'),
+    ('true_idx', '<i4'),
+    ('distractor_idx', '<i4'),
+    ('label', 'u1'),            # 0 → 'A', 1 → 'B'
+])
+
+
+def record_to_row(rec, sentence, story_length):
+    """
+    Build a CSV-style question dict from an ITEM_DTYPE record.
+    `sentence(j)` returns the cleaned text of the story's j-th sentence.
+    """
+    start, ctx = int(rec['start']), int(rec['context_len'])
+    context = ' '.join(sentence(j) for j in range(start, start + ctx))
+    true_str = sentence(int(rec['true_idx']))
+    distract_str = sentence(int(rec['distractor_idx']))
+    if rec['label'] == 0:
+        A, B, label = true_str, distract_str, 'A'
+    else:
+        A, B, label = distract_str, true_str, 'B'
+    return {
+        'story_id': int(rec['story_id']),
+        'story_length': story_length,
+        'context': context,
+        'context_length': ctx,
+        'distractor_distance': int(rec['distractor_idx'] - rec['true_idx']),
+        'distractor_length': len(distract_str.split()),
+        'option_A': A,
+        'option_B': B,
+        'label': label,
+    }
+
+
+class CompactWriter:
+    """
+    Stream stories and their question indices into a compact bank
+    directory. Nothing but the current story is held in memory.
+    """
+
+    def __init__(self, path, config=None):
+        self.path = path
+        self.config = config or {}
+        os.makedirs(path, exist_ok=True)
+        self._sentences = open(os.path.join(path, 'sentences.bin'), 'wb')
+        self._sentence_offsets = open(os.path.join(path, 'sentence_offsets.bin'), 'wb')
+        self._story_offsets = open(os.path.join(path, 'story_offsets.bin'), 'wb')
+        self._items = open(os.path.join(path, 'items.bin'), 'wb')
+        self._byte_pos = 0
+        self.n_sentences = 0
+        self.n_stories = 0
+        self.n_items = 0
+        self._sentence_offsets.write(np.int64(0).tobytes())
+        self._story_offsets.write(np.int64(0).tobytes())
+
+    def add_story(self, story_id, sentences, items):
+        """
+        Append one story. `sentences` are the cleaned sentence strings,
+        `items` an iterable of (start, context_len, distractor_idx, label)
+        with label 'A' or 'B'. Stories must be added in story_id order.
+        """
+        if story_id != self.n_stories:
+            raise ValueError(f"Expected story_id {self.n_stories}, got {story_id}")
+
+        encoded = [s.encode('utf-8') for s in sentences]
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        self._sentences.write(b''.join(encoded))
+        self._sentence_offsets.write((self._byte_pos + np.cumsum(lengths)).tobytes())
+        self._byte_pos += int(lengths.sum())
+        self.n_sentences += len(encoded)
+        self._story_offsets.write(np.int64(self.n_sentences).tobytes())
+        self.n_stories += 1
+
+        records = np.array(
+            [(story_id, i, ctx, i + ctx, d, label == 'B') for i, ctx, d, label in items],
+            dtype=ITEM_DTYPE,
+        )
+        self._items.write(records.tobytes())
+        self.n_items += len(records)
+
+    def close(self):
+        for f in (self._sentences, self._sentence_offsets, self._story_offsets, self._items):
+            f.close()
+        meta = {
+            'format': FORMAT_VERSION,
+            'items': self.n_items,
+            'stories': self.n_stories,
+            'sentences': self.n_sentences,
+            'config': self.config,
+        }
+        with open(os.path.join(self.path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CompactBank:
+    """
+    Memory-mapped view of a compact bank. Integer columns are NumPy
+    arrays; text is only decoded when an item is materialized.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compact bank format: {self.meta.get('format')}")
+
+        def _map(name, dtype):
+            file = os.path.join(path, name)
+            if os.path.getsize(file) == 0:
+                return np.zeros(0, dtype=dtype)
+            return np.memmap(file, dtype=dtype, mode='r')
+
+        self.items = _map('items.bin', ITEM_DTYPE)
+        self.sentence_offsets = _map('sentence_offsets.bin', np.int64)
+        self.story_offsets = _map('story_offsets.bin', np.int64)
+        self._text = _map('sentences.bin', np.uint8)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def story_lengths(self):
+        return np.diff(self.story_offsets)
+
+    def sentence(self, story_id, idx):
+        """Return the cleaned text of sentence `idx` of story `story_id`."""
+        k = self.story_offsets[story_id] + idx
+        start, end = self.sentence_offsets[k], self.sentence_offsets[k + 1]
+        return self._text[start:end].tobytes().decode('utf-8')
+
+    def features(self):
+        """
+        Return the numeric CSV feature columns for every item as a dict
+        of arrays, without touching any text.
+        """
+        items = self.items
+        sid = items['story_id']
+        return {
+            'story_id': np.asarray(sid),
+            'story_length': self.story_lengths[sid],
+            'context_length': np.asarray(items['context_len']),
+            'distractor_distance': items['distractor_idx'] - items['true_idx'],
+            'label': LABELS[items['label']],
+        }
+
+    def row(self, k):
+        """
+        Materialize item `k` as the same dict generate-nsp.py writes to CSV.
+        """
+        return self.record_row(self.items[k])
+
+    def record_row(self, rec):
+        """Materialize any ITEM_DTYPE record that refers to this bank's stories."""
+        sid = int(rec['story_id'])
+        story_length = int(self.story_offsets[sid + 1] - self.story_offsets[sid])
+        return record_to_row(rec, lambda j: self.sentence(sid, j), story_length)
+
+    def __getitem__(self, k):
+        return self.row(k)
+
+    def iter_rows(self, indices=None):
+        """Yield materialized rows for `indices` (all items by default)."""
+        for k in (range(len(self)) if indices is None else indices):
+            yield self.row(int(k))
+
+
+def open_compact(path):
+    """Open a compact bank directory written by CompactWriter."""
+    return CompactBank(path)
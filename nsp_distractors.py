@@ -0,0 +1,52 @@
+import numpy as np
+
+# Difficulty-controlled distractor selection. Each story gets one score matrix
+# over its sentences (cosine similarity of their embeddings, or the ratio of
+# their word counts), and distractors for all of the story's questions are
+# picked from their distance windows in one batched NumPy step: uniformly among
+# the candidates whose score with the true sentence falls in a target band, or
+# the ones closest to it when none does.
+
+MODES = ('random', 'similarity', 'length')
+# Column recording the achieved score of each question's distractor
+SCORE_COLUMNS = {'similarity': 'distractor_similarity', 'length': 'distractor_length_ratio'}
+
+
+def story_scores(mode, vectors=None, word_counts=None):
+    """
+    (n × n) matrix whose [t, d] entry scores sentence d as the distractor
+    for true sentence t: cosine similarity of the unit `vectors` for
+    'similarity', d's word count over t's for 'length'.
+    """
+    if mode == 'similarity':
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors @ vectors.T
+    if mode == 'length':
+        counts = np.asarray(word_counts, dtype=np.float64)
+        return counts[None, :] / counts[:, None]
+    raise ValueError(f"mode must be 'similarity' or 'length', got {mode!r}")
+
+
+def choose_distractors(true_idx, scores, band, distractor_distances, rng):
+    """
+    Pick a distractor for every true sentence index in `true_idx` from
+    true_idx + MIN_DIST .. true_idx + MAX_DIST (within the story). Returns
+    (distractor_idx, achieved score) arrays.
+    """
+    true_idx = np.asarray(true_idx, dtype=np.int64)
+    n = len(scores)
+    min_d, max_d = distractor_distances
+    candidates = true_idx[:, None] + np.arange(min_d, max_d + 1)[None, :]
+    valid = candidates < n
+    candidates = np.minimum(candidates, n - 1)
+    score = scores[true_idx[:, None], candidates]
+
+    # Distance of each candidate's score from the band (0 inside it)
+    lo, hi = band
+    miss = np.where(score < lo, lo - score, np.where(score > hi, score - hi, 0.0))
+    miss = np.where(valid, miss, np.inf)
+    closest = miss == miss.min(axis=1, keepdims=True)
+    # Uniform among the closest candidates: every in-band one when any exist
+    pick = np.where(closest, rng.random(miss.shape), -1.0).argmax(axis=1)
+    rows = np.arange(len(true_idx))
+    return candidates[rows, pick], score[rows, pick]
@@ -0,0 +1,339 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Question features computed from the text of the NSP items. Embeddings are
+# computed once per distinct text: the contexts and options of a question set
+# are deduplicated by content hash, only texts the on-disk store has not seen
+# are encoded (in large, length-sorted batches), and similarities are row-wise
+# dot products over the stored unit vectors. Perplexities run each context
+# through the LM once and continue both options from its key/value cache.
+#
+#   <store>/meta.json    model name and embedding size
+#   <store>/keys.bin     16-byte BLAKE2b digest of each text, in row order
+#   <store>/vectors.f32  float32 unit vectors, one row per key (memory-mapped)
+
+SBERT_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDINGS_DIR = "embeddings"
+KEY_SIZE = 16
+
+
+def text_key(text):
+    """Content hash under which a text's embedding is stored."""
+    return hashlib.blake2b(str(text).encode('utf-8'), digest_size=KEY_SIZE).digest()
+
+
+def store_path(model_name, root=EMBEDDINGS_DIR):
+    """Default store directory for `model_name`."""
+    return os.path.join(root, model_name.replace('/', '__'))
+
+
+class EmbeddingStore:
+    """
+    Append-only store of unit-length embeddings keyed by text hash.
+    Vectors are written before their keys, so a crash mid-append leaves
+    at most an orphaned vector, which is dropped on open.
+    """
+
+    def __init__(self, path, model_name):
+        self.path = path
+        self.model_name = model_name
+        os.makedirs(path, exist_ok=True)
+        self._keys_path = os.path.join(path, 'keys.bin')
+        self._vectors_path = os.path.join(path, 'vectors.f32')
+        meta_path = os.path.join(path, 'meta.json')
+        self.dim = None
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta['model'] != model_name:
+                raise ValueError(f"{path} holds embeddings of {meta['model']}, not {model_name}")
+            self.dim = meta['dim']
+        self._index = {}
+        self._matrix = None
+        if self.dim is not None:
+            self._load()
+
+    def _load(self):
+        rows = 0
+        if os.path.exists(self._keys_path) and os.path.exists(self._vectors_path):
+            rows = min(os.path.getsize(self._keys_path) // KEY_SIZE,
+                       os.path.getsize(self._vectors_path) // (4 * self.dim))
+        # Drop a torn append (the part past the last complete key + vector pair)
+        for file, size in ((self._keys_path, rows * KEY_SIZE), (self._vectors_path, rows * 4 * self.dim)):
+            with open(file, 'ab') as f:
+                f.truncate(size)
+        with open(self._keys_path, 'rb') as f:
+            keys = f.read()
+        self._index = {keys[i:i + KEY_SIZE]: n for n, i in enumerate(range(0, len(keys), KEY_SIZE))}
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    @property
+    def matrix(self):
+        """All stored vectors as a read-only (rows × dim) memory map."""
+        if self._matrix is None or len(self._matrix) != len(self):
+            if not len(self):
+                return np.zeros((0, self.dim or 0), dtype=np.float32)
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode='r',
+                                     shape=(len(self), self.dim))
+        return self._matrix
+
+    def add(self, keys, vectors):
+        """Append embeddings for `keys` (which must not be stored yet)."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(os.path.join(self.path, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'model': self.model_name, 'dim': self.dim}, f, indent=2)
+            self._load()
+        with open(self._vectors_path, 'ab') as f:
+            f.write(vectors.tobytes())
+        with open(self._keys_path, 'ab') as f:
+            f.write(b''.join(keys))
+        for key in keys:
+            self._index[key] = len(self._index)
+
+    def get(self, keys):
+        """Vectors for `keys` as an array (all keys must be stored)."""
+        rows = np.fromiter((self._index[key] for key in keys), dtype=np.int64, count=len(keys))
+        return np.asarray(self.matrix[rows])
+
+
+def load_encoder(model_name=SBERT_MODEL, device=None, batch_size=128):
+    """
+    A SentenceTransformer encode function: list of texts → float32 unit
+    vectors. Imported lazily, so the store can be read without torch.
+    """
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device=device)
+
+    def encode(texts):
+        return model.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                            normalize_embeddings=True, show_progress_bar=len(texts) > batch_size)
+    return encode
+
+
+def store_missing(texts, store, encode, block_size=4096):
+    """
+    Encode the distinct `texts` that `store` does not hold yet, in blocks
+    of `block_size` sorted by length so batches need little padding, and
+    append each block as it finishes. Returns the texts' keys.
+    """
+    keys = [text_key(text) for text in texts]
+    new = {}
+    for key, text in zip(keys, texts):
+        if key not in store and key not in new:
+            new[key] = str(text)
+    pending = sorted(new.items(), key=lambda item: len(item[1]))
+    for start in range(0, len(pending), block_size):
+        block = pending[start:start + block_size]
+        vectors = np.asarray(encode([text for _, text in block]), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        store.add([key for key, _ in block], vectors / np.where(norms > 0, norms, 1))
+    return keys
+
+
+def embed(texts, store, encode, block_size=4096):
+    """
+    Embeddings of `texts` (one row per text). Each distinct text is encoded
+    at most once across runs (see store_missing).
+    """
+    return store.get(store_missing(texts, store, encode, block_size))
+
+
+def semantic_similarity(df, store, encode):
+    """
+    (semantic_sim_A, semantic_sim_B): cosine similarity of each question's
+    context to option A and to option B. Contexts and options are embedded
+    in one deduplicated pass.
+    """
+    n = len(df)
+    vectors = embed(list(df['context']) + list(df['option_A']) + list(df['option_B']), store, encode)
+    context, option_a, option_b = vectors[:n], vectors[n:2 * n], vectors[2 * n:]
+    return np.einsum('ij,ij->i', context, option_a), np.einsum('ij,ij->i', context, option_b)
+
+
+def add_semantic_features(df, store, encode):
+    """Set semantic_sim_A / semantic_sim_B / delta_semantic_similarity on `df` in place."""
+    df['semantic_sim_A'], df['semantic_sim_B'] = semantic_similarity(df, store, encode)
+    df['delta_semantic_similarity'] = df['semantic_sim_A'] - df['semantic_sim_B']
+    return df
+
+
+def load_lm(model_name, device=None, dtype=None):
+    """
+    (model, tokenizer) for a Hugging Face causal LM, in eval mode on `device`
+    (CUDA if available, else CPU; bfloat16 on GPU, float32 on CPU).
+    """
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    dtype = dtype or (torch.bfloat16 if device.startswith("cuda") else torch.float32)
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(model_name, trust_remote_code=True, torch_dtype=dtype)
+    return model.to(device).eval(), tokenizer
+
+
+def _select_cache(past, index):
+    """Rows `index` of a key/value cache (DynamicCache or legacy tuples)."""
+    if hasattr(past, "batch_select_indices"):
+        past.batch_select_indices(index)
+        return past
+    return tuple(tuple(t.index_select(0, index) for t in layer) for layer in past)
+
+
+def perplexities(df, model, tokenizer, mask_context=True, batch_size=16, stats=None):
+    """
+    (ppl_A, ppl_B) for every question, with the notebook's compute_ppl
+    semantics: the option is scored as the continuation of
+    `context + " " + option`, over the option tokens only when
+    `mask_context`, else over every predicted token.
+
+    Questions are bucketed by context length, `batch_size` at a time. Each
+    batch runs its (left-padded) contexts once with the cache on, then both
+    options of every question in one right-padded pass that continues from
+    the cached keys/values. Only the LM head rows that score a token are
+    computed. Works with any Hugging Face causal LM whose head is a plain
+    projection (Llama, Mistral, GPT-2 families), on CPU or GPU. Pass a dict
+    as `stats` to get forward-token counts against the per-option baseline.
+    """
+    import torch
+    import torch.nn.functional as F
+
+    contexts = [str(c) for c in df['context']]
+    n = len(contexts)
+    # Option tokens are what follows the context's own tokens in the joined
+    # text, exactly the span compute_ppl's ctx_len mask leaves scored
+    ctx_ids = tokenizer(contexts)['input_ids']
+    opt_ids = []
+    for column in ('option_A', 'option_B'):
+        full_ids = tokenizer([f"{c} {o}" for c, o in zip(contexts, df[column])])['input_ids']
+        opt_ids.append([full[len(ctx):] for full, ctx in zip(full_ids, ctx_ids)])
+    if stats is not None:
+        stats['forward_tokens'] = sum(map(len, ctx_ids)) + sum(len(o) for ids in opt_ids for o in ids)
+        stats['baseline_tokens'] = sum(2 * len(c) + len(a) + len(b)
+                                       for c, a, b in zip(ctx_ids, *opt_ids))
+        stats['forward_calls'] = 0
+
+    device = next(model.parameters()).device
+    pad = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else (tokenizer.eos_token_id or 0)
+    base, head = model.base_model, model.get_output_embeddings()
+    nll = np.zeros((n, 2))
+    counts = np.zeros((n, 2))
+    order = np.argsort([len(ids) for ids in ctx_ids], kind='stable')
+
+    with torch.inference_mode():
+        for start in range(0, n, batch_size):
+            items = order[start:start + batch_size]
+            size = len(items)
+
+            # Context pass, left-padded so every context ends in the last column
+            width = max(len(ctx_ids[i]) for i in items)
+            ctx = torch.full((size, width), pad, dtype=torch.long)
+            ctx_mask = torch.zeros((size, width), dtype=torch.long)
+            for r, i in enumerate(items):
+                ids = ctx_ids[i]
+                ctx[r, width - len(ids):] = torch.tensor(ids)
+                ctx_mask[r, width - len(ids):] = 1
+            ctx, ctx_mask = ctx.to(device), ctx_mask.to(device)
+            out = base(input_ids=ctx, attention_mask=ctx_mask,
+                       position_ids=(ctx_mask.cumsum(-1) - 1).clamp(min=0), use_cache=True)
+            hidden, past = out.last_hidden_state, out.past_key_values
+
+            ctx_nll = torch.zeros(size, device=device)
+            ctx_count = torch.zeros(size, device=device)
+            if not mask_context:
+                logits = head(hidden[:, :-1]).float()
+                token_nll = F.cross_entropy(logits.transpose(1, 2), ctx[:, 1:], reduction='none')
+                valid = (ctx_mask[:, 1:] * ctx_mask[:, :-1]).bool()
+                ctx_nll = torch.where(valid, token_nll, 0.0).sum(-1)
+                ctx_count = valid.sum(-1).float()
+            # The last context position predicts each option's first token
+            last_logits = head(hidden[:, -1:]).float()
+
+            # Option pass: A and B of every question continue its cached context
+            rows = torch.arange(size, device=device).repeat_interleave(2)
+            width_o = max(1, max(len(opt_ids[k][i]) for i in items for k in (0, 1)))
+            opt = torch.full((2 * size, width_o), pad, dtype=torch.long)
+            opt_mask = torch.zeros((2 * size, width_o), dtype=torch.long)
+            for r, i in enumerate(items):
+                for k in (0, 1):
+                    ids = opt_ids[k][i]
+                    if ids:
+                        opt[2 * r + k, :len(ids)] = torch.tensor(ids)
+                        opt_mask[2 * r + k, :len(ids)] = 1
+            opt, opt_mask = opt.to(device), opt_mask.to(device)
+            out = base(input_ids=opt,
+                       attention_mask=torch.cat([ctx_mask[rows], opt_mask], dim=1),
+                       position_ids=ctx_mask.sum(-1)[rows, None] + torch.arange(width_o, device=device),
+                       past_key_values=_select_cache(past, rows), use_cache=True)
+            logits = torch.cat([last_logits[rows], head(out.last_hidden_state[:, :-1]).float()], dim=1)
+            token_nll = F.cross_entropy(logits.transpose(1, 2), opt, reduction='none')
+            opt_nll = torch.where(opt_mask.bool(), token_nll, 0.0).sum(-1).view(size, 2)
+            opt_count = opt_mask.sum(-1).float().view(size, 2)
+
+            nll[items] = (opt_nll + ctx_nll[:, None]).cpu().numpy()
+            counts[items] = (opt_count + ctx_count[:, None]).cpu().numpy()
+            if stats is not None:
+                stats['forward_calls'] += 2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ppl = np.exp(nll / counts)
+    return ppl[:, 0], ppl[:, 1]
+
+
+def add_perplexity_features(df, model, tokenizer, mask_context=True, batch_size=16):
+    """Set ppl_A / ppl_B / delta_perplexity on `df` in place."""
+    df['ppl_A'], df['ppl_B'] = perplexities(df, model, tokenizer, mask_context, batch_size)
+    df['delta_perplexity'] = df['ppl_B'] - df['ppl_A']
+    return df
+
+
+def main(csv_path, output=None, model=SBERT_MODEL, store=None, device=None, batch_size=128,
+         lm=None, mask_context=True, lm_batch_size=16):
+    """Add semantic-similarity (and, with `lm`, perplexity) features to a question CSV."""
+    df = pd.read_csv(csv_path)
+    store = EmbeddingStore(store or store_path(model), model)
+    before = len(store)
+    add_semantic_features(df, store, load_encoder(model, device, batch_size))
+    print(f"✅ Added semantic similarity for {len(df)} questions "
+          f"({len(store) - before} new texts encoded, {len(store)} in {store.path})")
+    if lm:
+        lm_model, tokenizer = load_lm(lm, device)
+        stats = {}
+        df['ppl_A'], df['ppl_B'] = perplexities(df, lm_model, tokenizer, mask_context, lm_batch_size, stats)
+        df['delta_perplexity'] = df['ppl_B'] - df['ppl_A']
+        print(f"✅ Added perplexity with {lm}: {stats['forward_tokens']} forward tokens "
+              f"({stats['forward_tokens'] / stats['baseline_tokens']:.0%} of scoring each option "
+              f"separately) in {stats['forward_calls']} forward calls")
+    df.to_csv(output or csv_path, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add semantic-similarity and perplexity features to an NSP question CSV.")
+    parser.add_argument("csv")
+    parser.add_argument("--output", help="Where to write the CSV (default: in place)")
+    parser.add_argument("--model", default=SBERT_MODEL)
+    parser.add_argument("--store", help=f"Embedding store directory (default: {EMBEDDINGS_DIR}/<model>)")
+    parser.add_argument("--device", help="cpu / cuda (default: whatever torch picks)")
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--lm", help="Causal LM for ppl_A/ppl_B (e.g. Jacaranda/UlizaLlama3); skipped if unset")
+    parser.add_argument("--no-mask-context", action="store_true",
+                        help="Score the context tokens too, not just the option's")
+    parser.add_argument("--lm-batch-size", type=int, default=16)
+    args = parser.parse_args()
+    if not os.path.exists(args.csv):
+        print(f"❌ Error: File '{args.csv}' not found.")
+        sys.exit(1)
+    main(args.csv, args.output, args.model, args.store, args.device, args.batch_size,
+         args.lm, not args.no_mask_context, args.lm_batch_size)
@@ -0,0 +1,180 @@
+import numpy as np
+
+from nsp_compact import ITEM_DTYPE
+
+# Vectorized view of the NSP question space. A question is identified by
+# (story_id, start, context_len); its true sentence is start + context_len and
+# its distractor lies MIN_DIST..MAX_DIST sentences further on. Everything here
+# works from per-story sentence counts alone, so no text is built until the
+# drawn items are materialized.
+
+STRATA = ('context_length', 'distractor_distance')
+
+
+def _allocate(n, capacity):
+    """
+    Split `n` draws as evenly as possible across strata, never giving a
+    stratum more than its capacity; leftovers go to strata with room.
+    """
+    capacity = np.asarray(capacity, dtype=np.int64)
+    alloc = np.zeros_like(capacity)
+    remaining = min(int(n), int(capacity.sum()))
+    while remaining > 0:
+        room = np.flatnonzero(alloc < capacity)
+        share = max(remaining // len(room), 1)
+        for k in room:
+            take = min(share, capacity[k] - alloc[k], remaining)
+            alloc[k] += take
+            remaining -= take
+            if remaining == 0:
+                break
+    return alloc
+
+
+def _locate(counts, flat):
+    """
+    Map flat indices over a (stories × context lengths) count matrix to
+    (story_id, column, start) arrays.
+    """
+    cells = counts.ravel()
+    ends = np.cumsum(cells)
+    cell = np.searchsorted(ends, flat, side='right')
+    start = flat - (ends[cell] - cells[cell])
+    story, col = np.divmod(cell, counts.shape[1])
+    return story, col, start
+
+
+class ItemSpace:
+    """
+    The complete set of NSP questions a corpus can yield, computed from
+    per-story sentence counts with the same rules as generate-nsp.py.
+    """
+
+    def __init__(self, story_lengths, context_range=(3, 10), distractor_distances=(2, 10)):
+        self.story_lengths = np.asarray(story_lengths, dtype=np.int64)
+        self.context_lengths = np.arange(context_range[0], context_range[1] + 1)
+        self.min_dist, self.max_dist = distractor_distances
+        # Windows per (story, context length); too-short stories get none
+        self.counts = self._window_counts(self.min_dist)
+        too_short = self.story_lengths < context_range[0] + self.min_dist + 1
+        self.counts[too_short] = 0
+
+    def _window_counts(self, dist):
+        # Windows whose sentence at `dist` past the true one exists
+        counts = self.story_lengths[:, None] - self.context_lengths[None, :] - dist
+        return np.maximum(counts, 0)
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def enumerate(self):
+        """
+        Return (story_id, start, context_len) arrays for every question,
+        in generation order, without drawing distractors.
+        """
+        cells = self.counts.ravel()
+        story, col = np.divmod(np.arange(len(cells)), self.counts.shape[1])
+        cell_start = np.cumsum(cells) - cells
+        story_id = np.repeat(story, cells)
+        context_len = np.repeat(self.context_lengths[col], cells)
+        start = np.arange(len(self)) - np.repeat(cell_start, cells)
+        return story_id, start, context_len
+
+    def draw(self, story_id, start, context_len, rng):
+        """
+        Draw distractors uniformly from each question's valid window and
+        A/B labels with two batched RNG calls. Returns ITEM_DTYPE records.
+        """
+        true_idx = start + context_len
+        lo = true_idx + self.min_dist
+        hi = np.minimum(true_idx + self.max_dist, self.story_lengths[story_id] - 1)
+        distractor_idx = rng.integers(lo, hi + 1)
+        label = rng.integers(0, 2, size=len(true_idx))
+        return self._records(story_id, start, context_len, distractor_idx, label)
+
+    @staticmethod
+    def _records(story_id, start, context_len, distractor_idx, label):
+        records = np.empty(len(story_id), dtype=ITEM_DTYPE)
+        records['story_id'] = story_id
+        records['start'] = start
+        records['context_len'] = context_len
+        records['true_idx'] = start + context_len
+        records['distractor_idx'] = distractor_idx
+        records['label'] = label
+        return records
+
+    def sample(self, n, seed=42, stratify=None):
+        """
+        Draw `n` questions over distinct (story_id, start, context_len)
+        windows as ITEM_DTYPE records, sorted in generation order.
+        `stratify` is None (uniform over the item space), 'context_length'
+        or 'distractor_distance' (equal share per stratum, capped by what
+        each stratum can supply; the distance strata share windows, so
+        they may yield a few fewer than `n`).
+        """
+        rng = np.random.default_rng(seed)
+        if stratify is None:
+            flat = np.sort(rng.choice(len(self), size=min(n, len(self)), replace=False))
+            story, col, start = _locate(self.counts, flat)
+            records = self.draw(story, start, self.context_lengths[col], rng)
+        elif stratify == 'context_length':
+            records = self._sample_by_context(n, rng)
+        elif stratify == 'distractor_distance':
+            records = self._sample_by_distance(n, rng)
+        else:
+            raise ValueError(f"stratify must be one of {STRATA} or None, got {stratify!r}")
+        order = np.lexsort((records['start'], records['context_len'], records['story_id']))
+        return records[order]
+
+    def _sample_by_context(self, n, rng):
+        parts = []
+        totals = self.counts.sum(axis=0)
+        for col, m in enumerate(_allocate(n, totals)):
+            if m == 0:
+                continue
+            column = self.counts[:, [col]]
+            flat = rng.choice(int(totals[col]), size=int(m), replace=False)
+            story, _, start = _locate(column, flat)
+            context_len = np.full(len(flat), self.context_lengths[col])
+            parts.append(self.draw(story, start, context_len, rng))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=ITEM_DTYPE)
+
+    def _window_keys(self, story, col, start):
+        # One integer per (story, context length, start) window
+        span = int(self.story_lengths.max(initial=0)) + 1
+        return (story.astype(np.int64) * len(self.context_lengths) + col) * span + start
+
+    def _sample_by_distance(self, n, rng):
+        # A window can sit in several distance strata; each is drawn at most
+        # once, and a stratum whose pick was already taken draws again from
+        # the rest of its windows (so it can fall short of its share)
+        parts, taken = [], np.empty(0, dtype=np.int64)
+        distances = np.arange(self.min_dist, self.max_dist + 1)
+        # Windows with the distractor fixed at each distance
+        strata = [np.where(self.counts > 0, self._window_counts(d), 0) for d in distances]
+        totals = [int(c.sum()) for c in strata]
+        for dist, counts, total, m in zip(distances, strata, totals, _allocate(n, totals)):
+            if m == 0:
+                continue
+            flat = rng.choice(total, size=int(m), replace=False)
+            story, col, start = _locate(counts, flat)
+            keys = self._window_keys(story, col, start)
+            fresh = ~np.isin(keys, taken)
+            if not fresh.all():
+                # Redraw the clashes from this stratum's undrawn windows, in random order
+                undrawn = np.ones(total, dtype=bool)
+                undrawn[flat] = False
+                rest = rng.permutation(np.flatnonzero(undrawn))
+                r_story, r_col, r_start = _locate(counts, rest)
+                r_keys = self._window_keys(r_story, r_col, r_start)
+                keep = np.flatnonzero(~np.isin(r_keys, taken))[:int(m - fresh.sum())]
+                story = np.concatenate([story[fresh], r_story[keep]])
+                col = np.concatenate([col[fresh], r_col[keep]])
+                start = np.concatenate([start[fresh], r_start[keep]])
+                keys = np.concatenate([keys[fresh], r_keys[keep]])
+            taken = np.concatenate([taken, keys])
+            context_len = self.context_lengths[col]
+            label = rng.integers(0, 2, size=len(story))
+            parts.append(self._records(story, start, context_len,
+                                       start + context_len + dist, label))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=ITEM_DTYPE)
@@ -0,0 +1,80 @@
+import re
+from itertools import accumulate
+
+# Single-pass sentence segmentation. A story is split and cleaned once; every
+# NSP window then reuses the cleaned sentences, their offsets into the joined
+# story text, and their word counts.
+
+BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+# Tokens (lower-cased, final '.' removed) after which a '.' does not end a sentence
+ABBREVIATIONS = {
+    'EN': {'mr', 'mrs', 'ms', 'dr', 'prof', 'st', 'mt', 'jr', 'sr', 'vs', 'e.g', 'i.e'},
+    'SW': {'bw', 'bi', 'dkt', 'mh', 'mhe', 'prof', 'mt', 'k.m', 'kny'},
+    'HA': {'mal', 'alh', 'dr', 'sh', 'hon', 'prof', 'mt'},
+}
+
+
+class Segmented:
+    """
+    Cleaned sentences of one story, with `offsets[k]` the start of sentence
+    k in `text` (the sentences joined by single spaces) and `word_counts[k]`
+    its number of words.
+    """
+    __slots__ = ('sentences', 'offsets', 'word_counts', 'text')
+
+    def __init__(self, sentences):
+        self.sentences = sentences
+        self.text = ' '.join(sentences)
+        self.offsets = [0, *accumulate(len(s) + 1 for s in sentences)]
+        self.word_counts = [s.count(' ') + 1 for s in sentences]
+
+    @classmethod
+    def from_sentences(cls, sentences):
+        """Clean already-split sentences (the output of split_sentences)."""
+        return cls([' '.join(s.split()) for s in sentences])
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def span(self, i, j):
+        """Sentences i..j-1 joined by single spaces, as a slice of `text`."""
+        return self.text[self.offsets[i]:self.offsets[j] - 1]
+
+
+def _ends_with_abbreviation(part, next_part, abbreviations):
+    # Is the '.' closing this fragment part of an abbreviation or initial?
+    if not part.endswith('.'):
+        return False
+    token = part.rsplit(None, 1)[-1][:-1]
+    # Single-letter initials ("J. K. Rowling"): a capital standing alone as a
+    # word, followed by a capitalized word. A one-letter word that ends a
+    # sentence before a capital ("Plan B. The") still reads as an initial.
+    if len(token) == 1 and token.isupper():
+        return next_part[:1].isupper()
+    return token.lstrip('("\'').lower() in abbreviations
+
+
+def segment_story(text, lang=None):
+    """
+    Split and clean a story in one pass. Without `lang` this matches
+    clean_text(s) for s in split_sentences(text); with 'EN', 'SW' or
+    'HA' it also keeps common abbreviations and initials inside their
+    sentence. A single capital letter counts as an initial only when the
+    next sentence starts with a capital, so "... Plan B." splits at the
+    end of a story or before lower case, but not before "The".
+    """
+    parts = BOUNDARY.split(text)
+    if lang:
+        abbreviations = ABBREVIATIONS[lang]
+        merged = []
+        pending = ''
+        for part, next_part in zip(parts, [*parts[1:], '']):
+            pending = f"{pending} {part}" if pending else part
+            if not _ends_with_abbreviation(part, next_part, abbreviations):
+                merged.append(pending)
+                pending = ''
+        if pending:
+            merged.append(pending)
+        parts = merged
+    return Segmented([c for c in (' '.join(p.split()) for p in parts) if c])
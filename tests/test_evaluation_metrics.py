@@ -0,0 +1,77 @@
+"""
+Only <model>_answer and <model>_answer_COT columns are scored: a CoT
+results CSV also holds per-model probability, reasoning and time-to-answer
+columns, and none of them may show up as a model.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import importlib.util
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from llm_live import LiveScorer
+
+
+def load_script(filename):
+    """Import one of the repo's hyphenated scripts as a module."""
+    spec = importlib.util.spec_from_file_location(filename.replace('-', '_')[:-3],
+                                                  os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+metrics = load_script('evaluation-metrics.py')
+
+
+def cot_results_csv(tmp_path, n_rows=200):
+    rng = np.random.default_rng(0)
+    labels = rng.choice(['A', 'B'], n_rows)
+    df = pd.DataFrame({'context_length': rng.integers(1, 6, n_rows), 'label': labels})
+    for model in ('gpt', 'gemini', 'llama'):
+        df[f'{model}_answer'] = np.where(rng.random(n_rows) < 0.7, labels, 'A')
+        df[f'{model}_answer_COT'] = np.where(rng.random(n_rows) < 0.8, labels, 'B')
+        df[f'{model}_reasoning_offset_COT'] = np.arange(n_rows)
+        df[f'{model}_COT_answer_seconds'] = rng.random(n_rows) * 5
+        df[f'{model}_time_to_answer_COT'] = rng.random(n_rows) * 5  # the earlier timing column name
+    df['gpt_prob_A'] = rng.random(n_rows)
+    path = str(tmp_path / "NSP_QUESTIONS_WITH_ANSWERS_EN_1000_COT.csv")
+    df.to_csv(path, index=False)
+    return path
+
+
+def test_only_answer_columns_are_scored(tmp_path):
+    path = cot_results_csv(tmp_path)
+    results = metrics.score_files([path], n_boot=100)
+    summary = results['summary']
+    assert sorted(summary['model'].unique()) == ['gemini', 'gpt', 'llama']
+    assert sorted(summary['column']) == sorted(f'{m}_answer{s}' for m in ('gpt', 'gemini', 'llama')
+                                               for s in ('', '_COT'))
+    assert (summary['invalid'] == 0).all()
+    assert len(results['paired']) == 3
+
+
+def test_live_scorer_skips_timing_columns(tmp_path):
+    path = cot_results_csv(tmp_path)
+    scorer = LiveScorer(path)
+    assert sorted(scorer.columns) == sorted(metrics.load_answers(path)[1])
+    scorer.feed([{"row": 0, "model": "gpt",
+                  "values": {"gpt_answer_COT": "A", "gpt_time_to_answer_COT": 1.5}}])
+    assert 'gpt_time_to_answer_COT' not in scorer.columns
+
+
+def test_sample_is_written_in_random_order(tmp_path):
+    path = cot_results_csv(tmp_path)
+    first, second = str(tmp_path / "first.csv"), str(tmp_path / "second.csv")
+    metrics.sample_csv(path, first, n=50)
+    metrics.sample_csv(path, second, n=50)
+    sample = pd.read_csv(first)
+    assert sample.equals(pd.read_csv(second))
+    # Rows are told apart by their reasoning offset, which is the file position
+    positions = sample['gpt_reasoning_offset_COT'].to_numpy()
+    assert len(set(positions)) == 50 and not (np.diff(positions) > 0).all()
@@ -0,0 +1,74 @@
+"""
+A provider call that fails for good fails only its (row, provider) cell:
+the other rows and providers still complete. Authentication errors and
+callback bugs stop the run.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_engine import Provider, evaluate
+from llm_metrics import RunMetrics
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+
+
+def providers(fail_on, status_code, metrics=None):
+    async def ask_ok(prompt):
+        return "A"
+
+    async def ask_flaky(prompt):
+        if prompt == fail_on:
+            raise StatusError(status_code)
+        return "B"
+
+    return [Provider("ok", ask_ok, metrics=metrics, backoff_base=0.01),
+            Provider("flaky", ask_flaky, metrics=metrics, backoff_base=0.01)]
+
+
+def rows(n=10):
+    return ((idx, {"ok": f"q{idx}", "flaky": f"q{idx}"}) for idx in range(n))
+
+
+def test_failed_cell_does_not_stop_the_run(tmp_path):
+    metrics = RunMetrics(str(tmp_path / "metrics.jsonl"))
+    finished, failed = [], []
+    evaluate(rows(), providers("q3", 400, metrics), lambda idx, answers: finished.append((idx, answers)),
+             on_error=lambda idx, name, exc: failed.append((idx, name, exc.status_code)))
+    metrics.close()
+    assert [idx for idx, _ in finished] == list(range(10))
+    assert finished[3][1] == {"ok": "A"}
+    assert all(answers == {"ok": "A", "flaky": "B"} for idx, answers in finished if idx != 3)
+    assert failed == [(3, "flaky", 400)]
+    assert metrics._stats("flaky")["errors"] == 1
+
+
+def test_cell_out_of_retries_is_recorded():
+    failed = []
+    flaky = providers("q5", 503)
+    flaky[1].max_retries = 1
+    evaluate(rows(), flaky, lambda idx, answers: None,
+             on_error=lambda idx, name, exc: failed.append((idx, name)))
+    assert failed == [(5, "flaky")]
+
+
+def test_authentication_error_stops_the_run():
+    with pytest.raises(StatusError):
+        evaluate(rows(), providers("q3", 401), lambda idx, answers: None)
+
+
+def test_callback_error_stops_the_run():
+    def on_row(idx, answers):
+        if idx == 2:
+            raise KeyError(idx)
+
+    with pytest.raises(KeyError):
+        evaluate(rows(), providers(None, 400), on_row)
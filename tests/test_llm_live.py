@@ -0,0 +1,61 @@
+"""
+LiveScorer on a fresh question bank: the runner only adds its answer
+columns to the CSV when it compacts the journal, so the scorer has to pick
+them up from the journal records.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import json
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_live import LiveScorer, stop_path, watch
+
+
+def fresh_bank(tmp_path, n_rows=1000, n_answered=300):
+    """A bank with no answer columns, and a journal holding `n_answered` gpt answers."""
+    rng = np.random.default_rng(0)
+    labels = rng.choice(['A', 'B'], n_rows)
+    csv_path = str(tmp_path / "bank.csv")
+    pd.DataFrame({
+        'story_id': np.arange(n_rows) // 10,
+        'context_length': rng.integers(1, 6, n_rows),
+        'label': labels,
+    }).to_csv(csv_path, index=False)
+    answers = np.where(rng.random(n_answered) < 0.8, labels[:n_answered],
+                       np.where(labels[:n_answered] == 'A', 'B', 'A'))
+    with open(f"{csv_path}.journal.jsonl", 'w', encoding='utf-8') as f:
+        for row, answer in enumerate(answers):
+            f.write(json.dumps({"row": row, "model": "gpt", "values": {"gpt_answer": answer}}) + "\n")
+    return csv_path, int((answers == labels[:n_answered]).sum())
+
+
+def test_no_known_columns_is_not_complete(tmp_path):
+    csv_path, _ = fresh_bank(tmp_path)
+    scorer = LiveScorer(csv_path)
+    assert scorer.columns == []
+    assert not scorer.complete()
+
+
+def test_columns_come_from_the_journal(tmp_path):
+    csv_path, correct = fresh_bank(tmp_path)
+    scorer = LiveScorer(csv_path, features=['context_length'])
+    with open(f"{csv_path}.journal.jsonl", encoding='utf-8') as f:
+        assert scorer.feed(json.loads(line) for line in f) == 300
+    assert scorer.columns == ['gpt_answer']
+    n, n_correct, invalid, *_ = scorer.stats('gpt_answer')
+    assert (n, n_correct, invalid) == (300, correct, 0)
+    assert scorer.feature_table('gpt_answer', 'context_length')['n'].sum() == 300
+    assert not scorer.complete()
+
+
+def test_watch_waits_for_journaled_answers(tmp_path):
+    csv_path, _ = fresh_bank(tmp_path)
+    scorer = watch(csv_path, target_width=0.2, interval=0.01, stop=True)
+    assert scorer.columns == ['gpt_answer']
+    assert scorer.stats('gpt_answer')[0] == 300
+    assert os.path.exists(stop_path(csv_path))
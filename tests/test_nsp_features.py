@@ -0,0 +1,90 @@
+"""
+perplexities() (one cached context pass per batch, both options continued
+from its keys/values) must give the same numbers as scoring every
+(context, option) pair on its own, as the notebook's compute_ppl did.
+Uses tiny randomly initialised causal LMs and a word-level tokenizer, so
+nothing is downloaded.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from nsp_features import perplexities
+
+# Contexts and options of different lengths, so both the left-padded context
+# pass and the right-padded option pass see padding, over several batches
+QUESTIONS = pd.DataFrame({
+    'context': [
+        "the boy walked to the market",
+        "she opened the door and looked outside at the rain",
+        "it was late",
+        "the old man sat by the fire and told a long story about the war",
+        "they ate",
+    ],
+    'option_A': ["he bought bread", "the street was empty", "everyone slept",
+                 "the children listened", "then they slept well"],
+    'option_B': ["the rain stopped", "he", "the boy walked home slowly after dark",
+                 "she bought bread", "the war was long"],
+})
+
+
+def word_tokenizer():
+    words = sorted({w for col in QUESTIONS for text in QUESTIONS[col] for w in text.split()})
+    vocab = {"[UNK]": 0, "[PAD]": 1, **{w: i + 2 for i, w in enumerate(words)}}
+    backend = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocab, unk_token="[UNK]"))
+    backend.pre_tokenizer = tokenizers.pre_tokenizers.WhitespaceSplit()
+    return transformers.PreTrainedTokenizerFast(tokenizer_object=backend, unk_token="[UNK]",
+                                                pad_token="[PAD]")
+
+
+def tiny_lm(kind, vocab_size):
+    torch.manual_seed(0)
+    if kind == "gpt2":
+        config = transformers.GPT2Config(vocab_size=vocab_size, n_positions=64, n_embd=32,
+                                         n_layer=2, n_head=2)
+        model = transformers.GPT2LMHeadModel(config)
+    else:
+        config = transformers.LlamaConfig(vocab_size=vocab_size, hidden_size=32, intermediate_size=64,
+                                          num_hidden_layers=2, num_attention_heads=4,
+                                          num_key_value_heads=2, max_position_embeddings=64)
+        model = transformers.LlamaForCausalLM(config)
+    return model.eval()
+
+
+def naive_ppl(model, tokenizer, context, option, mask_context):
+    """The notebook's compute_ppl: one full forward pass per (context, option)."""
+    enc = tokenizer(context + " " + option, return_tensors="pt").input_ids
+    labels = enc.clone()
+    if mask_context:
+        labels[:, :tokenizer(context, return_tensors="pt").input_ids.size(-1)] = -100
+    with torch.no_grad():
+        return torch.exp(model(enc, labels=labels).loss).item()
+
+
+@pytest.mark.parametrize("kind", ["gpt2", "llama"])
+@pytest.mark.parametrize("mask_context", [True, False])
+def test_cached_perplexities_match_per_pair(kind, mask_context):
+    tokenizer = word_tokenizer()
+    model = tiny_lm(kind, len(tokenizer))
+    stats = {}
+    ppl_a, ppl_b = perplexities(QUESTIONS, model, tokenizer, mask_context=mask_context,
+                                batch_size=2, stats=stats)
+
+    expected_a = [naive_ppl(model, tokenizer, c, o, mask_context)
+                  for c, o in zip(QUESTIONS['context'], QUESTIONS['option_A'])]
+    expected_b = [naive_ppl(model, tokenizer, c, o, mask_context)
+                  for c, o in zip(QUESTIONS['context'], QUESTIONS['option_B'])]
+    np.testing.assert_allclose(ppl_a, expected_a, rtol=1e-4)
+    np.testing.assert_allclose(ppl_b, expected_b, rtol=1e-4)
+    # Every context runs once instead of once per option
+    assert stats['forward_tokens'] < stats['baseline_tokens']